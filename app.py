@@ -1,19 +1,38 @@
 import os
-import nonebot
-import uvicorn
+import time
+
+_started = time.perf_counter()
+
+import nonebot  # noqa: E402
 
 if __name__ == "__main__":
+    timings = {"import": time.perf_counter() - _started}
+
     # 加载 .env 文件
     from dotenv import load_dotenv
     load_dotenv()
-    
+
     # 使用 nonebot.run() 而不是手动配置
+    phase = time.perf_counter()
     nonebot.init()
+    timings["init"] = time.perf_counter() - phase
     # 显式加载 OneBot v11 适配器
+    phase = time.perf_counter()
     from nonebot.adapters.onebot.v11 import Adapter
     driver = nonebot.get_driver()
     driver.register_adapter(Adapter)
+    timings["adapter"] = time.perf_counter() - phase
+    phase = time.perf_counter()
     nonebot.load_plugins("bot")
+    timings["plugins"] = time.perf_counter() - phase
+
+    # 在所有插件的启动钩子（含预热）之后执行，记录启动耗时明细
+    @driver.on_startup
+    async def _log_startup_timings() -> None:
+        total = time.perf_counter() - _started
+        breakdown = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items())
+        nonebot.logger.info(f"Ready to serve in {total * 1000:.0f}ms ({breakdown}, startup hooks included)")
+
     # 支持通过环境变量覆盖监听地址和端口，默认监听 0.0.0.0:8080
     host = os.getenv("NB_HOST", "0.0.0.0")
     port = int(os.getenv("NB_PORT", "8080"))
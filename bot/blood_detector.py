@@ -0,0 +1,105 @@
+"""
+前三血快速检测模块
+按提交ID水位线监视新的 Accepted 提交，用内存中的每题解题队伍计数直接判定一血、二血、三血，
+不必等待 GZCTF 写入 GameNotices 后再轮询
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .coordination import broadcast_state
+from .database import get_accepted_submissions_since, get_first_solvers, get_latest_submission_id, on_database_reset
+
+logger = logging.getLogger(__name__)
+
+# 每次轮询最多读取的提交数
+FETCH_BATCH_SIZE = 500
+# 保存在共享状态中的水位线名称
+WATERMARK_NAME = "submission"
+
+
+@dataclass
+class BloodEvent:
+    place: int  # 1/2/3
+    team_name: str
+    challenge: str
+    solved_at: datetime
+    submission_id: int
+
+
+class BloodDetector:
+    """单场比赛的前三血检测器
+
+    水位线保存在共享状态中，主节点切换后新的主节点会按水位线重新加载每题的解题队伍。
+    """
+
+    def __init__(self, game_id: int):
+        self.game_id = game_id
+        # 题目ID -> 按解题顺序排列的前三支队伍ID
+        self._solvers: Dict[int, List[int]] = {}
+        self._seeded_at: Optional[int] = None
+
+    @property
+    def watermark(self) -> Optional[int]:
+        """上一次轮询后的提交ID水位线（尚未运行时为 None）"""
+        return self._seeded_at
+
+    async def reset(self) -> None:
+        """以当前最新的提交为水位线重新开始（开启播报时调用）"""
+        watermark = await get_latest_submission_id(self.game_id)
+        await broadcast_state.set_watermark(self.game_id, watermark, WATERMARK_NAME)
+        await self._seed(watermark)
+
+    async def _seed(self, watermark: int) -> None:
+        self._solvers = {}
+        for row in await get_first_solvers(self.game_id, watermark):
+            self._solvers.setdefault(row["ChallengeId"], []).append(row["TeamId"])
+        self._seeded_at = watermark
+
+    async def poll(self) -> List[BloodEvent]:
+        """读取水位线之后的新提交，返回新产生的前三血事件"""
+        watermark = await broadcast_state.get_watermark(self.game_id, WATERMARK_NAME)
+        if watermark is None:
+            await self.reset()
+            return []
+        if self._seeded_at != watermark:
+            # 首次运行或其他副本推进过水位线，按水位线重新加载
+            await self._seed(watermark)
+
+        events: List[BloodEvent] = []
+        rows = await get_accepted_submissions_since(self.game_id, watermark, FETCH_BATCH_SIZE, primary=True)
+        for row in rows:
+            watermark = max(watermark, row["Id"])
+            solvers = self._solvers.setdefault(row["ChallengeId"], [])
+            team_id = row["TeamId"]
+            if len(solvers) >= 3 or team_id in solvers:
+                continue
+            solvers.append(team_id)
+            events.append(
+                BloodEvent(
+                    place=len(solvers),
+                    team_name=row["teamname"],
+                    challenge=row["challenge"],
+                    solved_at=row["SubmitTimeUtc"],
+                    submission_id=row["Id"],
+                )
+            )
+        if rows:
+            await broadcast_state.set_watermark(self.game_id, watermark, WATERMARK_NAME)
+            self._seeded_at = watermark
+        return events
+
+
+_detectors: Dict[int, BloodDetector] = {}
+on_database_reset(_detectors.clear)
+
+
+def get_blood_detector(game_id: int) -> BloodDetector:
+    """获取（必要时创建）指定比赛的前三血检测器"""
+    detector = _detectors.get(game_id)
+    if detector is None:
+        detector = _detectors[game_id] = BloodDetector(game_id)
+    return detector
\ No newline at end of file
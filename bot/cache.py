@@ -0,0 +1,159 @@
+"""
+缓存模块
+为赛事标题、题目列表、排行榜等查询结果提供带过期时间的内存缓存，
+同一键的并发刷新只会触发一次数据库查询
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from .config import BotConfig, get_config, on_config_change
+from .database import (
+    get_game_challenges,
+    get_game_rankings,
+    get_game_title,
+    get_game_window,
+    is_database_available,
+    on_database_reset,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheEntry(Generic[T]):
+    value: T
+    updated_at: float  # time.monotonic()
+    version: int
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.updated_at
+
+
+class TTLCache(Generic[T]):
+    """带过期时间的异步缓存
+
+    Args:
+        name: 缓存名称，用于日志
+        loader: 按键加载数据的协程函数
+        ttl: 过期时间（秒）
+    """
+
+    def __init__(self, name: str, loader: Callable[..., Awaitable[T]], ttl: float):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self._entries: Dict[Tuple[Hashable, ...], CacheEntry[T]] = {}
+        self._inflight: Dict[Tuple[Hashable, ...], asyncio.Task] = {}
+
+    def peek(self, *key: Hashable) -> Optional[CacheEntry[T]]:
+        """返回当前缓存项（可能已过期），不触发刷新"""
+        return self._entries.get(key)
+
+    async def get(self, *key: Hashable) -> T:
+        """获取缓存值，过期或不存在时刷新"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.age < self.ttl:
+            return entry.value
+        return (await self.refresh(*key)).value
+
+    async def get_or_stale(self, *key: Hashable) -> Tuple[T, Optional[float]]:
+        """获取缓存值，过期时优先立即返回旧值（stale-while-revalidate）
+
+        数据库熔断中或已有刷新在进行时直接返回旧值并在后台刷新；否则等待刷新，刷新失败时仍返回旧值。
+        没有旧值时与 get 相同。
+
+        Returns:
+            元组(值, 旧值的年龄秒数)；值是新鲜的时年龄为 None
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.age < self.ttl:
+            return entry.value, None
+        if entry is not None and (self.is_refreshing(*key) or not is_database_available()):
+            self._start_refresh(key)
+            return entry.value, entry.age
+        try:
+            return (await self.refresh(*key)).value, None
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.warning("cache %s refresh failed, serving stale value (%.0fs old): %s", self.name, entry.age, e)
+            return entry.value, entry.age
+
+    def _start_refresh(self, key: Tuple[Hashable, ...]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._finish_refresh(k, t))
+        return task
+
+    def _finish_refresh(self, key: Tuple[Hashable, ...], task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # 后台刷新无人等待时也取出异常，避免 "exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("cache %s refresh failed: %s", self.name, task.exception())
+
+    async def refresh(self, *key: Hashable) -> CacheEntry[T]:
+        """强制刷新缓存，同一键已有刷新在进行时等待其结果"""
+        return await asyncio.shield(self._start_refresh(key))
+
+    def is_refreshing(self, *key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def _load(self, key: Tuple[Hashable, ...]) -> CacheEntry[T]:
+        value = await self.loader(*key)
+        previous = self._entries.get(key)
+        entry = CacheEntry(value, time.monotonic(), previous.version + 1 if previous else 1)
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self, *key: Hashable) -> None:
+        """使缓存失效，不带参数时清空全部"""
+        if key:
+            self._entries.pop(key, None)
+        else:
+            self._entries.clear()
+
+
+async def _load_rankings(game_id: int):
+    # 缓存为普通字典列表，便于后续序列化
+    return [dict(row) for row in await get_game_rankings(game_id)]
+
+
+async def _load_challenges(game_id: int):
+    return [dict(row) for row in await get_game_challenges(game_id)]
+
+
+_config = get_config()
+game_title_cache: TTLCache[str] = TTLCache("game_title", get_game_title, _config.game_title_cache_seconds)
+game_window_cache: TTLCache[Any] = TTLCache("game_window", get_game_window, _config.game_title_cache_seconds)
+challenges_cache: TTLCache[Any] = TTLCache("challenges", _load_challenges, _config.challenges_cache_seconds)
+scoreboard_cache: TTLCache[Any] = TTLCache("scoreboard", _load_rankings, _config.scoreboard_cache_seconds)
+
+
+@on_config_change("game_title_cache_seconds", "challenges_cache_seconds", "scoreboard_cache_seconds")
+async def _apply_cache_ttls(old: BotConfig, new: BotConfig) -> None:
+    """新的过期时间对已有缓存项立即生效，不必清空"""
+    game_title_cache.ttl = game_window_cache.ttl = new.game_title_cache_seconds
+    challenges_cache.ttl = new.challenges_cache_seconds
+    scoreboard_cache.ttl = new.scoreboard_cache_seconds
+
+
+@on_database_reset
+def _invalidate_caches() -> None:
+    """换库后旧数据全部作废；切换比赛不需要处理，缓存本身按比赛ID区分"""
+    for cache in (game_title_cache, game_window_cache, challenges_cache, scoreboard_cache):
+        cache.invalidate()
+
+
+async def get_cached_game_title(game_id: int) -> str:
+    """获取赛事标题（带缓存）；标题几乎不变，数据库不可用时直接使用旧值"""
+    return (await game_title_cache.get_or_stale(game_id))[0]
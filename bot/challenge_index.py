@@ -0,0 +1,160 @@
+"""
+题目标题索引模块
+在内存中维护比赛题目的 规范化标题 -> 题目信息 索引，通知中的题目名解析为本地字典查找，不需要访问数据库。
+标题按 NFKC、忽略大小写、合并空白规范化；精确匹配失败时按字符二元组相似度做模糊匹配。
+刷新时拉取题目列表并与现有索引逐题比对，只更新新增、改名、删除的题目
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+from .config import CATEGORY_MAPPING, get_config
+from .database import get_challenge_titles, on_database_reset
+from .utils import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# 模糊匹配的最低相似度（Dice 系数，0~1）
+FUZZY_MIN_SIMILARITY = 0.6
+
+
+@dataclass(frozen=True)
+class ChallengeInfo:
+    id: int
+    title: str
+    category: int
+    enabled: bool
+
+    @property
+    def category_name(self) -> str:
+        return CATEGORY_MAPPING.get(self.category, "未知")
+
+
+def _grams(key: str) -> FrozenSet[str]:
+    """字符二元组；单个字符的标题以自身作为唯一元素"""
+    if len(key) < 2:
+        return frozenset((key,)) if key else frozenset()
+    return frozenset(key[i:i + 2] for i in range(len(key) - 1))
+
+
+class ChallengeIndex:
+    """单个比赛的题目标题索引"""
+
+    def __init__(self, game_id: int):
+        self.game_id = game_id
+        # 每次索引内容变化时递增
+        self.version = 0
+        self.loaded_at: Optional[float] = None  # time.monotonic()
+        self._by_id: Dict[int, ChallengeInfo] = {}
+        # 规范化标题 -> 题目ID（同名题目可能有多个，例如删除后重建）
+        self._by_key: Dict[str, Set[int]] = {}
+        # 二元组 -> 题目ID，用于模糊匹配时只比较有共同二元组的题目
+        self._by_gram: Dict[str, Set[int]] = {}
+        self._lock = asyncio.Lock()
+
+    def _index(self, info: ChallengeInfo) -> None:
+        self._by_id[info.id] = info
+        key = normalize_name(info.title)
+        self._by_key.setdefault(key, set()).add(info.id)
+        for gram in _grams(key):
+            self._by_gram.setdefault(gram, set()).add(info.id)
+
+    def _unindex(self, info: ChallengeInfo) -> None:
+        self._by_id.pop(info.id, None)
+        key = normalize_name(info.title)
+        for bucket, name in [(self._by_key, key), *((self._by_gram, gram) for gram in _grams(key))]:
+            ids = bucket.get(name)
+            if ids is not None:
+                ids.discard(info.id)
+                if not ids:
+                    del bucket[name]
+
+    def apply(self, rows: Iterable) -> int:
+        """以一次完整的题目列表更新索引，返回新增、修改与删除的题目数"""
+        seen: Set[int] = set()
+        changed = 0
+        for row in rows:
+            info = ChallengeInfo(row["Id"], row["Title"] or "", int(row["Category"]), bool(row["IsEnabled"]))
+            seen.add(info.id)
+            previous = self._by_id.get(info.id)
+            if previous == info:
+                continue
+            if previous is not None:
+                self._unindex(previous)
+            self._index(info)
+            changed += 1
+        for challenge_id in [c for c in self._by_id if c not in seen]:
+            self._unindex(self._by_id[challenge_id])
+            changed += 1
+        if changed:
+            self.version += 1
+        self.loaded_at = time.monotonic()
+        return changed
+
+    async def refresh(self) -> int:
+        """从数据库拉取题目列表并增量更新索引，返回变化的题目数"""
+        async with self._lock:
+            changed = self.apply(await get_challenge_titles(self.game_id))
+        if changed:
+            logger.debug("challenge index of game %s: %d challenges changed", self.game_id, changed)
+        return changed
+
+    async def ensure_fresh(self, force: bool = False) -> None:
+        """索引超过题目缓存时间（或 force 为 True）时刷新；刷新失败时保留现有索引"""
+        age = None if self.loaded_at is None else time.monotonic() - self.loaded_at
+        if not force and age is not None and age < get_config().challenges_cache_seconds:
+            return
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("refresh challenge index of game %s failed, using existing index: %s", self.game_id, e)
+
+    def _pick(self, ids: Iterable[int]) -> ChallengeInfo:
+        """同名题目中优先已启用的，其次ID最大的（最新创建）"""
+        return max((self._by_id[c] for c in ids), key=lambda info: (info.enabled, info.id))
+
+    def lookup(self, name: str) -> Optional[ChallengeInfo]:
+        """按规范化标题精确查找，找不到时模糊匹配"""
+        key = normalize_name(name)
+        if not key:
+            return None
+        ids = self._by_key.get(key)
+        if ids:
+            return self._pick(ids)
+        return self.fuzzy(key)
+
+    def fuzzy(self, key: str) -> Optional[ChallengeInfo]:
+        """按二元组 Dice 系数模糊匹配规范化标题；最佳结果低于 FUZZY_MIN_SIMILARITY 或存在并列时返回 None"""
+        grams = _grams(key)
+        shared: Counter = Counter()
+        for gram in grams:
+            for challenge_id in self._by_gram.get(gram, ()):
+                shared[challenge_id] += 1
+        scores: Dict[str, float] = {}
+        for challenge_id, count in shared.items():
+            title_key = normalize_name(self._by_id[challenge_id].title)
+            score = 2 * count / (len(grams) + len(_grams(title_key)))
+            scores[title_key] = max(scores.get(title_key, 0.0), score)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < FUZZY_MIN_SIMILARITY:
+            return None
+        if len(ranked) > 1 and ranked[1][1] == ranked[0][1]:
+            return None
+        return self._pick(self._by_key[ranked[0][0]])
+
+
+_indexes: Dict[int, ChallengeIndex] = {}
+on_database_reset(_indexes.clear)
+
+
+def get_challenge_index(game_id: int) -> ChallengeIndex:
+    """获取（必要时创建）指定比赛的题目标题索引"""
+    index = _indexes.get(game_id)
+    if index is None:
+        index = _indexes[game_id] = ChallengeIndex(game_id)
+    return index
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+图表渲染模块
+使用 matplotlib（面向对象接口，不经过 pyplot）在线程池中绘制图表，避免阻塞事件循环
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .score_index import ScoreIndex
+
+logger = logging.getLogger(__name__)
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+# 常见中文字体，按顺序回退，保证队名可以正常显示
+CJK_FONTS = ["Noto Sans CJK SC", "Source Han Sans SC", "WenQuanYi Micro Hei", "SimHei", "Microsoft YaHei", "DejaVu Sans"]
+
+# (比赛ID, 前N名) -> (索引版本, 分桶序号, PNG 数据)
+_trend_cache: Dict[Tuple[int, int], Tuple[int, int, bytes]] = {}
+
+
+def _render_trend_png(title: str, points: List[datetime], series: List[Tuple[str, List[int]]]) -> bytes:
+    """绘制分数曲线并返回 PNG 数据（在工作线程中执行）
+
+    不使用 pyplot：pyplot 的图形管理器与 rcParams 是进程级全局状态，多个线程同时绘制会互相干扰。
+    这里直接创建 Figure 与 Agg 画布，中文字体通过 FontProperties 传给各个文本元素。
+    """
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.ticker import FuncFormatter
+
+    font = FontProperties(family=CJK_FONTS)
+    fig = Figure(figsize=(10, 6), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    local_points = [p.astimezone(BEIJING_TZ).replace(tzinfo=None) for p in points]
+    for name, values in series:
+        ax.step(local_points, values, where="post", label=name, linewidth=1.6)
+    ax.set_title(title, fontproperties=font)
+    ax.set_ylabel("分数", fontproperties=font)
+    ax.grid(True, alpha=0.3)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d %H:%M"))
+    # 使用 ASCII 负号，不依赖全局的 axes.unicode_minus 设置
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda value, _: f"{value:g}"))
+    fig.autofmt_xdate()
+    ax.legend(loc="upper left", prop=FontProperties(family=CJK_FONTS, size="small"), ncol=2)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    return buffer.getvalue()
+
+
+async def render_trend(index: ScoreIndex, game_title: str, top_n: int) -> Optional[bytes]:
+    """渲染前 N 名队伍的分数曲线，同一分桶内且分数无变化时直接返回缓存
+
+    Args:
+        index: 分数时间索引
+        game_title: 比赛标题
+        top_n: 队伍数量
+
+    Returns:
+        PNG 数据，暂无得分时返回 None
+    """
+    current_bucket = index.bucket_of(datetime.now(timezone.utc))
+    cache_key = (index.game_id, top_n)
+    cached = _trend_cache.get(cache_key)
+    if cached and cached[0] == index.version and cached[1] == current_bucket:
+        return cached[2]
+
+    team_ids = index.top_teams(top_n)
+    if not team_ids:
+        return None
+    points, values = index.series(team_ids)
+    series = [(index.team_names.get(t, str(t)), values[t]) for t in team_ids]
+    png = await asyncio.to_thread(_render_trend_png, f"{game_title} - 前 {len(team_ids)} 名分数曲线", points, series)
+    _trend_cache[cache_key] = (index.version, current_bucket, png)
+    return png
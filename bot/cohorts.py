@@ -0,0 +1,120 @@
+"""
+分年级排行榜模块
+在总排行榜上一次遍历，按成员学号前缀把队伍分到各年级，得到每个年级的名次列表；
+结果按分数索引的版本缓存，直到出现新的得分才重新划分，/rank-all 因此不需要为每个年级各执行一次排行榜查询
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import scoreboard_cache
+from .database import on_database_reset
+from .score_index import get_score_index
+
+logger = logging.getLogger(__name__)
+
+# 年级前缀的长度，与 /rank-XX 一致（两位数字，如 25 表示 2025 级）
+COHORT_PREFIX_LENGTH = 2
+
+
+@dataclass
+class CohortBoard:
+    """各年级的排行：年级前缀 -> 按名次排列的队伍（rank 为年级内名次）"""
+
+    cohorts: Dict[str, List[Dict[str, Any]]]
+    # 划分时分数索引的版本与所用总排行榜缓存项的版本
+    score_version: int
+    scoreboard_version: int
+    built_at: float  # time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.built_at
+
+
+def _cohorts_of(student_numbers: Optional[str]) -> List[str]:
+    """队伍成员学号的年级前缀（去重，保持顺序）；不是数字开头的学号忽略"""
+    prefixes: List[str] = []
+    for number in (student_numbers or "").split(","):
+        prefix = number.strip()[:COHORT_PREFIX_LENGTH]
+        if len(prefix) == COHORT_PREFIX_LENGTH and prefix.isdigit() and prefix not in prefixes:
+            prefixes.append(prefix)
+    return prefixes
+
+
+def partition_by_cohort(rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """按名次顺序遍历一次总排行榜，把队伍追加到成员所属的每个年级（与 /rank-XX 相同：任一成员命中即可）
+
+    总排行榜已按名次排序，因此追加顺序即年级内名次。
+    """
+    cohorts: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        for prefix in _cohorts_of(row.get("studentnumbers")):
+            members = cohorts.setdefault(prefix, [])
+            members.append({"rank": len(members) + 1, "teamname": row["teamname"], "totalscore": row["totalscore"]})
+    return dict(sorted(cohorts.items()))
+
+
+def filter_cohort(rows: List[Dict[str, Any]], prefix: str) -> List[Dict[str, Any]]:
+    """总排行榜中属于某个年级的队伍，名次为年级内名次（与 /rank-XX 的查询结果相同）"""
+    members: List[Dict[str, Any]] = []
+    for row in rows:
+        if prefix in _cohorts_of(row.get("studentnumbers")):
+            members.append({"rank": len(members) + 1, "teamname": row["teamname"], "totalscore": row["totalscore"]})
+    return members
+
+
+_boards: Dict[int, CohortBoard] = {}
+on_database_reset(_boards.clear)
+_locks: Dict[int, asyncio.Lock] = {}
+
+
+async def get_cohort_board(game_id: int) -> Tuple[CohortBoard, Optional[float]]:
+    """获取各年级排行
+
+    先增量刷新分数索引（只拉取新的 Accepted 提交）；没有新的得分时直接使用上次的划分结果，
+    有新的得分时重新读取一次总排行榜并重新划分。数据库不可用或查询失败时使用上次的划分结果。
+
+    Returns:
+        元组(各年级排行, 数据的年龄秒数)；数据是最新的时年龄为 None
+    """
+    lock = _locks.setdefault(game_id, asyncio.Lock())
+    async with lock:
+        index = get_score_index(game_id)
+        board = _boards.get(game_id)
+        try:
+            await index.refresh()
+        except Exception as e:
+            if board is None:
+                raise
+            logger.warning("score index refresh failed, serving previous cohort board: %s", e)
+            return board, board.age
+
+        # 划分前记下分数版本，划分期间产生的新得分留到下次处理
+        score_version = index.version
+        entry = scoreboard_cache.peek(game_id)
+        if board is not None and board.score_version == score_version and (
+            entry is None or entry.version == board.scoreboard_version
+        ):
+            return board, None
+
+        if board is None or board.score_version != score_version:
+            # 分数变化后缓存中的总排行榜可能还没过期，需要强制刷新
+            try:
+                entry = await scoreboard_cache.refresh(game_id)
+            except Exception as e:
+                if board is None:
+                    raise
+                logger.warning("scoreboard refresh failed, serving previous cohort board: %s", e)
+                return board, board.age
+        # 否则只是总排行榜被其他命令刷新过（例如队伍改名），直接用新的缓存项重新划分
+
+        board = _boards[game_id] = CohortBoard(
+            partition_by_cohort(entry.value), score_version, entry.version, time.monotonic()
+        )
+        logger.debug("cohort board of game %s rebuilt: %d cohorts", game_id, len(board.cohorts))
+        return board, None
\ No newline at end of file
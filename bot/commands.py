@@ -2,29 +2,83 @@
 命令处理模块
 """
 from nonebot import on_command, on_regex
-from nonebot.adapters.onebot.v11 import Bot, Event
+from nonebot.adapters.onebot.v11 import Bot, Event, GroupMessageEvent, Message, MessageSegment
+from nonebot.params import CommandArg
+import asyncio
 import re
-from .config import TARGET_GAME_ID
-from .database import get_game_title, get_game_challenges, get_game_rankings, get_game_rankings_by_stdnum_prefix
+import time
+from .config import (
+    CATEGORY_MAPPING,
+    PROFILE_MAX_SECONDS,
+    RANK_ALL_TOP,
+    REPORT_PROGRESS_SECONDS,
+    get_config,
+    reload_config,
+)
+from .cache import challenges_cache, get_cached_game_title, scoreboard_cache
+from .challenge_index import get_challenge_index
+from .cohorts import filter_cohort, get_cohort_board
+from .database import (
+    get_breaker_status,
+    get_replica_status,
+    get_statement_stats,
+    stream_game_rankings,
+    stream_game_rankings_by_stdnum_prefix,
+    is_database_available,
+)
 from .utils import (
     format_challenges_message, 
-    format_ranking_message,
+    format_cohort_rankings,
+    format_ranking_message_stream,
+    format_diagnostics_report,
+    format_profile_report,
+    format_report_summary,
+    format_stale_notice,
+    format_solve_matrix,
+    format_statement_stats,
     validate_command_prerequisites, 
     send_response, 
     log_command_result, 
     log_database_error,
-    check_admin_permission
+    check_admin_permission,
+    check_group_permission,
 )
 from .notifications import set_auto_broadcast_enabled, is_auto_broadcast_enabled
+from .score_index import get_score_index
+from .charts import render_trend
+from .diagnostics import run_diagnostics
+from .solve_matrix import get_solve_matrix, parse_category
+from .forward import forward_char_budget, send_long_response
+from .profiler import profiler
+from .report import REPORT_FORMATS, generate_report
+from .subscriptions import KIND_CHALLENGE, KIND_NAMES, KIND_TEAM, subscriptions
+
+# 解题矩阵显示的队伍数
+MATRIX_TOP_TEAMS = 15
+
+async def _iterate(rows):
+    """把缓存中的排行榜列表当作异步行流使用"""
+    for row in rows:
+        yield row
 
 
 # 定义命令触发
 gamechallenges = on_command("gamechallenges", aliases={"gc"}, priority=5)
 rank = on_command("rank", priority=5)
+rank_all = on_command("rank-all", priority=5)
 help_command = on_command("help", priority=5)
+trend = on_command("trend", priority=5)
+matrix = on_command("matrix", priority=5)
+subscribe = on_command("sub", priority=5)
+unsubscribe = on_command("unsub", priority=5)
 # 自动播报控制命令
 open_broadcast = on_command("open", priority=5)
 close_broadcast = on_command("close", priority=5)
+db_stats = on_command("dbstats", priority=5)
+explain = on_command("explain", priority=5)
+reload_command = on_command("reload", priority=5)
+profile = on_command("profile", priority=5)
+report_command = on_command("report", priority=5)
 # 使用正则表达式匹配 rank-xx 格式的命令（仅两位数字）
 rank_prefix = on_regex(r'^/rank-(\d{2})$', priority=4)
 
@@ -40,19 +94,23 @@ async def handle_gc(bot: Bot, event: Event):
         await gamechallenges.finish(error_msg)
 
     try:
+        game_id = get_config().target_game_id
         # 获取赛事标题
-        game_title = await get_game_title(int(TARGET_GAME_ID))
+        game_title = await get_cached_game_title(game_id)
         
-        # 获取题目列表
-        challenges_data = await get_game_challenges(int(TARGET_GAME_ID))
-        log_command_result("gamechallenges", int(TARGET_GAME_ID), len(challenges_data), "challenges")
+        # 获取题目列表（带短时缓存；数据库繁忙时使用上一次成功的结果）
+        challenges_data, stale_age = await challenges_cache.get_or_stale(game_id)
+        log_command_result("gamechallenges", game_id, len(challenges_data), "challenges")
         
         if not challenges_data:
-            await gamechallenges.finish(f"在比赛 '{game_title}' 中未找到任何赛题。")
+            await send_response(bot, event, f"在比赛 '{game_title}' 中未找到任何赛题。", "gamechallenges")
+            return
         
         # 格式化并发送消息
         text = format_challenges_message(game_title, challenges_data)
-        await send_response(bot, event, text, "gamechallenges")
+        if stale_age is not None:
+            text = f"{format_stale_notice(stale_age)}\n{text}"
+        await send_long_response(bot, event, text, "gamechallenges")
         
     except Exception as e:
         log_database_error("gamechallenges", e)
@@ -70,19 +128,44 @@ async def handle_rank(bot: Bot, event: Event):
         await rank.finish(error_msg)
 
     try:
+        game_id = get_config().target_game_id
         # 获取赛事标题
-        game_title = await get_game_title(int(TARGET_GAME_ID))
+        game_title = await get_cached_game_title(game_id)
         
-        # 获取排行榜数据
-        ranking_data = await get_game_rankings(int(TARGET_GAME_ID))
-        log_command_result("rank", int(TARGET_GAME_ID), len(ranking_data), "teams")
+        # 缓存中有新鲜的排行榜时直接使用，否则流式读取，消息达到长度上限后不再继续读取；
+        # 数据库熔断、正在重新计算排行榜或查询失败时使用上一次成功的排行榜并注明其时间。
+        # 群聊中可以合并转发时放宽字符上限，排行榜仍受 RANK_MAX_LINES 限制
+        budget = forward_char_budget(bot, event)
+        cached = scoreboard_cache.peek(game_id)
+        fresh = cached is not None and cached.age < scoreboard_cache.ttl
+        stale = cached is not None and not fresh and (
+            not is_database_available() or scoreboard_cache.is_refreshing(game_id)
+        )
+        if fresh or stale:
+            text, team_count = await format_ranking_message_stream(
+                game_title, _iterate(cached.value), max_chars=budget
+            )
+        else:
+            try:
+                async with stream_game_rankings(game_id) as rows:
+                    text, team_count = await format_ranking_message_stream(game_title, rows, max_chars=budget)
+            except Exception as e:
+                if cached is None:
+                    raise
+                log_database_error("rank", e)
+                stale = True
+                text, team_count = await format_ranking_message_stream(
+                    game_title, _iterate(cached.value), max_chars=budget
+                )
+        if stale and team_count:
+            text = f"{format_stale_notice(cached.age)}\n{text}"
+        log_command_result("rank", game_id, team_count, "teams")
         
-        if not ranking_data:
-            await rank.finish(f"比赛 '{game_title}' 暂无排行榜数据。")
+        if not team_count:
+            await send_response(bot, event, f"比赛 '{game_title}' 暂无排行榜数据。", "rank")
+            return
         
-        # 格式化并发送消息
-        text = format_ranking_message(game_title, ranking_data)
-        await send_response(bot, event, text, "rank")
+        await send_long_response(bot, event, text, "rank")
         
     except Exception as e:
         log_database_error("rank", e)
@@ -105,10 +188,20 @@ async def handle_help(bot: Bot, event: Event):
 • /gc 或 /gamechallenges - 查看比赛题目列表
 • /rank - 查看排行榜
 • /rank-XX - 查看指定级别排行榜（如：/rank-25）
+• /rank-all [N] - 按学号前缀分年级查看各年级前 N 名
+• /trend [N] - 查看前 N 名分数曲线（默认 10，最多 20）
+• /matrix [类别] - 查看前 15 名的解题矩阵（如：/matrix web）
+• /sub team <队伍名> 或 /sub chal <题目名> - 订阅队伍或题目，相关的血、提示、上新播报会 @ 你；/sub 查看我的订阅
+• /unsub team <队伍名>、/unsub chal <题目名> 或 /unsub all - 取消订阅
 
 管理员可用命令
 • /open - 开启自动播报(一血、二血、三血、上新题、题目加提示、赛事公告)
 • /close - 关闭自动播报(一血、二血、三血、上新题、题目加提示、赛事公告)
+• /dbstats - 查看数据库语句准备与执行耗时
+• /explain - 诊断各查询的执行计划并给出索引建议（会实际执行查询，建议赛前使用）
+• /reload - 重新读取配置（群号、管理员、比赛ID、数据库连接等），无需重启
+• /profile [秒数] - 对运行中的机器人采样分析（默认 10 秒），汇总最耗时的位置并保存火焰图数据
+• /report [md|csv|xlsx] - 在后台生成赛后报告（最终排名、分年级前三、前三血、题目统计），默认生成全部格式
 
 注意：自动播报默认关闭，请使用 /open 开启，/close 关闭。
     """.strip()
@@ -135,10 +228,10 @@ async def handle_open_broadcast(bot: Bot, event: Event):
         await open_broadcast.finish(error_msg)
     
     try:
-        if is_auto_broadcast_enabled():
+        if await is_auto_broadcast_enabled():
             await send_response(bot, event, "自动播报已是开启状态。", "open")
             return
-        set_auto_broadcast_enabled(True)
+        await set_auto_broadcast_enabled(True)
         await send_response(bot, event, "已开启自动播报。", "open")
     except Exception as e:
         log_database_error("open", e)
@@ -160,10 +253,10 @@ async def handle_close_broadcast(bot: Bot, event: Event):
         await close_broadcast.finish(error_msg)
     
     try:
-        if not is_auto_broadcast_enabled():
+        if not await is_auto_broadcast_enabled():
             await send_response(bot, event, "自动播报已是关闭状态。", "close")
             return
-        set_auto_broadcast_enabled(False)
+        await set_auto_broadcast_enabled(False)
         await send_response(bot, event, "已关闭自动播报。", "close")
     except Exception as e:
         log_database_error("close", e)
@@ -189,20 +282,408 @@ async def handle_rank_prefix(bot: Bot, event: Event):
     prefix_str = match.group(1)
     
     try:
+        game_id = get_config().target_game_id
         # 获取赛事标题
-        game_title = await get_game_title(int(TARGET_GAME_ID))
+        game_title = await get_cached_game_title(game_id)
         
-        # 获取按学号前缀过滤的排行榜数据
-        ranking_data = await get_game_rankings_by_stdnum_prefix(int(TARGET_GAME_ID), prefix_str)
-        log_command_result("rank-prefix", int(TARGET_GAME_ID), len(ranking_data), f"teams (prefix={prefix_str})")
+        # 与 /rank 相同：缓存中有新鲜的总排行榜时按学号前缀过滤后使用，否则流式读取按前缀过滤的排行榜；
+        # 数据库熔断、正在重新计算排行榜或查询失败时过滤上一次成功的总排行榜并注明其时间。标题包含前缀信息
+        title = f"{game_title} - {prefix_str} 级"
+        budget = forward_char_budget(bot, event)
+        cached = scoreboard_cache.peek(game_id)
+        fresh = cached is not None and cached.age < scoreboard_cache.ttl
+        stale = cached is not None and not fresh and (
+            not is_database_available() or scoreboard_cache.is_refreshing(game_id)
+        )
+        if fresh or stale:
+            text, team_count = await format_ranking_message_stream(
+                title, _iterate(filter_cohort(cached.value, prefix_str)), max_chars=budget
+            )
+        else:
+            try:
+                async with stream_game_rankings_by_stdnum_prefix(game_id, prefix_str) as rows:
+                    text, team_count = await format_ranking_message_stream(title, rows, max_chars=budget)
+            except Exception as e:
+                if cached is None:
+                    raise
+                log_database_error("rank-prefix", e)
+                stale = True
+                text, team_count = await format_ranking_message_stream(
+                    title, _iterate(filter_cohort(cached.value, prefix_str)), max_chars=budget
+                )
+        if stale and team_count:
+            text = f"{format_stale_notice(cached.age)}\n{text}"
+        log_command_result("rank-prefix", game_id, team_count, f"teams (prefix={prefix_str})")
         
-        if not ranking_data:
-            await rank_prefix.finish(f"'{game_title}' 赛事中未找到{prefix_str}级的队伍。")
+        if not team_count:
+            await send_response(bot, event, f"'{game_title}' 赛事中未找到{prefix_str}级的队伍。", "rank-prefix")
+            return
         
-        # 格式化并发送消息，标题包含前缀信息
-        text = format_ranking_message(f"{game_title} - {prefix_str} 级", ranking_data)
-        await send_response(bot, event, text, "rank-prefix")
+        await send_long_response(bot, event, text, "rank-prefix")
         
     except Exception as e:
         log_database_error("rank-prefix", e)
         await rank_prefix.finish("查询排行榜失败！")
+
+
+@rank_all.handle()
+async def handle_rank_all(bot: Bot, event: Event, args: Message = CommandArg()):
+    """处理分年级排行榜查询命令，如 /rank-all 或 /rank-all 5"""
+    # 验证先决条件
+    error_msg = await validate_command_prerequisites("rank-all", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return  # 静默处理权限拒绝
+        await rank_all.finish(error_msg)
+
+    arg_text = args.extract_plain_text().strip()
+    if arg_text and not arg_text.isdigit():
+        await rank_all.finish("请使用正确格式，例如：/rank-all 或 /rank-all 5")
+
+    try:
+        config = get_config()
+        game_id = config.target_game_id
+        top_n = min(max(int(arg_text), 1), config.rank_max_lines) if arg_text else RANK_ALL_TOP
+        game_title = await get_cached_game_title(game_id)
+
+        # 所有年级共用一次总排行榜查询，没有新的得分时直接使用上次的划分结果
+        board, stale_age = await get_cohort_board(game_id)
+        text, team_count = format_cohort_rankings(game_title, board.cohorts, top_n)
+        log_command_result("rank-all", game_id, team_count, f"teams ({len(board.cohorts)} cohorts)")
+
+        if not team_count:
+            await send_response(bot, event, f"比赛 '{game_title}' 暂无排行榜数据。", "rank-all")
+            return
+        if stale_age is not None:
+            text = f"{format_stale_notice(stale_age)}\n{text}"
+
+        await send_long_response(bot, event, text, "rank-all")
+
+    except Exception as e:
+        log_database_error("rank-all", e)
+        await rank_all.finish("查询排行榜失败！")
+
+
+@trend.handle()
+async def handle_trend(bot: Bot, event: Event, args: Message = CommandArg()):
+    """处理分数曲线查询命令，如 /trend 或 /trend 5"""
+    # 验证先决条件
+    error_msg = await validate_command_prerequisites("trend", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return  # 静默处理权限拒绝
+        await trend.finish(error_msg)
+
+    arg_text = args.extract_plain_text().strip()
+    if arg_text and not arg_text.isdigit():
+        await trend.finish("请使用正确格式，例如：/trend 或 /trend 5")
+    top_n = min(max(int(arg_text), 1), 20) if arg_text else 10
+
+    try:
+        game_id = get_config().target_game_id
+        game_title = await get_cached_game_title(game_id)
+
+        # 增量刷新分数索引后渲染曲线
+        index = get_score_index(game_id)
+        await index.refresh()
+        png = await render_trend(index, game_title, top_n)
+        log_command_result("trend", game_id, len(index.totals), "teams")
+
+        if png is None:
+            await send_response(bot, event, f"比赛 '{game_title}' 暂无得分数据。", "trend")
+            return
+
+        await send_response(bot, event, MessageSegment.image(png), "trend")
+
+    except Exception as e:
+        log_database_error("trend", e)
+        await trend.finish("生成分数曲线失败！")
+
+
+@matrix.handle()
+async def handle_matrix(bot: Bot, event: Event, args: Message = CommandArg()):
+    """处理解题矩阵查询命令，如 /matrix 或 /matrix web"""
+    # 验证先决条件
+    error_msg = await validate_command_prerequisites("matrix", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return  # 静默处理权限拒绝
+        await matrix.finish(error_msg)
+
+    arg_text = args.extract_plain_text().strip()
+    category = parse_category(arg_text) if arg_text else None
+    if arg_text and category is None:
+        await matrix.finish(f"未知类别：{arg_text}，可选：{', '.join(CATEGORY_MAPPING.values())}")
+
+    try:
+        game_id = get_config().target_game_id
+        game_title = await get_cached_game_title(game_id)
+
+        # 增量刷新解题矩阵后切片
+        solve_matrix = get_solve_matrix(game_id)
+        await solve_matrix.refresh()
+        view = solve_matrix.view(MATRIX_TOP_TEAMS, category)
+        log_command_result("matrix", game_id, len(view.team_names), "teams")
+
+        category_name = CATEGORY_MAPPING[category] if category is not None else None
+        await send_response(bot, event, format_solve_matrix(game_title, view, category_name), "matrix")
+
+    except Exception as e:
+        log_database_error("matrix", e)
+        await send_response(bot, event, "生成解题矩阵失败！", "matrix")
+
+
+@db_stats.handle()
+async def handle_db_stats(bot: Bot, event: Event):
+    """查看数据库语句准备与执行耗时"""
+    # 检查管理员权限
+    if not check_admin_permission(event):
+        await send_response(bot, event, "权限不足，只有管理员才能执行此命令。", "dbstats")
+        return
+
+    error_msg = await validate_command_prerequisites("dbstats", event)
+    if error_msg == "PERMISSION_DENIED":
+        return
+
+    try:
+        text = format_statement_stats(get_statement_stats(), get_replica_status(), get_breaker_status())
+        await send_response(bot, event, text, "dbstats")
+    except Exception as e:
+        log_database_error("dbstats", e)
+
+
+@explain.handle()
+async def handle_explain(bot: Bot, event: Event):
+    """诊断各查询的执行计划并给出索引建议"""
+    # 检查管理员权限
+    if not check_admin_permission(event):
+        await send_response(bot, event, "权限不足，只有管理员才能执行此命令。", "explain")
+        return
+
+    error_msg = await validate_command_prerequisites("explain", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return
+        await explain.finish(error_msg)
+
+    try:
+        game_id = get_config().target_game_id
+        report = await run_diagnostics(game_id)
+        await send_response(bot, event, format_diagnostics_report(report), "explain")
+    except Exception as e:
+        log_database_error("explain", e)
+        await send_response(bot, event, "查询计划诊断失败！", "explain")
+
+
+@reload_command.handle()
+async def handle_reload(bot: Bot, event: Event):
+    """重新读取配置并立即生效"""
+    # 检查管理员权限
+    if not check_admin_permission(event):
+        await send_response(bot, event, "权限不足，只有管理员才能执行此命令。", "reload")
+        return
+    # 不检查数据库与比赛配置，重新加载正是为了修正它们
+    if not check_group_permission(event):
+        return
+
+    try:
+        changed = await reload_config()
+    except ValueError as e:
+        await send_response(bot, event, f"配置有误，仍使用原配置：{e}", "reload")
+        return
+    except Exception as e:
+        log_database_error("reload", e)
+        await send_response(bot, event, "重新加载配置失败！", "reload")
+        return
+    if changed:
+        await send_response(bot, event, "配置已更新：" + "、".join(changed), "reload")
+    else:
+        await send_response(bot, event, "配置没有变化。", "reload")
+
+
+SUBSCRIPTION_USAGE = "请使用正确格式，例如：/sub team 队伍名、/sub chal 题目名、/unsub all"
+
+
+def _parse_subscription_args(text: str):
+    """解析 "team 名称" / "chal 名称"，返回 (类型, 名称)，格式不对时返回 None"""
+    kind, _, target = text.strip().partition(" ")
+    kind = kind.lower()
+    if kind in ("challenge", "题目"):
+        kind = KIND_CHALLENGE
+    elif kind in ("队伍",):
+        kind = KIND_TEAM
+    if kind not in KIND_NAMES or not target.strip():
+        return None
+    return kind, target.strip()
+
+
+@subscribe.handle()
+async def handle_subscribe(bot: Bot, event: Event, args: Message = CommandArg()):
+    """订阅队伍或题目，如 /sub team 队伍名；不带参数时列出自己的订阅"""
+    error_msg = await validate_command_prerequisites("sub", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return
+        await subscribe.finish(error_msg)
+    if not isinstance(event, GroupMessageEvent):
+        await subscribe.finish("订阅只能在群聊中使用。")
+
+    arg_text = args.extract_plain_text().strip()
+    try:
+        game_id = get_config().target_game_id
+        if not arg_text:
+            owned = subscriptions.list_for(game_id, event.group_id, event.user_id)
+            if not owned:
+                await send_response(bot, event, "你还没有订阅任何队伍或题目。", "sub")
+                return
+            lines = [f"{KIND_NAMES[item.kind]}：{item.target}" for item in owned]
+            await send_response(bot, event, "你的订阅：\n" + "\n".join(lines), "sub")
+            return
+
+        parsed = _parse_subscription_args(arg_text)
+        if parsed is None:
+            await send_response(bot, event, SUBSCRIPTION_USAGE, "sub")
+            return
+        kind, target = parsed
+        if kind == KIND_CHALLENGE:
+            # 题目名必须存在（允许全半角、大小写与少量字符的差异），并统一为题目的原始写法
+            index = get_challenge_index(game_id)
+            await index.ensure_fresh()
+            info = index.lookup(target)
+            # 未启用的题目对选手不可见，不能订阅
+            if info is None or not info.enabled:
+                await send_response(bot, event, f"未找到题目：{target}", "sub")
+                return
+            target = info.title
+
+        try:
+            added = subscriptions.subscribe(game_id, kind, target, event.group_id, event.user_id)
+        except ValueError as e:
+            await send_response(bot, event, str(e), "sub")
+            return
+        reply = f"已订阅{KIND_NAMES[kind]}：{target}" if added else f"你已订阅过{KIND_NAMES[kind]}：{target}"
+        await send_response(bot, event, reply, "sub")
+    except Exception as e:
+        log_database_error("sub", e)
+        await send_response(bot, event, "订阅失败！", "sub")
+
+
+@unsubscribe.handle()
+async def handle_unsubscribe(bot: Bot, event: Event, args: Message = CommandArg()):
+    """取消订阅，如 /unsub team 队伍名 或 /unsub all"""
+    error_msg = await validate_command_prerequisites("unsub", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return
+        await unsubscribe.finish(error_msg)
+    if not isinstance(event, GroupMessageEvent):
+        await unsubscribe.finish("订阅只能在群聊中使用。")
+
+    arg_text = args.extract_plain_text().strip()
+    try:
+        game_id = get_config().target_game_id
+        if arg_text.lower() == "all":
+            count = subscriptions.unsubscribe_all(game_id, event.group_id, event.user_id)
+            await send_response(bot, event, f"已取消全部 {count} 项订阅。", "unsub")
+            return
+        parsed = _parse_subscription_args(arg_text)
+        if parsed is None:
+            await send_response(bot, event, SUBSCRIPTION_USAGE, "unsub")
+            return
+        kind, target = parsed
+        if subscriptions.unsubscribe(game_id, kind, target, event.group_id, event.user_id):
+            await send_response(bot, event, f"已取消订阅{KIND_NAMES[kind]}：{target}", "unsub")
+        else:
+            await send_response(bot, event, f"你没有订阅{KIND_NAMES[kind]}：{target}", "unsub")
+    except Exception as e:
+        log_database_error("unsub", e)
+        await send_response(bot, event, "取消订阅失败！", "unsub")
+
+
+@profile.handle()
+async def handle_profile(bot: Bot, event: Event, args: Message = CommandArg()):
+    """采样分析运行中的机器人，如 /profile 或 /profile 30"""
+    # 检查管理员权限
+    if not check_admin_permission(event):
+        await send_response(bot, event, "权限不足，只有管理员才能执行此命令。", "profile")
+        return
+    if not check_group_permission(event):
+        return
+
+    arg_text = args.extract_plain_text().strip()
+    if arg_text and not arg_text.isdigit():
+        await profile.finish(f"请使用正确格式，例如：/profile 或 /profile 30（最多 {PROFILE_MAX_SECONDS} 秒）")
+    seconds = min(max(int(arg_text), 1), PROFILE_MAX_SECONDS) if arg_text else 10
+    if profiler.running:
+        await profile.finish("已有采样正在进行，请稍后再试。")
+
+    try:
+        await send_response(bot, event, f"开始采样 {seconds} 秒……", "profile")
+        report = await profiler.run(seconds)
+        await send_long_response(bot, event, format_profile_report(report), "profile")
+    except Exception as e:
+        log_database_error("profile", e)
+        await send_response(bot, event, "采样分析失败！", "profile")
+
+
+# 报告阶段的显示名称
+REPORT_STAGES = {
+    "teams": "队伍",
+    "challenges": "题目",
+    "submissions": "提交",
+    "notices": "通知",
+    "members": "队员",
+}
+# 正在后台生成的报告，保存引用以免任务被回收
+_report_tasks = set()
+
+
+async def _run_report(bot: Bot, event: Event, game_id: int, formats) -> None:
+    """后台生成报告，按 REPORT_PROGRESS_SECONDS 节流汇报进度，完成后回复摘要"""
+    last_sent = time.monotonic()
+
+    async def progress(stage: str, rows: int) -> None:
+        nonlocal last_sent
+        if time.monotonic() - last_sent < REPORT_PROGRESS_SECONDS:
+            return
+        last_sent = time.monotonic()
+        if stage in REPORT_STAGES:
+            text = f"报告生成中：已读取{REPORT_STAGES[stage]} {rows} 行"
+        else:
+            text = "报告生成中：正在汇总与写出文件"
+        await send_response(bot, event, text, "report")
+
+    try:
+        report = await generate_report(game_id, formats, progress=progress)
+        await send_long_response(bot, event, format_report_summary(report), "report")
+    except Exception as e:
+        log_database_error("report", e)
+        await send_response(bot, event, "生成赛后报告失败！", "report")
+
+
+@report_command.handle()
+async def handle_report(bot: Bot, event: Event, args: Message = CommandArg()):
+    """生成赛后报告，如 /report 或 /report md xlsx"""
+    # 检查管理员权限
+    if not check_admin_permission(event):
+        await send_response(bot, event, "权限不足，只有管理员才能执行此命令。", "report")
+        return
+
+    error_msg = await validate_command_prerequisites("report", event)
+    if error_msg:
+        if error_msg == "PERMISSION_DENIED":
+            return
+        await report_command.finish(error_msg)
+
+    aliases = {"markdown": "md", "excel": "xlsx"}
+    formats = [aliases.get(f, f) for f in args.extract_plain_text().lower().split()] or list(REPORT_FORMATS)
+    if any(f not in REPORT_FORMATS for f in formats):
+        await report_command.finish(f"请使用正确格式，例如：/report 或 /report md xlsx（可选：{', '.join(REPORT_FORMATS)}）")
+    if _report_tasks:
+        await report_command.finish("已有报告正在生成，请稍后再试。")
+
+    game_id = get_config().target_game_id
+    task = asyncio.get_running_loop().create_task(_run_report(bot, event, game_id, formats))
+    _report_tasks.add(task)
+    task.add_done_callback(_report_tasks.discard)
+    await send_response(bot, event, f"开始在后台生成赛后报告（{', '.join(formats)}），完成后会在此回复。", "report")
@@ -1,37 +1,266 @@
 """
 配置管理模块
+大部分配置在启动时从环境变量读取；群号、管理员、比赛ID、数据库连接等可热更新的配置保存在不可变的
+BotConfig 快照中，通过 get_config() 读取。修改 BOT_CONFIG_FILE 指向的文件或执行 /reload 后整体替换快照，
+并只通知关心变更字段的监听者（连接池、缓存、索引等）做相应的失效处理
 """
+import asyncio
+import logging
 import os
+from dataclasses import dataclass, fields
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
 
-# 读取环境变量中的数据库连接信息
-POSTGRES_DSN = os.getenv("POSTGRES_DSN")
+logger = logging.getLogger(__name__)
 
-# 允许触发命令的群聊 ID，逗号分隔；为空表示不限制
-ALLOWED_GROUP_IDS_RAW = os.getenv("ALLOWED_GROUP_IDS", "")
-ALLOWED_GROUP_IDS = set()
-if ALLOWED_GROUP_IDS_RAW:
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_FALSE_VALUES = ("0", "false", "no", "off")
+
+
+def _int_env(name: str, default: int, minimum: int = 0, env: Mapping[str, str] = os.environ) -> int:
+    """读取整数型环境变量，解析失败时使用默认值"""
+    try:
+        return max(minimum, int(env.get(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _bool_env(name: str, default: bool, env: Mapping[str, str] = os.environ) -> bool:
+    value = env.get(name, "").strip().lower()
+    if not value:
+        return default
+    return value in _TRUE_VALUES if default is False else value not in _FALSE_VALUES
+
+
+def _id_set(raw: str, strict: bool = False) -> FrozenSet[int]:
+    """解析逗号分隔的ID列表；strict 为假时解析失败返回空集合（与早期行为一致，即不限制）"""
     try:
-        ALLOWED_GROUP_IDS = set(int(x.strip()) for x in ALLOWED_GROUP_IDS_RAW.split(",") if x.strip())
-    except Exception:
-        ALLOWED_GROUP_IDS = set()
+        return frozenset(int(x.strip()) for x in raw.split(",") if x.strip())
+    except ValueError:
+        if strict:
+            raise ValueError(f"ID 列表格式错误: {raw}")
+        return frozenset()
+
+
+# ==================== 可热更新的配置 ====================
+
+# 热更新配置文件（.env 格式），其中的值覆盖进程环境变量；留空表示只能通过 /reload 重新读取环境变量
+BOT_CONFIG_FILE = os.getenv("BOT_CONFIG_FILE", "").strip()
+# 检查配置文件是否修改的间隔（秒）
+CONFIG_WATCH_SECONDS = _int_env("CONFIG_WATCH_SECONDS", 5, minimum=1)
+
+
+@dataclass(frozen=True)
+class BotConfig:
+    """可热更新的配置快照，创建后不再修改，替换时整体换成新的实例"""
 
-# 从 .env 文件读取要监听的比赛 ID
-TARGET_GAME_ID = os.getenv("TARGET_GAME_ID")
+    # 读取环境变量中的数据库连接信息
+    postgres_dsn: Optional[str]
+    # 只读副本连接串；为空表示所有查询都走主库
+    replica_dsns: Tuple[str, ...]
+    # 连接池大小
+    db_pool_min_size: int
+    db_pool_max_size: int
+    # 允许触发命令的群聊 ID；为空表示不限制
+    allowed_group_ids: FrozenSet[int]
+    # 管理员 QQ 号；为空表示不限制
+    admin_qq_ids: FrozenSet[int]
+    # 要监听的比赛 ID
+    target_game_id: Optional[int]
+    # 排行榜消息最多显示的队伍数与单条消息最大字符数，超出部分不再读取和格式化
+    rank_max_lines: int
+    message_max_chars: int
+    # 查询结果缓存时间（秒）：赛事标题、题目列表、排行榜
+    game_title_cache_seconds: int
+    challenges_cache_seconds: int
+    scoreboard_cache_seconds: int
+    # 直接从 Submissions 检测前三血并立即播报，不再等待 GameNotices；随后到达的血腥通知会被去重
+    fast_blood_detection: bool
+    # 通知轮询间隔（秒）：有新通知/提交或临近比赛开始、结束时按最小间隔轮询，空闲时指数退避到最大间隔
+    notice_poll_min_seconds: int
+    notice_poll_max_seconds: int
+    # 单次查询（含借用连接、建连与准备语句）的超时时间（秒）；排行榜等重查询单独设置，其超时不计入熔断
+    db_query_timeout_seconds: int
+    db_heavy_query_timeout_seconds: int
+    # 熔断器：主库连续失败达到次数后打开，打开期间查询立即失败；经过冷却时间后放行一次试探查询
+    db_breaker_failures: int
+    db_breaker_reset_seconds: int
 
-# 管理员 QQ 号，逗号分隔；为空表示不限制
-ADMIN_QQ_IDS_RAW = os.getenv("ADMIN_QQ_IDS", "")
-ADMIN_QQ_IDS = set()
-if ADMIN_QQ_IDS_RAW:
+
+def _load_config(env: Mapping[str, str], strict: bool = False) -> BotConfig:
+    pool_max = _int_env("DB_POOL_MAX_SIZE", 5, minimum=1, env=env)
+    poll_min = _int_env("NOTICE_POLL_MIN_SECONDS", 1, minimum=1, env=env)
+    game_id = env.get("TARGET_GAME_ID", "").strip()
+    if game_id and not game_id.isdigit():
+        if strict:
+            raise ValueError(f"TARGET_GAME_ID 不是数字: {game_id}")
+        game_id = ""
+    return BotConfig(
+        postgres_dsn=env.get("POSTGRES_DSN") or None,
+        replica_dsns=tuple(x.strip() for x in env.get("POSTGRES_REPLICA_DSNS", "").split(",") if x.strip()),
+        db_pool_min_size=min(_int_env("DB_POOL_MIN_SIZE", 1, env=env), pool_max),
+        db_pool_max_size=pool_max,
+        allowed_group_ids=_id_set(env.get("ALLOWED_GROUP_IDS", ""), strict),
+        admin_qq_ids=_id_set(env.get("ADMIN_QQ_IDS", ""), strict),
+        target_game_id=int(game_id) if game_id else None,
+        rank_max_lines=_int_env("RANK_MAX_LINES", 100, minimum=1, env=env),
+        message_max_chars=_int_env("MESSAGE_MAX_CHARS", 4000, minimum=200, env=env),
+        game_title_cache_seconds=_int_env("GAME_TITLE_CACHE_SECONDS", 300, env=env),
+        challenges_cache_seconds=_int_env("CHALLENGES_CACHE_SECONDS", 15, env=env),
+        scoreboard_cache_seconds=_int_env("SCOREBOARD_CACHE_SECONDS", 10, env=env),
+        fast_blood_detection=_bool_env("FAST_BLOOD_DETECTION", False, env=env),
+        notice_poll_min_seconds=poll_min,
+        notice_poll_max_seconds=max(_int_env("NOTICE_POLL_MAX_SECONDS", 30, minimum=1, env=env), poll_min),
+        db_query_timeout_seconds=_int_env("DB_QUERY_TIMEOUT_SECONDS", 5, minimum=1, env=env),
+        db_heavy_query_timeout_seconds=_int_env("DB_HEAVY_QUERY_TIMEOUT_SECONDS", 30, minimum=1, env=env),
+        db_breaker_failures=_int_env("DB_BREAKER_FAILURES", 5, minimum=1, env=env),
+        db_breaker_reset_seconds=_int_env("DB_BREAKER_RESET_SECONDS", 15, minimum=1, env=env),
+    )
+
+
+def _config_file_mtime() -> Optional[int]:
     try:
-        ADMIN_QQ_IDS = set(int(x.strip()) for x in ADMIN_QQ_IDS_RAW.split(",") if x.strip())
-    except Exception:
-        ADMIN_QQ_IDS = set()
+        return os.stat(BOT_CONFIG_FILE).st_mtime_ns if BOT_CONFIG_FILE else None
+    except OSError:
+        return None
+
+
+def _read_sources() -> Dict[str, str]:
+    """进程环境变量与配置文件合并后的键值，配置文件优先"""
+    env = dict(os.environ)
+    if BOT_CONFIG_FILE and os.path.exists(BOT_CONFIG_FILE):
+        from dotenv import dotenv_values
+
+        env.update({k: v for k, v in dotenv_values(BOT_CONFIG_FILE).items() if v is not None})
+    return env
+
+
+_config_mtime = _config_file_mtime()
+_current = _load_config(_read_sources())
+
+ConfigListener = Callable[[BotConfig, BotConfig], Awaitable[None]]
+_listeners: List[Tuple[FrozenSet[str], ConfigListener]] = []
+_reload_lock = asyncio.Lock()
+
+
+def get_config() -> BotConfig:
+    """返回当前配置快照；快照不可变，读取无需加锁，同一次处理中应只读取一次"""
+    return _current
+
+
+def on_config_change(*field_names: str) -> Callable[[ConfigListener], ConfigListener]:
+    """注册配置变更监听者，仅当所列字段之一发生变化时以 (旧快照, 新快照) 调用"""
+    unknown = set(field_names) - {f.name for f in fields(BotConfig)}
+    if unknown:
+        raise ValueError(f"unknown config fields: {sorted(unknown)}")
+
+    def decorator(listener: ConfigListener) -> ConfigListener:
+        _listeners.append((frozenset(field_names), listener))
+        return listener
+
+    return decorator
+
+
+async def reload_config() -> List[str]:
+    """重新读取环境变量与配置文件并替换配置快照，返回发生变化的字段名
+
+    配置无法解析时抛出 ValueError，当前快照保持不变。
+    """
+    global _current, _config_mtime
+    async with _reload_lock:
+        _config_mtime = _config_file_mtime()
+        new = _load_config(_read_sources(), strict=True)
+        old, _current = _current, new
+        changed = [f.name for f in fields(BotConfig) if getattr(old, f.name) != getattr(new, f.name)]
+        if not changed:
+            return changed
+        logger.info("config reloaded, changed: %s", ", ".join(changed))
+        for watched, listener in _listeners:
+            if watched.intersection(changed):
+                try:
+                    await listener(old, new)
+                except Exception as e:
+                    logger.exception("config listener %s failed: %s", getattr(listener, "__qualname__", listener), e)
+        return changed
+
+
+async def reload_config_if_changed() -> Optional[List[str]]:
+    """配置文件的修改时间变化时重新加载，未变化时返回 None"""
+    if not BOT_CONFIG_FILE or _config_file_mtime() == _config_mtime:
+        return None
+    try:
+        return await reload_config()
+    except ValueError as e:
+        logger.error("config file %s rejected: %s", BOT_CONFIG_FILE, e)
+        return None
+
+
+# ==================== 启动时读取的配置 ====================
+
+# 新连接是否预先准备全部查询语句
+DB_WARM_STATEMENTS = _bool_env("DB_WARM_STATEMENTS", True)
+
+# 副本健康检查间隔与允许的最大复制延迟（秒）
+REPLICA_HEALTH_CHECK_SECONDS = _int_env("REPLICA_HEALTH_CHECK_SECONDS", 10, minimum=1)
+REPLICA_MAX_LAG_SECONDS = _int_env("REPLICA_MAX_LAG_SECONDS", 30)
+
+# 多副本协调模式：留空为单实例（状态保存在内存中）；postgres 表示通过 Postgres 咨询锁选举播报主节点，
+# 并将播报开关、水位线和去重记录保存在 COORDINATION_DSN（默认同 POSTGRES_DSN）中，需要建表权限
+COORDINATION_MODE = os.getenv("COORDINATION_MODE", "").strip().lower()
+COORDINATION_DSN = os.getenv("COORDINATION_DSN") or _current.postgres_dsn
+LEADER_LOCK_KEY = _int_env("LEADER_LOCK_KEY", 0x677A626F74)
+# 主节点租约（秒）：主节点按此间隔心跳，从节点按此间隔尝试抢锁；主节点会话空闲超过 3 倍租约时由数据库断开
+LEADER_LEASE_SECONDS = _int_env("LEADER_LEASE_SECONDS", 5, minimum=1)
+
+# 分数曲线（/trend）的时间分桶长度（秒）
+TREND_BUCKET_SECONDS = _int_env("TREND_BUCKET_SECONDS", 300, minimum=60)
+
+# 只读 Web 看板与 JSON 接口（/board、/api/rank、/api/challenges、/api/notices），没有鉴权，默认关闭
+WEB_DASHBOARD_ENABLED = _bool_env("WEB_DASHBOARD_ENABLED", False)
+# 看板数据的刷新间隔（秒）：只在最近 WEB_ACTIVE_SECONDS 秒内有请求或有事件流连接时定时刷新，
+# 无人观看时不查询数据库，下一次请求到来时按需重建；/api/notices 返回的最近通知条数
+WEB_REFRESH_SECONDS = _int_env("WEB_REFRESH_SECONDS", 10, minimum=1)
+WEB_ACTIVE_SECONDS = _int_env("WEB_ACTIVE_SECONDS", 60, minimum=1)
+WEB_NOTICES_LIMIT = _int_env("WEB_NOTICES_LIMIT", 50, minimum=1)
+
+# 实时事件流（/api/events）：每个订阅者的队列长度（写满即断开）、断线补发保留的事件数、心跳间隔（秒）、
+# 排行榜名次变化事件只包含前若干名
+LIVE_QUEUE_SIZE = _int_env("LIVE_QUEUE_SIZE", 100, minimum=1)
+LIVE_HISTORY_SIZE = _int_env("LIVE_HISTORY_SIZE", 200)
+LIVE_HEARTBEAT_SECONDS = _int_env("LIVE_HEARTBEAT_SECONDS", 15, minimum=1)
+LIVE_RANK_TOP = _int_env("LIVE_RANK_TOP", 50, minimum=1)
+
+# 合并转发：超过 MESSAGE_MAX_CHARS 的回复与同一轮的多条播报打包为合并转发消息发送。
+# 每个节点的最大字符数、每条合并转发消息的最大节点数、同一轮至少多少条播报才打包、
+# 实现拒绝合并转发后多久内直接使用普通消息（秒）
+FORWARD_ENABLED = _bool_env("FORWARD_ENABLED", True)
+FORWARD_NODE_MAX_CHARS = _int_env("FORWARD_NODE_MAX_CHARS", 1500, minimum=100)
+FORWARD_MAX_NODES = _int_env("FORWARD_MAX_NODES", 50, minimum=1)
+FORWARD_NOTICE_MIN = _int_env("FORWARD_NOTICE_MIN", 3, minimum=2)
+FORWARD_RETRY_SECONDS = _int_env("FORWARD_RETRY_SECONDS", 600)
+
+# /rank-all 每个年级默认显示的队伍数
+RANK_ALL_TOP = _int_env("RANK_ALL_TOP", 10, minimum=1)
+
+# 队伍/题目订阅的 SQLite 数据库文件与每人在每个群最多的订阅数
+SUBSCRIPTIONS_DB = os.getenv("SUBSCRIPTIONS_DB", "data/subscriptions.db")
+SUBSCRIPTIONS_PER_USER = _int_env("SUBSCRIPTIONS_PER_USER", 20, minimum=1)
+
+# /profile 采样结果（collapsed stack，可用 flamegraph.pl 或 speedscope 查看）的保存目录与单次最长采样时间（秒）
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_MAX_SECONDS = _int_env("PROFILE_MAX_SECONDS", 60, minimum=1)
+
+# /report 赛后报告的保存目录，以及生成过程中向群里汇报进度的最小间隔（秒）
+REPORT_DIR = os.getenv("REPORT_DIR", "data/reports")
+REPORT_PROGRESS_SECONDS = _int_env("REPORT_PROGRESS_SECONDS", 10, minimum=1)
+
+# 启动预热（连接池、语句、缓存）的最长等待时间（秒），超时后直接开始服务
+STARTUP_WARMUP_TIMEOUT = _int_env("STARTUP_WARMUP_TIMEOUT", 10, minimum=1)
 
 # Category 数字到名称的映射
 CATEGORY_MAPPING = {
     0: "Misc",
     1: "Crypto",
-    2: "Pwn", 
+    2: "Pwn",
     3: "Web",
     4: "Reverse",
     5: "Blockchain",
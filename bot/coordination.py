@@ -0,0 +1,274 @@
+"""
+多副本协调模块
+单实例模式下播报状态保存在内存中；postgres 模式下通过 Postgres 咨询锁选举唯一的播报主节点，
+并将播报开关、通知水位线和去重记录保存在数据库中，供所有副本共享
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+import asyncpg
+
+from .config import (
+    COORDINATION_DSN,
+    COORDINATION_MODE,
+    LEADER_LEASE_SECONDS,
+    LEADER_LOCK_KEY,
+)
+from .database import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# 单实例模式下去重集合的容量控制
+MAX_CLAIMS = 1000
+CLAIMS_KEPT_AFTER_CLEANUP = 500
+
+# 播报开关与比赛无关，统一记录在 game_id = 0 下
+GLOBAL_SCOPE = 0
+
+STATE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS gzbot_state (
+    game_id integer NOT NULL,
+    key text NOT NULL,
+    value text NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (game_id, key)
+);
+CREATE TABLE IF NOT EXISTS gzbot_claims (
+    game_id integer NOT NULL,
+    claim_key text NOT NULL,
+    claimed_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (game_id, claim_key)
+);
+"""
+
+GET_STATE_SQL = 'SELECT value FROM gzbot_state WHERE game_id = $1 AND key = $2'
+
+SET_STATE_SQL = """
+INSERT INTO gzbot_state (game_id, key, value) VALUES ($1, $2, $3)
+ON CONFLICT (game_id, key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+"""
+
+CLAIM_SQL = """
+INSERT INTO gzbot_claims (game_id, claim_key) VALUES ($1, $2)
+ON CONFLICT DO NOTHING
+RETURNING 1
+"""
+
+CLEANUP_CLAIMS_SQL = "DELETE FROM gzbot_claims WHERE claimed_at < now() - interval '2 days'"
+
+
+class BroadcastState:
+    """播报共享状态（单实例模式：内存实现）
+
+    claim 用于去重：同一个键只有第一次调用返回 True。
+    """
+
+    def __init__(self):
+        self._values: Dict[tuple, str] = {}
+        self._claims: Dict[int, Set[str]] = {}
+        self._claim_order: Dict[int, list] = {}
+
+    async def get(self, game_id: int, key: str) -> Optional[str]:
+        return self._values.get((game_id, key))
+
+    async def set(self, game_id: int, key: str, value: str) -> None:
+        self._values[(game_id, key)] = value
+
+    async def claim(self, game_id: int, claim_key: str) -> bool:
+        claims = self._claims.setdefault(game_id, set())
+        if claim_key in claims:
+            return False
+        claims.add(claim_key)
+        order = self._claim_order.setdefault(game_id, [])
+        order.append(claim_key)
+        if len(order) > MAX_CLAIMS:
+            dropped, kept = order[:-CLAIMS_KEPT_AFTER_CLEANUP], order[-CLAIMS_KEPT_AFTER_CLEANUP:]
+            claims.difference_update(dropped)
+            self._claim_order[game_id] = kept
+            logger.info("cleanup broadcast claims, kept %d", len(kept))
+        return True
+
+    async def is_claimed(self, game_id: int, claim_key: str) -> bool:
+        return claim_key in self._claims.get(game_id, set())
+
+    # 便捷方法
+
+    async def is_enabled(self) -> bool:
+        return await self.get(GLOBAL_SCOPE, "enabled") == "1"
+
+    async def set_enabled(self, enabled: bool) -> None:
+        await self.set(GLOBAL_SCOPE, "enabled", "1" if enabled else "0")
+
+    async def get_watermark(self, game_id: int, name: str = "notice") -> Optional[int]:
+        value = await self.get(game_id, f"watermark:{name}")
+        return int(value) if value is not None else None
+
+    async def set_watermark(self, game_id: int, value: int, name: str = "notice") -> None:
+        await self.set(game_id, f"watermark:{name}", str(value))
+
+    async def close(self) -> None:
+        return None
+
+
+class PostgresBroadcastState(BroadcastState):
+    """播报共享状态（postgres 模式：保存在 gzbot_state / gzbot_claims 表中）"""
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self._pool = ConnectionPool(dsn, 0, 2, warm_statements=False)
+        self._schema_ready = False
+        self._schema_lock = asyncio.Lock()
+        self._last_cleanup = 0.0
+
+    async def _ensure_schema(self, conn) -> None:
+        if self._schema_ready:
+            return
+        async with self._schema_lock:
+            if self._schema_ready:
+                return
+            async with conn.transaction():
+                # 多个副本同时启动时串行建表
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", LEADER_LOCK_KEY + 1)
+                await conn.execute(STATE_SCHEMA_SQL)
+            self._schema_ready = True
+
+    async def _fetchval(self, sql: str, *args):
+        async with self._pool.acquire() as conn:
+            await self._ensure_schema(conn)
+            return await conn.fetchval(sql, *args)
+
+    async def get(self, game_id: int, key: str) -> Optional[str]:
+        return await self._fetchval(GET_STATE_SQL, game_id, key)
+
+    async def set(self, game_id: int, key: str, value: str) -> None:
+        await self._fetchval(SET_STATE_SQL, game_id, key, value)
+
+    async def claim(self, game_id: int, claim_key: str) -> bool:
+        claimed = await self._fetchval(CLAIM_SQL, game_id, claim_key) is not None
+        if time.monotonic() - self._last_cleanup > 3600:
+            self._last_cleanup = time.monotonic()
+            await self._fetchval(CLEANUP_CLAIMS_SQL)
+        return claimed
+
+    async def is_claimed(self, game_id: int, claim_key: str) -> bool:
+        return await self._fetchval(
+            "SELECT 1 FROM gzbot_claims WHERE game_id = $1 AND claim_key = $2", game_id, claim_key
+        ) is not None
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+
+class LeaderElection:
+    """基于 Postgres 会话级咨询锁的主节点选举
+
+    持有锁的会话即为主节点，会话断开（进程退出、网络中断、空闲超时）时锁自动释放，
+    其他副本在下一次尝试时接管。
+    """
+
+    def __init__(self, dsn: Optional[str], lock_key: int, lease_seconds: int):
+        self.dsn = dsn
+        self.lock_key = lock_key
+        self.lease_seconds = lease_seconds
+        self._conn: Optional[asyncpg.Connection] = None
+        self._leader = False
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def leader(self) -> bool:
+        return self._leader
+
+    async def _connect(self) -> asyncpg.Connection:
+        conn = await asyncpg.connect(
+            self.dsn,
+            timeout=self.lease_seconds,
+            server_settings={
+                "application_name": "gzbot-leader",
+                # 尽快发现已断开的对端，从而释放锁
+                "tcp_keepalives_idle": str(self.lease_seconds),
+                "tcp_keepalives_interval": str(self.lease_seconds),
+                "tcp_keepalives_count": "3",
+            },
+        )
+        try:
+            # 主节点卡死不再心跳时由数据库断开会话（PostgreSQL 14+）
+            await conn.execute(f"SET idle_session_timeout = '{self.lease_seconds * 3}s'")
+        except asyncpg.PostgresError:
+            pass
+        return conn
+
+    def _drop_connection(self) -> None:
+        if self._conn is not None:
+            self._conn.terminate()
+            self._conn = None
+
+    async def is_leader(self) -> bool:
+        """返回当前副本是否为主节点，每个租约周期最多访问一次数据库"""
+        if time.monotonic() - self._last_check < self.lease_seconds:
+            return self._leader
+        async with self._lock:
+            if time.monotonic() - self._last_check < self.lease_seconds:
+                return self._leader
+            was_leader = self._leader
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    self._leader = False
+                    self._conn = await self._connect()
+                if self._leader:
+                    # 心跳：确认持锁会话仍然存活
+                    await self._conn.fetchval("SELECT 1", timeout=self.lease_seconds)
+                else:
+                    self._leader = bool(
+                        await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key, timeout=self.lease_seconds)
+                    )
+            except Exception as e:
+                logger.warning("leader election check failed: %s", e)
+                self._leader = False
+                self._drop_connection()
+            finally:
+                self._last_check = time.monotonic()
+            if self._leader != was_leader:
+                logger.info("broadcast leadership %s", "acquired" if self._leader else "lost")
+            return self._leader
+
+    async def close(self) -> None:
+        self._leader = False
+        if self._conn is not None:
+            try:
+                await self._conn.close(timeout=self.lease_seconds)
+            except Exception:
+                self._drop_connection()
+            self._conn = None
+
+
+class _StandaloneLeader:
+    """单实例模式：始终为主节点"""
+
+    leader = True
+
+    async def is_leader(self) -> bool:
+        return True
+
+    async def close(self) -> None:
+        return None
+
+
+if COORDINATION_MODE == "postgres":
+    broadcast_state: BroadcastState = PostgresBroadcastState(COORDINATION_DSN)
+    leader_election = LeaderElection(COORDINATION_DSN, LEADER_LOCK_KEY, LEADER_LEASE_SECONDS)
+else:
+    if COORDINATION_MODE:
+        logger.warning("unknown COORDINATION_MODE %r, running standalone", COORDINATION_MODE)
+    broadcast_state = BroadcastState()
+    leader_election = _StandaloneLeader()
+
+
+async def close_coordination() -> None:
+    """释放主节点锁并关闭协调连接"""
+    await leader_election.close()
+    await broadcast_state.close()
@@ -1,286 +1,907 @@
 """
 数据库操作模块
+所有查询都在语句注册表中登记，连接池中的每个长连接对每条语句只准备一次并复用执行计划
 """
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
 import asyncpg
-from .config import POSTGRES_DSN, TARGET_GAME_ID
+from .config import (
+    DB_WARM_STATEMENTS,
+    REPLICA_HEALTH_CHECK_SECONDS,
+    REPLICA_MAX_LAG_SECONDS,
+    BotConfig,
+    get_config,
+    on_config_change,
+)
+
+logger = logging.getLogger(__name__)
+
+# 流式读取排行榜时每次从服务端游标预取的行数
+RANKING_PREFETCH = 50
+
+
+GAME_TITLE_QUERY = 'SELECT "Title" FROM "Games" WHERE "Id" = $1'
+
+GAME_WINDOW_QUERY = 'SELECT "StartTimeUtc", "EndTimeUtc" FROM "Games" WHERE "Id" = $1'
+
+GAME_CHALLENGES_QUERY = 'SELECT "Title", "Category", "OriginalScore" FROM "GameChallenges" WHERE "GameId" = $1 AND "IsEnabled" = TRUE ORDER BY "Id" DESC'
+
+# 总排行榜查询
+RANKING_QUERY = """
+-- 按每队每题只计一次（取最早 Accepted），同分时按最后被记分时间升序排列（越早越靠前）
+WITH first_accept_per_part AS (
+    SELECT
+        s."ParticipationId",
+        s."ChallengeId",
+        MIN(s."SubmitTimeUtc") AS first_time
+    FROM "Submissions" s
+    WHERE s."GameId" = $1
+    AND s."Status" = 'Accepted'
+    GROUP BY s."ParticipationId", s."ChallengeId"
+),
+accepted_per_team AS (
+    SELECT
+        p."TeamId",
+        f."ChallengeId",
+        f.first_time
+    FROM "Participations" p
+    JOIN first_accept_per_part f ON f."ParticipationId" = p."Id"
+    WHERE p."GameId" = $1
+    AND p."Status" = 1
+),
+team_scores AS (
+    SELECT
+        t."Name" AS teamname,
+        t."Id" AS teamid,
+        COALESCE(SUM(gc."OriginalScore"::integer), 0) AS totalscore,
+        -- 团队的最后被记分时间：所有被记分题目的最晚 first_time
+        MAX(apt.first_time) AS lastacceptedsubmission
+    FROM "Teams" t
+    JOIN "Participations" p ON p."TeamId" = t."Id" AND p."GameId" = $1 AND p."Status" = 1
+    LEFT JOIN (
+        SELECT DISTINCT "TeamId", "ChallengeId", first_time FROM accepted_per_team
+    ) apt ON apt."TeamId" = t."Id"
+    LEFT JOIN "GameChallenges" gc ON gc."Id" = apt."ChallengeId"
+    GROUP BY t."Name", t."Id"
+    HAVING SUM(COALESCE(gc."OriginalScore"::integer, 0)) > 0
+),
+ranked_teams AS (
+    SELECT
+        teamname,
+        teamid,
+        totalscore,
+        lastacceptedsubmission,
+        ROW_NUMBER() OVER (
+            ORDER BY totalscore DESC,
+                    lastacceptedsubmission ASC NULLS LAST,
+                    teamname ASC
+        ) AS rank
+    FROM team_scores
+)
+SELECT
+    rt.rank,
+    rt.teamname,
+    rt.totalscore,
+    STRING_AGG(DISTINCT u."StdNumber", ', ' ORDER BY u."StdNumber") AS studentnumbers
+FROM ranked_teams rt
+JOIN "Participations" p ON p."TeamId" = rt.teamid AND p."GameId" = $1
+JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
+JOIN "AspNetUsers" u ON u."Id" = up."UserId"
+GROUP BY rt.rank, rt.teamname, rt.totalscore, rt.lastacceptedsubmission
+ORDER BY rt.rank;
+"""
+
+
+# 按学号前缀过滤的排行榜查询（任一成员学号命中前缀即可）
+RANKING_BY_PREFIX_QUERY = """
+WITH first_accept_per_part AS (
+    -- 每个参与(Participation)对每题的最早 Accepted
+    SELECT
+        s."ParticipationId",
+        s."ChallengeId",
+        MIN(s."SubmitTimeUtc") AS first_time
+    FROM "Submissions" s
+    WHERE s."GameId" = $1
+    AND s."Status" = 'Accepted'
+    GROUP BY s."ParticipationId", s."ChallengeId"
+),
+accepted_per_team_raw AS (
+    -- 关联到队伍，仅统计已被接受的参赛资格
+    SELECT
+        p."TeamId",
+        f."ChallengeId",
+        f.first_time
+    FROM first_accept_per_part f
+    JOIN "Participations" p ON p."Id" = f."ParticipationId"
+    WHERE p."GameId" = $1
+    AND p."Status" = 1
+),
+accepted_per_team AS (
+    -- 防御性去重（同队同题合并为一次，取最早时间）
+    SELECT
+        "TeamId",
+        "ChallengeId",
+        MIN(first_time) AS first_time
+    FROM accepted_per_team_raw
+    GROUP BY "TeamId", "ChallengeId"
+),
+team_scores AS (
+    -- 计算总分与最后一次被记分时间（用于同分排序）
+    SELECT
+        t."Name" AS teamname,
+        t."Id"   AS teamid,
+        COALESCE(SUM(gc."OriginalScore"::integer), 0) AS totalscore,
+        MAX(a.first_time) AS lastacceptedsubmission
+    FROM "Teams" t
+    JOIN "Participations" p ON p."TeamId" = t."Id" AND p."GameId" = $1 AND p."Status" = 1
+    LEFT JOIN accepted_per_team a ON a."TeamId" = t."Id"
+    LEFT JOIN "GameChallenges" gc ON gc."Id" = a."ChallengeId" AND gc."GameId" = $1
+    GROUP BY t."Name", t."Id"
+    HAVING SUM(COALESCE(gc."OriginalScore"::integer, 0)) > 0
+),
+filtered_teams AS (
+    -- 按学号前缀过滤队伍（任一成员命中即可）
+    SELECT DISTINCT
+        ts.teamid,
+        ts.teamname,
+        ts.totalscore,
+        ts.lastacceptedsubmission
+    FROM team_scores ts
+    JOIN "Participations" p ON p."TeamId" = ts.teamid AND p."GameId" = $1
+    JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
+    JOIN "AspNetUsers" u ON u."Id" = up."UserId"
+    WHERE u."StdNumber" LIKE ($2 || '%')
+),
+ranked_teams AS (
+    SELECT
+        teamname,
+        teamid,
+        totalscore,
+        lastacceptedsubmission,
+        ROW_NUMBER() OVER (
+            ORDER BY totalscore DESC,
+                    lastacceptedsubmission ASC NULLS LAST,
+                    teamname ASC
+        ) AS rank
+    FROM filtered_teams
+)
+SELECT
+    rt.rank,
+    rt.teamname,
+    rt.totalscore,
+    STRING_AGG(DISTINCT u."StdNumber", ', ' ORDER BY u."StdNumber") AS studentnumbers
+FROM ranked_teams rt
+JOIN "Participations" p ON p."TeamId" = rt.teamid AND p."GameId" = $1
+JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
+JOIN "AspNetUsers" u ON u."Id" = up."UserId"
+GROUP BY rt.rank, rt.teamname, rt.totalscore, rt.lastacceptedsubmission
+ORDER BY rt.rank;
+"""
+
+
+RECENT_NOTICES_QUERY = """
+SELECT 
+    gn."Id",
+    gn."Type",
+    gn."Values",
+    gn."PublishTimeUtc",
+    CASE gn."Type"
+        WHEN 0 THEN '📢 公告通知'
+        WHEN 1 THEN '🥇 一血通知'
+        WHEN 2 THEN '🥈 二血通知'
+        WHEN 3 THEN '🥉 三血通知'
+        WHEN 4 THEN '💡 提示更新'
+        WHEN 5 THEN '🆕 新题目开放'
+        ELSE '❓ 未知类型'
+    END as notice_type
+FROM "GameNotices" gn
+WHERE gn."GameId" = $1
+  AND gn."PublishTimeUtc" > $2
+ORDER BY gn."PublishTimeUtc" DESC;
+"""
+
+# 题目标题索引使用的全部题目（含未启用的，题目启用时会发出新题目通知）
+CHALLENGE_TITLES_QUERY = 'SELECT "Id", "Title", "Category", "IsEnabled" FROM "GameChallenges" WHERE "GameId" = $1'
+
+# 按通知ID水位线增量获取赛事通知（升序）
+NOTICES_SINCE_QUERY = """
+SELECT 
+    gn."Id",
+    gn."Type",
+    gn."Values",
+    gn."PublishTimeUtc",
+    CASE gn."Type"
+        WHEN 0 THEN '📢 公告通知'
+        WHEN 1 THEN '🥇 一血通知'
+        WHEN 2 THEN '🥈 二血通知'
+        WHEN 3 THEN '🥉 三血通知'
+        WHEN 4 THEN '💡 提示更新'
+        WHEN 5 THEN '🆕 新题目开放'
+        ELSE '❓ 未知类型'
+    END as notice_type
+FROM "GameNotices" gn
+WHERE gn."GameId" = $1
+  AND gn."Id" > $2
+ORDER BY gn."Id";
+"""
+
+# 最新的若干条通知（按ID降序），用于首次填充而不必读取整场比赛的通知
+LATEST_NOTICES_QUERY = """
+SELECT 
+    gn."Id",
+    gn."Type",
+    gn."Values",
+    gn."PublishTimeUtc",
+    CASE gn."Type"
+        WHEN 0 THEN '📢 公告通知'
+        WHEN 1 THEN '🥇 一血通知'
+        WHEN 2 THEN '🥈 二血通知'
+        WHEN 3 THEN '🥉 三血通知'
+        WHEN 4 THEN '💡 提示更新'
+        WHEN 5 THEN '🆕 新题目开放'
+        ELSE '❓ 未知类型'
+    END as notice_type
+FROM "GameNotices" gn
+WHERE gn."GameId" = $1
+ORDER BY gn."Id" DESC
+LIMIT $2;
+"""
+
+LATEST_NOTICE_ID_QUERY = 'SELECT COALESCE(MAX("Id"), 0) FROM "GameNotices" WHERE "GameId" = $1'
+
+LATEST_SUBMISSION_ID_QUERY = 'SELECT COALESCE(MAX("Id"), 0) FROM "Submissions" WHERE "GameId" = $1'
+
+# 截至某个提交ID为止，每道题按首次 Accepted 顺序的前三支队伍
+FIRST_SOLVERS_QUERY = """
+WITH firsts AS (
+    SELECT
+        p."TeamId",
+        s."ChallengeId",
+        MIN(s."Id") AS first_id
+    FROM "Submissions" s
+    JOIN "Participations" p ON p."Id" = s."ParticipationId" AND p."GameId" = $1 AND p."Status" = 1
+    WHERE s."GameId" = $1
+      AND s."Status" = 'Accepted'
+      AND s."Id" <= $2
+    GROUP BY p."TeamId", s."ChallengeId"
+),
+ranked AS (
+    SELECT
+        "TeamId",
+        "ChallengeId",
+        ROW_NUMBER() OVER (PARTITION BY "ChallengeId" ORDER BY first_id) AS place
+    FROM firsts
+)
+SELECT "ChallengeId", "TeamId", place
+FROM ranked
+WHERE place <= 3
+ORDER BY "ChallengeId", place;
+"""
+
+# 按提交ID水位线增量获取 Accepted 提交（仅统计已通过审核的参赛队伍）
+ACCEPTED_SUBMISSIONS_SINCE_QUERY = """
+SELECT
+    s."Id",
+    p."TeamId",
+    t."Name" AS teamname,
+    s."ChallengeId",
+    gc."OriginalScore"::integer AS score,
+    gc."Title" AS challenge,
+    gc."Category",
+    s."SubmitTimeUtc"
+FROM "Submissions" s
+JOIN "Participations" p ON p."Id" = s."ParticipationId" AND p."GameId" = $1 AND p."Status" = 1
+JOIN "Teams" t ON t."Id" = p."TeamId"
+JOIN "GameChallenges" gc ON gc."Id" = s."ChallengeId" AND gc."GameId" = $1
+WHERE s."GameId" = $1
+  AND s."Status" = 'Accepted'
+  AND s."Id" > $2
+ORDER BY s."Id"
+LIMIT $3;
+"""
+
+
+# ==================== 语句注册表 ====================
+
+# 语句名 -> SQL，连接初始化时按此表预先准备
+STATEMENTS: Dict[str, str] = {
+    "game_title": GAME_TITLE_QUERY,
+    "game_window": GAME_WINDOW_QUERY,
+    "game_challenges": GAME_CHALLENGES_QUERY,
+    "ranking": RANKING_QUERY,
+    "ranking_by_prefix": RANKING_BY_PREFIX_QUERY,
+    "recent_notices": RECENT_NOTICES_QUERY,
+    "notices_since": NOTICES_SINCE_QUERY,
+    "latest_notices": LATEST_NOTICES_QUERY,
+    "latest_notice_id": LATEST_NOTICE_ID_QUERY,
+    "latest_submission_id": LATEST_SUBMISSION_ID_QUERY,
+    "first_solvers": FIRST_SOLVERS_QUERY,
+    "challenge_titles": CHALLENGE_TITLES_QUERY,
+    "accepted_submissions_since": ACCEPTED_SUBMISSIONS_SINCE_QUERY,
+}
+
+# 可以路由到只读副本的重查询（排行榜与统计类）；通知相关查询对延迟敏感，始终走主库
+REPLICA_STATEMENTS = {"game_challenges", "ranking", "ranking_by_prefix", "accepted_submissions_since"}
+
+# 扫描整场比赛提交的重查询：使用 db_heavy_query_timeout_seconds，超时不计入熔断
+HEAVY_STATEMENTS = {"ranking", "ranking_by_prefix"}
+
+
+def _timeout_of(name: str) -> int:
+    config = get_config()
+    return config.db_heavy_query_timeout_seconds if name in HEAVY_STATEMENTS else config.db_query_timeout_seconds
+
+
+@dataclass
+class StatementStats:
+    """单条语句的准备（解析与规划）和执行耗时统计"""
+    prepare_count: int = 0
+    prepare_seconds: float = 0.0
+    execute_count: int = 0
+    execute_seconds: float = 0.0
+
+    @property
+    def avg_prepare_ms(self) -> float:
+        return self.prepare_seconds * 1000 / self.prepare_count if self.prepare_count else 0.0
+
+    @property
+    def avg_execute_ms(self) -> float:
+        return self.execute_seconds * 1000 / self.execute_count if self.execute_count else 0.0
+
+
+_statement_stats: Dict[str, StatementStats] = {name: StatementStats() for name in STATEMENTS}
+
+
+class _RegistryConnection(asyncpg.Connection):
+    """缓存已准备语句的连接类型，语句随连接一起销毁"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._bot_statements: Dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+
+
+async def _prepare(conn: _RegistryConnection, name: str) -> asyncpg.prepared_stmt.PreparedStatement:
+    """获取连接上已准备的语句，首次使用时准备并记录耗时"""
+    statements = conn._bot_statements
+    stmt = statements.get(name)
+    if stmt is None:
+        started = time.perf_counter()
+        stmt = await conn.prepare(STATEMENTS[name])
+        stats = _statement_stats[name]
+        stats.prepare_count += 1
+        stats.prepare_seconds += time.perf_counter() - started
+        statements[name] = stmt
+    return stmt
+
+
+class ConnectionPool:
+    """简单的长连接池
+
+    与 asyncpg.Pool 不同，连接归还时不做重置，已准备语句因此可以在多次借用之间复用。
+    出现连接级错误或被取消的连接会直接丢弃，下次借用时重新建立。
+    """
+
+    def __init__(self, dsn: str, min_size: int, max_size: int, warm_statements: bool = True):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.warm_statements = warm_statements and DB_WARM_STATEMENTS
+        self._idle: List[_RegistryConnection] = []
+        self._slots = asyncio.Semaphore(max_size)
+        self._closed = False
+
+    async def _connect(self) -> _RegistryConnection:
+        conn = await asyncpg.connect(self.dsn, connection_class=_RegistryConnection)
+        try:
+            if self.warm_statements:
+                # 新连接预先准备全部语句
+                for name in STATEMENTS:
+                    await _prepare(conn, name)
+        except BaseException:
+            conn.terminate()
+            raise
+        return conn
+
+    async def warm(self) -> None:
+        """预先建立 min_size 个连接"""
+        missing = self.min_size - len(self._idle)
+        if missing > 0:
+            conns = await asyncio.gather(*(self._connect() for _ in range(missing)))
+            self._idle.extend(conns)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[_RegistryConnection]:
+        if self._closed:
+            raise asyncpg.InterfaceError("connection pool is closed")
+        await self._slots.acquire()
+        conn: Optional[_RegistryConnection] = None
+        reusable = False
+        try:
+            while self._idle and conn is None:
+                candidate = self._idle.pop()
+                if not candidate.is_closed():
+                    conn = candidate
+            if conn is None:
+                conn = await self._connect()
+            try:
+                yield conn
+                reusable = True
+            except (asyncio.CancelledError, asyncpg.InterfaceError, asyncpg.PostgresConnectionError, OSError):
+                raise
+            except Exception:
+                # 普通查询错误不影响连接本身
+                reusable = True
+                raise
+        finally:
+            if conn is not None:
+                if reusable and not self._closed and not conn.is_closed() and not conn.is_in_transaction():
+                    self._idle.append(conn)
+                else:
+                    conn.terminate()
+            self._slots.release()
+
+    async def close(self) -> None:
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
+
+
+# 副本不可用时需要回退到主库的错误：连接失败、超时、与复制回放冲突而被取消等
+_REPLICA_FALLBACK_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.QueryCanceledError,
+    asyncpg.SerializationError,
+)
+
+# 计入熔断的错误：数据库不可达、超时或过载；语法、约束等普通查询错误说明数据库可达，不计入
+_UNAVAILABLE_ERRORS = _REPLICA_FALLBACK_ERRORS + (asyncpg.TooManyConnectionsError,)
+
+# 查询超时（客户端超时或服务端 statement_timeout 取消）
+_TIMEOUT_ERRORS = (asyncio.TimeoutError, asyncpg.QueryCanceledError)
+
+
+class DatabaseUnavailable(Exception):
+    """主库熔断期间查询立即失败，不再等待超时"""
+
+
+class CircuitBreaker:
+    """主库熔断器
+
+    closed：正常放行，连续失败达到阈值后打开；
+    open：查询立即抛出 DatabaseUnavailable，冷却时间过后转为 half_open；
+    half_open：只放行一个试探查询，成功则关闭，失败则重新打开并重新计时。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self.rejected = 0
+        self._probing = False
+
+    @property
+    def available(self) -> bool:
+        """当前是否会放行查询（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+        return not self._probing
+
+    def _before_call(self) -> None:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            logger.info("database breaker half-open, probing")
+        if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probing):
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise DatabaseUnavailable(f"数据库暂时不可用（{self.last_error}），约 {retry_in:.0f} 秒后重试")
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+
+    def _record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("database breaker closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def _record_failure(self, error: BaseException) -> None:
+        self.last_error = str(error) or type(error).__name__
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("database breaker opened after %d failures: %s", self.failures, self.last_error)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    @contextmanager
+    def guard(self, count_timeouts: bool = True):
+        """包裹一次主库访问：熔断时立即失败，并按结果更新状态
+
+        count_timeouts 为 False 时超时既不计为失败也不计为成功（用于本身就慢的重查询）。
+        """
+        self._before_call()
+        try:
+            yield
+        except _TIMEOUT_ERRORS as e:
+            if count_timeouts:
+                self._record_failure(e)
+            else:
+                self._probing = False
+            raise
+        except _UNAVAILABLE_ERRORS as e:
+            self._record_failure(e)
+            raise
+        except Exception:
+            self._record_success()
+            raise
+        except BaseException:
+            # 调用方取消，不能说明数据库状态
+            self._probing = False
+            raise
+        else:
+            self._record_success()
+
+    def reset(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def status(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected, "error": self.last_error}
+
+
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN pg_is_in_recovery() THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    ELSE 0
+END AS lag
+"""
+
+
+class Replica:
+    """一个只读副本及其健康状态"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.pool = ConnectionPool(dsn, 0, get_config().db_pool_max_size)
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.last_checked = 0.0
+        self.last_error: Optional[str] = None
+        self._checking = False
+
+    def mark_unhealthy(self, error: BaseException) -> None:
+        if self.healthy:
+            logger.warning("replica %s marked unhealthy: %s", _redact(self.dsn), error)
+        self.healthy = False
+        self.last_error = str(error) or type(error).__name__
+        self.last_checked = time.monotonic()
+
+    async def check(self) -> None:
+        """健康检查：能连通且复制延迟不超过 REPLICA_MAX_LAG_SECONDS"""
+        self._checking = True
+        try:
+            conn = await asyncpg.connect(self.dsn, timeout=5)
+            try:
+                lag = float(await conn.fetchval(REPLICA_LAG_QUERY, timeout=5) or 0)
+            finally:
+                await conn.close()
+            self.lag = lag
+            healthy = lag <= REPLICA_MAX_LAG_SECONDS
+            if healthy != self.healthy:
+                logger.info("replica %s healthy=%s (lag %.1fs)", _redact(self.dsn), healthy, lag)
+            self.healthy = healthy
+            self.last_error = None if healthy else f"复制延迟 {lag:.1f}s"
+        except Exception as e:
+            self.mark_unhealthy(e)
+        finally:
+            self.last_checked = time.monotonic()
+            self._checking = False
+
+    def schedule_check(self) -> None:
+        """健康检查过期时在后台发起一次检查"""
+        if not self._checking and time.monotonic() - self.last_checked >= REPLICA_HEALTH_CHECK_SECONDS:
+            self._checking = True
+            asyncio.get_running_loop().create_task(self.check())
+
+
+def _redact(dsn: str) -> str:
+    """日志中隐藏连接串里的密码"""
+    if "@" not in dsn:
+        return dsn
+    prefix, host = dsn.rsplit("@", 1)
+    scheme = prefix.split("://", 1)[0]
+    return f"{scheme}://***@{host}"
+
+
+_pool: Optional[ConnectionPool] = None
+_replicas: List[Replica] = [Replica(dsn) for dsn in get_config().replica_dsns]
+_replica_cursor = 0
+_breaker = CircuitBreaker(get_config().db_breaker_failures, get_config().db_breaker_reset_seconds)
+
+
+@on_config_change("db_breaker_failures", "db_breaker_reset_seconds")
+async def _apply_breaker_settings(old: BotConfig, new: BotConfig) -> None:
+    """新的熔断阈值与冷却时间直接作用于当前熔断器，不改变其状态"""
+    _breaker.failure_threshold = new.db_breaker_failures
+    _breaker.reset_seconds = new.db_breaker_reset_seconds
+
+
+async def get_pool() -> ConnectionPool:
+    """获取（必要时创建）主库连接池"""
+    global _pool
+    if _pool is None:
+        config = get_config()
+        _pool = ConnectionPool(config.postgres_dsn, config.db_pool_min_size, config.db_pool_max_size)
+    return _pool
+
+
+def _pick_replica() -> Optional[Replica]:
+    """轮询选择一个健康的副本，没有可用副本时返回 None"""
+    global _replica_cursor
+    for replica in _replicas:
+        replica.schedule_check()
+    for _ in range(len(_replicas)):
+        replica = _replicas[_replica_cursor % len(_replicas)]
+        _replica_cursor += 1
+        if replica.healthy:
+            return replica
+    return None
+
+
+def is_database_available() -> bool:
+    """主库熔断器当前是否放行查询"""
+    return _breaker.available
+
+
+def get_breaker_status() -> Dict[str, object]:
+    """返回主库熔断器状态"""
+    return _breaker.status()
+
+
+def get_replica_status() -> List[Dict[str, object]]:
+    """返回各副本的健康状态"""
+    return [
+        {"dsn": _redact(r.dsn), "healthy": r.healthy, "lag": r.lag, "error": r.last_error}
+        for r in _replicas
+    ]
+
+
+async def close_pool() -> None:
+    """关闭主库与副本连接池"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+    for replica in _replicas:
+        await replica.pool.close()
+        replica.pool = ConnectionPool(replica.dsn, 0, get_config().db_pool_max_size)
+
+
+@on_config_change("postgres_dsn", "db_pool_min_size", "db_pool_max_size", "replica_dsns")
+async def _swap_pools(old: BotConfig, new: BotConfig) -> None:
+    """数据库配置变化时换上新的连接池：新请求立即使用新池，旧池中执行中的查询完成后随归还关闭"""
+    global _pool, _replicas
+    retired: List[ConnectionPool] = []
+    primary = ("postgres_dsn", "db_pool_min_size", "db_pool_max_size")
+    if any(getattr(old, f) != getattr(new, f) for f in primary):
+        # 新的主库重新开始计算失败次数
+        _breaker.reset()
+        if _pool is not None:
+            retired.append(_pool)
+            _pool = None
+    if (old.replica_dsns, old.db_pool_max_size) != (new.replica_dsns, new.db_pool_max_size):
+        retired.extend(replica.pool for replica in _replicas)
+        _replicas = [Replica(dsn) for dsn in new.replica_dsns]
+    for pool in retired:
+        await pool.close()
+
+
+# 换库时需要丢弃的进程内状态（各模块按比赛ID保存的缓存、索引等）的清理函数
+_reset_callbacks: List[Callable[[], None]] = []
+
+
+def on_database_reset(callback: Callable[[], None]) -> Callable[[], None]:
+    """登记换库时调用的清理函数（无参数）；状态在下次使用时从新库重建"""
+    _reset_callbacks.append(callback)
+    return callback
+
+
+@on_config_change("postgres_dsn")
+async def _reset_database_state(old: BotConfig, new: BotConfig) -> None:
+    """换库后旧库读出的数据全部作废"""
+    for callback in _reset_callbacks:
+        callback()
+
+
+def get_statement_stats() -> Dict[str, StatementStats]:
+    """返回各语句的准备与执行耗时统计"""
+    return dict(_statement_stats)
+
+
+async def _run(pool: ConnectionPool, method: str, name: str, *args):
+    async with pool.acquire() as conn:
+        stmt = await _prepare(conn, name)
+        started = time.perf_counter()
+        result = await getattr(stmt, method)(*args)
+        stats = _statement_stats[name]
+        stats.execute_count += 1
+        stats.execute_seconds += time.perf_counter() - started
+        return result
+
+
+async def _execute(method: str, name: str, *args, allow_replica: bool = True):
+    """执行已注册语句，method 为 fetch / fetchrow / fetchval
+
+    重查询优先路由到健康的副本，副本出错或超时时标记为不健康并回退到主库；
+    allow_replica 为 False 时强制走主库（用于对延迟敏感的调用方）。
+    主库访问经过熔断器，每次查询（含借用连接）不超过 db_query_timeout_seconds，
+    重查询不超过 db_heavy_query_timeout_seconds 且超时不计入熔断。
+    """
+    timeout = _timeout_of(name)
+    if allow_replica and name in REPLICA_STATEMENTS:
+        replica = _pick_replica()
+        if replica is not None:
+            try:
+                async with asyncio.timeout(timeout):
+                    return await _run(replica.pool, method, name, *args)
+            except _REPLICA_FALLBACK_ERRORS as e:
+                replica.mark_unhealthy(e)
+    with _breaker.guard(count_timeouts=name not in HEAVY_STATEMENTS):
+        async with asyncio.timeout(timeout):
+            return await _run(await get_pool(), method, name, *args)
+
+
+@asynccontextmanager
+async def _stream_statement(name: str, *args) -> AsyncIterator[asyncpg.cursor.CursorFactory]:
+    """在只读事务中以已注册语句打开服务端游标，调用方提前停止迭代时游标随事务一起关闭
+
+    副本只在打开游标之前出错时回退到主库；执行耗时包含调用方消费游标的时间。
+    打开游标与每次预取分别不超过该语句的超时时间，走主库时整个读取过程经过熔断器（重查询超时不计入）。
+    """
+    timeout = _timeout_of(name)
+    async with AsyncExitStack() as stack:
+        conn = None
+        replica = _pick_replica() if name in REPLICA_STATEMENTS else None
+        if replica is not None:
+            try:
+                async with asyncio.timeout(timeout):
+                    conn = await stack.enter_async_context(replica.pool.acquire())
+                    stmt = await _prepare(conn, name)
+            except _REPLICA_FALLBACK_ERRORS as e:
+                replica.mark_unhealthy(e)
+                await stack.aclose()
+                conn = None
+        if conn is None:
+            stack.enter_context(_breaker.guard(count_timeouts=name not in HEAVY_STATEMENTS))
+            async with asyncio.timeout(timeout):
+                conn = await stack.enter_async_context((await get_pool()).acquire())
+                stmt = await _prepare(conn, name)
+
+        started = time.perf_counter()
+        try:
+            async with conn.transaction(readonly=True):
+                yield stmt.cursor(*args, prefetch=RANKING_PREFETCH, timeout=timeout)
+        finally:
+            stats = _statement_stats[name]
+            stats.execute_count += 1
+            stats.execute_seconds += time.perf_counter() - started
 
 
+# ==================== 查询函数 ====================
+
 async def get_game_title(game_id: int) -> str:
     """根据赛事ID获取赛事标题"""
-    conn = await asyncpg.connect(POSTGRES_DSN)
-    try:
-        game_record = await conn.fetchrow('SELECT "Title" FROM "Games" WHERE "Id" = $1', game_id)
-        if not game_record:
-            raise ValueError(f"未找到ID为 {game_id} 的比赛")
-        return game_record['Title']
-    finally:
-        await conn.close()
+    game_record = await _execute("fetchrow", "game_title", game_id)
+    if not game_record:
+        raise ValueError(f"未找到ID为 {game_id} 的比赛")
+    return game_record['Title']
+
+
+async def get_game_window(game_id: int):
+    """获取比赛的开始与结束时间（UTC），比赛不存在时返回 None"""
+    record = await _execute("fetchrow", "game_window", game_id)
+    if not record:
+        return None
+    return record["StartTimeUtc"], record["EndTimeUtc"]
 
 
 async def get_game_challenges(game_id: int):
     """获取比赛题目列表"""
-    conn = await asyncpg.connect(POSTGRES_DSN)
-    try:
-        rows = await conn.fetch(
-            'SELECT "Title", "Category", "OriginalScore" FROM "GameChallenges" WHERE "GameId" = $1 AND "IsEnabled" = TRUE ORDER BY "Id" DESC',
-            game_id
-        )
-        return rows
-    finally:
-        await conn.close()
+    return await _execute("fetch", "game_challenges", game_id)
 
 
 async def get_game_rankings(game_id: int):
     """获取比赛排行榜"""
-    conn = await asyncpg.connect(POSTGRES_DSN)
-    try:
-        # 最简化的查询，只获取排名、团队名、总分和学号
-        query = """
-        -- 按每队每题只计一次（取最早 Accepted），同分时按最后被记分时间升序排列（越早越靠前）
-        WITH first_accept_per_part AS (
-            SELECT
-                s."ParticipationId",
-                s."ChallengeId",
-                MIN(s."SubmitTimeUtc") AS first_time
-            FROM "Submissions" s
-            WHERE s."GameId" = $1
-            AND s."Status" = 'Accepted'
-            GROUP BY s."ParticipationId", s."ChallengeId"
-        ),
-        accepted_per_team AS (
-            SELECT
-                p."TeamId",
-                f."ChallengeId",
-                f.first_time
-            FROM "Participations" p
-            JOIN first_accept_per_part f ON f."ParticipationId" = p."Id"
-            WHERE p."GameId" = $1
-            AND p."Status" = 1
-        ),
-        team_scores AS (
-            SELECT
-                t."Name" AS teamname,
-                t."Id" AS teamid,
-                COALESCE(SUM(gc."OriginalScore"::integer), 0) AS totalscore,
-                -- 团队的最后被记分时间：所有被记分题目的最晚 first_time
-                MAX(apt.first_time) AS lastacceptedsubmission
-            FROM "Teams" t
-            JOIN "Participations" p ON p."TeamId" = t."Id" AND p."GameId" = $1 AND p."Status" = 1
-            LEFT JOIN (
-                SELECT DISTINCT "TeamId", "ChallengeId", first_time FROM accepted_per_team
-            ) apt ON apt."TeamId" = t."Id"
-            LEFT JOIN "GameChallenges" gc ON gc."Id" = apt."ChallengeId"
-            GROUP BY t."Name", t."Id"
-            HAVING SUM(COALESCE(gc."OriginalScore"::integer, 0)) > 0
-        ),
-        ranked_teams AS (
-            SELECT
-                teamname,
-                teamid,
-                totalscore,
-                lastacceptedsubmission,
-                ROW_NUMBER() OVER (
-                    ORDER BY totalscore DESC,
-                            lastacceptedsubmission ASC NULLS LAST,
-                            teamname ASC
-                ) AS rank
-            FROM team_scores
-        )
-        SELECT
-            rt.rank,
-            rt.teamname,
-            rt.totalscore,
-            STRING_AGG(DISTINCT u."StdNumber", ', ' ORDER BY u."StdNumber") AS studentnumbers
-        FROM ranked_teams rt
-        JOIN "Participations" p ON p."TeamId" = rt.teamid AND p."GameId" = $1
-        JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
-        JOIN "AspNetUsers" u ON u."Id" = up."UserId"
-        GROUP BY rt.rank, rt.teamname, rt.totalscore, rt.lastacceptedsubmission
-        ORDER BY rt.rank;
-        """
-        rows = await conn.fetch(query, game_id)
-        return rows
-    finally:
-        await conn.close()
+    return await _execute("fetch", "ranking", game_id)
 
 
 async def get_game_rankings_by_stdnum_prefix(game_id: int, stdnum_prefix: str):
     """获取按学号前缀过滤的比赛排行榜"""
-    conn = await asyncpg.connect(POSTGRES_DSN)
-    try:
-        # 查询指定学号前缀的队伍排行榜
-        query = """
-        WITH first_accept_per_part AS (
-            -- 每个参与(Participation)对每题的最早 Accepted
-            SELECT
-                s."ParticipationId",
-                s."ChallengeId",
-                MIN(s."SubmitTimeUtc") AS first_time
-            FROM "Submissions" s
-            WHERE s."GameId" = $1
-            AND s."Status" = 'Accepted'
-            GROUP BY s."ParticipationId", s."ChallengeId"
-        ),
-        accepted_per_team_raw AS (
-            -- 关联到队伍，仅统计已被接受的参赛资格
-            SELECT
-                p."TeamId",
-                f."ChallengeId",
-                f.first_time
-            FROM first_accept_per_part f
-            JOIN "Participations" p ON p."Id" = f."ParticipationId"
-            WHERE p."GameId" = $1
-            AND p."Status" = 1
-        ),
-        accepted_per_team AS (
-            -- 防御性去重（同队同题合并为一次，取最早时间）
-            SELECT
-                "TeamId",
-                "ChallengeId",
-                MIN(first_time) AS first_time
-            FROM accepted_per_team_raw
-            GROUP BY "TeamId", "ChallengeId"
-        ),
-        team_scores AS (
-            -- 计算总分与最后一次被记分时间（用于同分排序）
-            SELECT
-                t."Name" AS teamname,
-                t."Id"   AS teamid,
-                COALESCE(SUM(gc."OriginalScore"::integer), 0) AS totalscore,
-                MAX(a.first_time) AS lastacceptedsubmission
-            FROM "Teams" t
-            JOIN "Participations" p ON p."TeamId" = t."Id" AND p."GameId" = $1 AND p."Status" = 1
-            LEFT JOIN accepted_per_team a ON a."TeamId" = t."Id"
-            LEFT JOIN "GameChallenges" gc ON gc."Id" = a."ChallengeId" AND gc."GameId" = $1
-            GROUP BY t."Name", t."Id"
-            HAVING SUM(COALESCE(gc."OriginalScore"::integer, 0)) > 0
-        ),
-        filtered_teams AS (
-            -- 按学号前缀过滤队伍（任一成员命中即可）
-            SELECT DISTINCT
-                ts.teamid,
-                ts.teamname,
-                ts.totalscore,
-                ts.lastacceptedsubmission
-            FROM team_scores ts
-            JOIN "Participations" p ON p."TeamId" = ts.teamid AND p."GameId" = $1
-            JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
-            JOIN "AspNetUsers" u ON u."Id" = up."UserId"
-            WHERE u."StdNumber" LIKE ($2 || '%')
-        ),
-        ranked_teams AS (
-            SELECT
-                teamname,
-                teamid,
-                totalscore,
-                lastacceptedsubmission,
-                ROW_NUMBER() OVER (
-                    ORDER BY totalscore DESC,
-                            lastacceptedsubmission ASC NULLS LAST,
-                            teamname ASC
-                ) AS rank
-            FROM filtered_teams
-        )
-        SELECT
-            rt.rank,
-            rt.teamname,
-            rt.totalscore,
-            STRING_AGG(DISTINCT u."StdNumber", ', ' ORDER BY u."StdNumber") AS studentnumbers
-        FROM ranked_teams rt
-        JOIN "Participations" p ON p."TeamId" = rt.teamid AND p."GameId" = $1
-        JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
-        JOIN "AspNetUsers" u ON u."Id" = up."UserId"
-        GROUP BY rt.rank, rt.teamname, rt.totalscore, rt.lastacceptedsubmission
-        ORDER BY rt.rank;
-        """
-        rows = await conn.fetch(query, game_id, stdnum_prefix)
-        return rows
-    finally:
-        await conn.close()
+    return await _execute("fetch", "ranking_by_prefix", game_id, stdnum_prefix)
+
+
+def stream_game_rankings(game_id: int):
+    """流式获取比赛排行榜
+
+    用法：
+        async with stream_game_rankings(game_id) as rows:
+            async for row in rows:
+                ...
+    """
+    return _stream_statement("ranking", game_id)
+
+
+def stream_game_rankings_by_stdnum_prefix(game_id: int, stdnum_prefix: str):
+    """流式获取按学号前缀过滤的比赛排行榜，用法同 stream_game_rankings"""
+    return _stream_statement("ranking_by_prefix", game_id, stdnum_prefix)
 
 
 async def get_recent_notices(game_id: int, seconds: int = 10):
     """获取最近的赛事通知"""
     from datetime import datetime, timedelta
     
-    conn = await asyncpg.connect(POSTGRES_DSN)
-    try:
-        query = """
-        SELECT 
-            gn."Id",
-            gn."Type",
-            gn."Values",
-            gn."PublishTimeUtc",
-            CASE gn."Type"
-                WHEN 0 THEN '📢 公告通知'
-                WHEN 1 THEN '🥇 一血通知'
-                WHEN 2 THEN '🥈 二血通知'
-                WHEN 3 THEN '🥉 三血通知'
-                WHEN 4 THEN '💡 提示更新'
-                WHEN 5 THEN '🆕 新题目开放'
-                ELSE '❓ 未知类型'
-            END as notice_type
-        FROM "GameNotices" gn
-        WHERE gn."GameId" = $1
-          AND gn."PublishTimeUtc" > $2
-        ORDER BY gn."PublishTimeUtc" DESC;
-        """
-        
-        time_ago = datetime.utcnow() - timedelta(seconds=seconds)
-        rows = await conn.fetch(query, game_id, time_ago)
-        return rows
-    finally:
-        await conn.close()
+    time_ago = datetime.utcnow() - timedelta(seconds=seconds)
+    return await _execute("fetch", "recent_notices", game_id, time_ago)
 
 
-async def get_challenge_info_by_name(game_id: int, challenge_name: str):
-    """根据题目名称获取题目信息"""
-    import json
-    
-    conn = await asyncpg.connect(POSTGRES_DSN)
-    try:
-        # 首先尝试直接匹配
-        query = """
-        SELECT 
-            gc."Title",
-            gc."Category",
-            CASE gc."Category"
-                WHEN 0 THEN 'Misc'
-                WHEN 1 THEN 'Crypto'
-                WHEN 2 THEN 'Pwn'
-                WHEN 3 THEN 'Web'
-                WHEN 4 THEN 'Reverse'
-                WHEN 5 THEN 'Blockchain'
-                WHEN 6 THEN 'Forensics'
-                WHEN 7 THEN 'Hardware'
-                WHEN 8 THEN 'Mobile'
-                WHEN 9 THEN 'PPC'
-                WHEN 10 THEN 'AI'
-                WHEN 11 THEN 'Pentest'
-                WHEN 12 THEN 'OSINT'
-                ELSE 'Unknown'
-            END as CategoryName
-        FROM "GameChallenges" gc
-        WHERE gc."GameId" = $1 AND gc."Title" = $2
-        LIMIT 1;
-        """
-        
-        # 处理 Values 字段中的题目名称
-        # Values 可能是 JSON 格式如 ["题目名"] 或直接是题目名
-        actual_challenge_name = challenge_name
-        
-        # 如果是 JSON 数组格式，提取第一个元素
-        if challenge_name.startswith('[') and challenge_name.endswith(']'):
-            try:
-                parsed_values = json.loads(challenge_name)
-                if isinstance(parsed_values, list) and len(parsed_values) > 0:
-                    actual_challenge_name = str(parsed_values[0])
-            except json.JSONDecodeError:
-                pass  # 如果解析失败，使用原始名称
-        
-        
-        
-        result = await conn.fetchrow(query, game_id, actual_challenge_name)
-        return result
-    finally:
-        await conn.close()
+async def get_challenge_titles(game_id: int):
+    """获取比赛全部题目的ID、标题、类别与启用状态，供题目标题索引使用"""
+    return await _execute("fetch", "challenge_titles", game_id)
+
+
+async def get_notices_since(game_id: int, after_id: int):
+    """获取通知ID大于水位线的赛事通知，按ID升序"""
+    return await _execute("fetch", "notices_since", game_id, after_id)
+
+
+async def get_latest_notices(game_id: int, limit: int):
+    """获取比赛最新的 limit 条通知，按ID升序"""
+    rows = await _execute("fetch", "latest_notices", game_id, limit)
+    return rows[::-1]
+
+
+async def get_latest_notice_id(game_id: int) -> int:
+    """获取比赛当前最大的通知ID，没有通知时为 0"""
+    return await _execute("fetchval", "latest_notice_id", game_id)
+
+
+async def get_accepted_submissions_since(game_id: int, after_id: int, limit: int = 5000, primary: bool = False):
+    """按提交ID水位线增量获取 Accepted 提交（仅统计已通过审核的参赛队伍）
+
+    primary 为 True 时强制从主库读取，避免副本复制延迟。
+    """
+    return await _execute("fetch", "accepted_submissions_since", game_id, after_id, limit, allow_replica=not primary)
+
+
+async def get_latest_submission_id(game_id: int) -> int:
+    """获取比赛当前最大的提交ID，没有提交时为 0"""
+    return await _execute("fetchval", "latest_submission_id", game_id)
+
+
+async def get_first_solvers(game_id: int, until_id: int):
+    """获取截至指定提交ID，每道题按首次 Accepted 顺序的前三支队伍"""
+    return await _execute("fetch", "first_solvers", game_id, until_id)
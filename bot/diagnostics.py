@@ -0,0 +1,201 @@
+"""
+查询计划诊断模块
+对语句注册表中的每条语句执行 EXPLAIN (ANALYZE, BUFFERS)，标记顺序扫描与耗时较高的计划节点，
+并检查排行榜查询依赖的索引是否存在，给出 CREATE INDEX CONCURRENTLY 建议
+"""
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from .config import get_config
+from .database import STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+# 单个计划节点（不含子节点）耗时超过该值即视为慢节点，单位毫秒
+SLOW_NODE_MS = 20.0
+
+# 排行榜与播报查询依赖的索引：(表名, 列名, 索引名)
+RECOMMENDED_INDEXES: List[Tuple[str, Tuple[str, ...], str]] = [
+    ("Submissions", ("GameId", "Status"), "IX_Submissions_GameId_Status"),
+    ("Participations", ("TeamId", "GameId"), "IX_Participations_TeamId_GameId"),
+    ("UserParticipations", ("ParticipationId",), "IX_UserParticipations_ParticipationId"),
+]
+
+# 指定表上所有索引的列（按索引内顺序）
+INDEX_COLUMNS_QUERY = """
+SELECT array_agg(a.attname::text ORDER BY k.ord) AS columns
+FROM pg_index i
+CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+WHERE i.indrelid = to_regclass($1)
+GROUP BY i.indexrelid
+"""
+
+SAMPLE_STDNUM_QUERY = """
+SELECT LEFT(u."StdNumber", 2)
+FROM "Participations" p
+JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
+JOIN "AspNetUsers" u ON u."Id" = up."UserId"
+WHERE p."GameId" = $1 AND u."StdNumber" IS NOT NULL
+LIMIT 1
+"""
+
+
+@dataclass
+class PlanIssue:
+    kind: str  # seq_scan / slow_node
+    node_type: str
+    relation: Optional[str]
+    exclusive_ms: float
+    rows: int
+    rows_removed: int
+
+
+@dataclass
+class StatementPlan:
+    name: str
+    execution_ms: float = 0.0
+    planning_ms: float = 0.0
+    shared_hit: int = 0
+    shared_read: int = 0
+    issues: List[PlanIssue] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class DiagnosticsReport:
+    game_id: int
+    plans: List[StatementPlan]
+    suggestions: List[str]
+
+
+async def _sample_args(conn: asyncpg.Connection, game_id: int) -> Dict[str, Sequence[Any]]:
+    """为每条语句构造有代表性的参数：水位线取 0 以覆盖全量数据"""
+    prefix = await conn.fetchval(SAMPLE_STDNUM_QUERY, game_id) or "2"
+    return {
+        "game_title": (game_id,),
+        "game_window": (game_id,),
+        "game_challenges": (game_id,),
+        "ranking": (game_id,),
+        "ranking_by_prefix": (game_id, prefix),
+        "recent_notices": (game_id, datetime.utcnow() - timedelta(days=1)),
+        "notices_since": (game_id, 0),
+        "latest_notices": (game_id, 20),
+        "latest_notice_id": (game_id,),
+        "latest_submission_id": (game_id,),
+        "first_solvers": (game_id, 2 ** 31 - 1),
+        "challenge_titles": (game_id,),
+        "accepted_submissions_since": (game_id, 0, 500),
+    }
+
+
+def _walk(node: Dict[str, Any], issues: List[PlanIssue], slow_ms: float) -> float:
+    """深度优先遍历计划树，返回节点的总耗时（含子节点，已乘以循环次数）"""
+    loops = node.get("Actual Loops", 1) or 1
+    total_ms = node.get("Actual Total Time", 0.0) * loops
+    children_ms = sum(_walk(child, issues, slow_ms) for child in node.get("Plans", []))
+    exclusive_ms = max(total_ms - children_ms, 0.0)
+
+    node_type = node.get("Node Type", "")
+    kind = None
+    if node_type == "Seq Scan":
+        kind = "seq_scan"
+    elif exclusive_ms >= slow_ms:
+        kind = "slow_node"
+    if kind:
+        issues.append(
+            PlanIssue(
+                kind=kind,
+                node_type=node_type,
+                relation=node.get("Relation Name"),
+                exclusive_ms=exclusive_ms,
+                rows=int(node.get("Actual Rows", 0) * loops),
+                rows_removed=int(node.get("Rows Removed by Filter", 0) * loops),
+            )
+        )
+    return total_ms
+
+
+async def explain_statement(conn: asyncpg.Connection, name: str, args: Sequence[Any], slow_ms: float = SLOW_NODE_MS) -> StatementPlan:
+    """对单条已注册语句执行 EXPLAIN (ANALYZE, BUFFERS)
+
+    语句会被真实执行，因此放在只读事务中并在结束后回滚。
+    """
+    plan = StatementPlan(name)
+    try:
+        async with conn.transaction(readonly=True):
+            raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)\n{STATEMENTS[name]}", *args)
+    except asyncpg.PostgresError as e:
+        plan.error = str(e)
+        return plan
+
+    result = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    root = result["Plan"]
+    plan.execution_ms = result.get("Execution Time", 0.0)
+    plan.planning_ms = result.get("Planning Time", 0.0)
+    plan.shared_hit = root.get("Shared Hit Blocks", 0)
+    plan.shared_read = root.get("Shared Read Blocks", 0)
+    issues: List[PlanIssue] = []
+    _walk(root, issues, slow_ms)
+    plan.issues = _merge_issues(issues)
+    return plan
+
+
+def _merge_issues(issues: List[PlanIssue]) -> List[PlanIssue]:
+    """同一张表的同类问题（例如 CTE 中多次扫描同一张表）合并为一条，按耗时降序"""
+    merged: Dict[Tuple[str, str, Optional[str]], PlanIssue] = {}
+    for issue in issues:
+        key = (issue.kind, issue.node_type, issue.relation)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = issue
+            continue
+        existing.exclusive_ms += issue.exclusive_ms
+        existing.rows += issue.rows
+        existing.rows_removed += issue.rows_removed
+    return sorted(merged.values(), key=lambda issue: issue.exclusive_ms, reverse=True)
+
+
+async def suggest_indexes(conn: asyncpg.Connection) -> List[str]:
+    """返回缺失索引的 CREATE INDEX CONCURRENTLY 语句
+
+    已有索引的前导列与建议列一致即视为已覆盖。
+    """
+    suggestions = []
+    for table, columns, index_name in RECOMMENDED_INDEXES:
+        rows = await conn.fetch(INDEX_COLUMNS_QUERY, f'"{table}"')
+        if any(tuple(row["columns"][: len(columns)]) == columns for row in rows):
+            continue
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        suggestions.append(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" ON "{table}" ({column_list});')
+    return suggestions
+
+
+async def run_diagnostics(game_id: int, dsn: Optional[str] = None, slow_ms: float = SLOW_NODE_MS) -> DiagnosticsReport:
+    """对语句注册表中的全部语句做执行计划诊断
+
+    Args:
+        game_id: 赛事ID，用作各语句的参数
+        dsn: 数据库连接串，默认使用配置中的 POSTGRES_DSN
+        slow_ms: 慢节点阈值（毫秒）
+    """
+    conn = await asyncpg.connect(dsn or get_config().postgres_dsn)
+    try:
+        args = await _sample_args(conn, game_id)
+        plans = []
+        for name in STATEMENTS:
+            if name not in args:
+                logger.warning("no sample arguments for statement %s, skipped", name)
+                continue
+            plans.append(await explain_statement(conn, name, args[name], slow_ms))
+        suggestions = await suggest_indexes(conn)
+    finally:
+        await conn.close()
+    return DiagnosticsReport(game_id, plans, suggestions)
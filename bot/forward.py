@@ -0,0 +1,121 @@
+"""
+合并转发模块
+把过长的回复和同一轮产生的多条播报打包为 OneBot 合并转发消息（send_group_forward_msg），
+每个群一次调用即可送达，减少 API 往返与触发风控的概率；实现不支持或拒绝时回退为分段的普通消息。
+超时、断线等错误不能说明转发失败（消息可能已经送达），只记录日志，不回退重发
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from nonebot.adapters.onebot.v11 import ActionFailed, ApiNotAvailable, Bot, Event, GroupMessageEvent
+
+from .config import (
+    FORWARD_ENABLED,
+    FORWARD_MAX_NODES,
+    FORWARD_NODE_MAX_CHARS,
+    FORWARD_RETRY_SECONDS,
+    get_config,
+)
+from .utils import send_response
+
+logger = logging.getLogger(__name__)
+
+# 合并转发节点的显示名称
+FORWARD_SENDER_NAME = "GZCTF Bot"
+
+# 机器人账号 -> 合并转发被拒绝的时间（time.monotonic()）
+_rejected_at: Dict[str, float] = {}
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """按行把文本切分为不超过 max_chars 的若干段，单行过长时在行内硬切"""
+    chunks: List[str] = []
+    current: List[str] = []
+    length = 0
+    for line in text.split("\n"):
+        while len(line) > max_chars:
+            if current:
+                chunks.append("\n".join(current))
+                current, length = [], 0
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        # +1 为换行符
+        if current and length + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, length = [], 0
+        current.append(line)
+        length += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def forward_available(bot: Bot) -> bool:
+    """该机器人账号当前是否尝试合并转发（最近被拒绝过则暂不尝试）"""
+    if not FORWARD_ENABLED:
+        return False
+    rejected_at = _rejected_at.get(bot.self_id)
+    return rejected_at is None or time.monotonic() - rejected_at >= FORWARD_RETRY_SECONDS
+
+
+def forward_char_budget(bot: Bot, event: Event) -> Optional[int]:
+    """可以使用合并转发回复时返回单次回复的字符上限，否则返回 None（使用默认的单条消息上限）"""
+    if isinstance(event, GroupMessageEvent) and forward_available(bot):
+        return FORWARD_NODE_MAX_CHARS * FORWARD_MAX_NODES
+    return None
+
+
+def _nodes(bot: Bot, contents: Iterable[str]) -> List[Dict[str, Any]]:
+    return [
+        {"type": "node", "data": {"name": FORWARD_SENDER_NAME, "uin": bot.self_id, "content": content}}
+        for content in contents
+    ]
+
+
+async def send_group_forward(bot: Bot, group_id: int, contents: List[str]) -> int:
+    """以合并转发发送若干段文本，每条转发消息至多 FORWARD_MAX_NODES 个节点
+
+    Returns:
+        已处理的段数；实现明确拒绝（ActionFailed / ApiNotAvailable）时停止发送，剩余部分由调用方回退为普通消息。
+        超时等其他错误时该批可能已经送达，计入已处理并继续，避免重复发送
+    """
+    if not forward_available(bot):
+        return 0
+    delivered = 0
+    for start in range(0, len(contents), FORWARD_MAX_NODES):
+        batch = contents[start:start + FORWARD_MAX_NODES]
+        try:
+            await bot.send_group_forward_msg(group_id=group_id, messages=_nodes(bot, batch))
+        except (ActionFailed, ApiNotAvailable) as e:
+            _rejected_at[bot.self_id] = time.monotonic()
+            logger.warning(
+                "forward message to group %s rejected, falling back to plain messages for %ss: %s",
+                group_id,
+                FORWARD_RETRY_SECONDS,
+                e,
+            )
+            break
+        except Exception as e:
+            logger.warning("forward message to group %s failed, may have been delivered, not resending: %s", group_id, e)
+        delivered += len(batch)
+    return delivered
+
+
+async def send_long_response(bot: Bot, event: Event, text: str, command_name: str) -> None:
+    """发送可能很长的回复：不超过 MESSAGE_MAX_CHARS 时直接发送；群聊中更长的内容打包为合并转发，
+    否则（或被拒绝时）按 MESSAGE_MAX_CHARS 分段发送"""
+    max_chars = get_config().message_max_chars
+    if len(text) <= max_chars:
+        await send_response(bot, event, text, command_name)
+        return
+    if isinstance(event, GroupMessageEvent):
+        chunks = chunk_text(text, FORWARD_NODE_MAX_CHARS)
+        delivered = await send_group_forward(bot, event.group_id, chunks)
+        if delivered == len(chunks):
+            return
+        text = "\n".join(chunks[delivered:])
+    for part in chunk_text(text, max_chars):
+        await send_response(bot, event, part, command_name)
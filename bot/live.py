@@ -0,0 +1,99 @@
+"""
+实时事件模块
+播报器产生的通知、前三血以及排行榜名次变化在这里发布给所有订阅者（例如 SSE 直播流）。
+每个订阅者有独立的有界队列，发布时不等待任何订阅者；队列已满的慢订阅者直接被断开，
+重连时可凭 Last-Event-ID 从最近的历史事件中补发
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Set
+
+from .config import LIVE_HISTORY_SIZE, LIVE_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LiveEvent:
+    id: int
+    kind: str  # notice / blood / rank
+    data: str  # 已序列化的 JSON
+
+    @property
+    def frame(self) -> bytes:
+        """SSE 帧"""
+        return f"id: {self.id}\nevent: {self.kind}\ndata: {self.data}\n\n".encode("utf-8")
+
+
+@dataclass(eq=False)
+class Subscriber:
+    queue: "asyncio.Queue[LiveEvent]"
+    # 队列已满被中心移除；此后队列中的事件不再发送，客户端重连后按 Last-Event-ID 补发
+    dropped: bool = False
+
+
+class EventHub:
+    """进程内的发布/订阅中心
+
+    Args:
+        queue_size: 每个订阅者的队列长度
+        history_size: 保留用于断线补发的最近事件数
+    """
+
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE, history_size: int = LIVE_HISTORY_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._history: Deque[LiveEvent] = deque(maxlen=history_size)
+        self._ids = itertools.count(1)
+        self.dropped_count = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, kind: str, data: Dict[str, Any]) -> LiveEvent:
+        """发布事件，不会阻塞；JSON 只序列化一次，由所有订阅者共享"""
+        event = LiveEvent(next(self._ids), kind, json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str))
+        self._history.append(event)
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+        return event
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscriber:
+        """新建订阅；提供 last_event_id 时先补发其后仍在历史中的事件"""
+        subscriber = Subscriber(asyncio.Queue(self.queue_size))
+        if last_event_id is not None:
+            missed = [event for event in self._history if event.id > last_event_id]
+            for event in missed[-self.queue_size:]:
+                subscriber.queue.put_nowait(event)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def _drop(self, subscriber: Subscriber) -> None:
+        subscriber.dropped = True
+        self.dropped_count += 1
+        self.unsubscribe(subscriber)
+        logger.info("live subscriber dropped: queue full (%d subscribers left)", len(self._subscribers))
+
+
+hub = EventHub()
+
+
+def publish_event(kind: str, data: Dict[str, Any]) -> None:
+    """向实时事件中心发布事件，发布失败不影响调用方"""
+    try:
+        hub.publish(kind, data)
+    except Exception as e:
+        logger.warning("publish live event failed: %s", e)
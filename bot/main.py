@@ -2,11 +2,92 @@
 CTF机器人主模块
 集成所有功能模块，提供统一的入口点
 """
+import asyncio
+import logging
+import time
+
+from nonebot import get_driver, require
 
 # 导入所有功能模块
 from . import commands  # 命令处理模块
 from . import notifications  # 通知系统模块
+from .cache import game_title_cache, scoreboard_cache
+from .challenge_index import get_challenge_index
+from .config import (
+    BOT_CONFIG_FILE,
+    CONFIG_WATCH_SECONDS,
+    STARTUP_WARMUP_TIMEOUT,
+    get_config,
+    reload_config_if_changed,
+)
+from .coordination import close_coordination
+from .database import close_pool, get_pool
+
+# 依赖定时任务插件
+require("nonebot_plugin_apscheduler")
+from nonebot_plugin_apscheduler import scheduler  # noqa: E402
 
 # 所有功能已通过模块导入自动初始化
 # - commands 模块提供 /gc 和 /rank 命令
 # - notifications 模块提供自动通知播报功能
+
+logger = logging.getLogger(__name__)
+
+driver = get_driver()
+
+
+async def _timed(name: str, coro, timings: dict) -> None:
+    started = time.perf_counter()
+    try:
+        await coro
+    except Exception as e:
+        logger.warning("warmup %s failed: %s", name, e)
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+@driver.on_startup
+async def _warmup() -> None:
+    """启动预热：在开始接受连接前并发建立连接池、加载赛事标题与题目标题索引并预查一次排行榜
+
+    首次查询因此不必再承担建连、语句准备和冷缓存的开销；预热失败或超时只记录日志，不影响启动。
+    """
+    config = get_config()
+    if not config.postgres_dsn or not config.target_game_id:
+        return
+
+    game_id = config.target_game_id
+    timings: dict = {}
+    started = time.perf_counter()
+    try:
+        pool = await get_pool()
+        await asyncio.wait_for(
+            asyncio.gather(
+                _timed("pool", pool.warm(), timings),
+                _timed("game_title", game_title_cache.refresh(game_id), timings),
+                _timed("scoreboard", scoreboard_cache.refresh(game_id), timings),
+                _timed("challenge_index", get_challenge_index(game_id).refresh(), timings),
+            ),
+            timeout=STARTUP_WARMUP_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        logger.warning("warmup timed out after %ss", STARTUP_WARMUP_TIMEOUT)
+    breakdown = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items())
+    logger.info("warmup finished in %.0fms (%s)", (time.perf_counter() - started) * 1000, breakdown)
+
+
+if BOT_CONFIG_FILE:
+
+    @scheduler.scheduled_job(
+        "interval", seconds=CONFIG_WATCH_SECONDS, id="watch_config_file", max_instances=1, coalesce=True
+    )
+    async def watch_config_file_job() -> None:
+        """配置文件修改后自动重新加载"""
+        await reload_config_if_changed()
+
+
+@driver.on_shutdown
+async def _close_database_pool() -> None:
+    """退出时释放播报主节点锁并关闭数据库连接池"""
+    await close_coordination()
+    await close_pool()
@@ -3,20 +3,44 @@
 """
 from __future__ import annotations
 
+import json
 import logging
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Callable, Dict, List, Optional, Set
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
 
 from nonebot import get_driver, require
-
-from .config import ALLOWED_GROUP_IDS, TARGET_GAME_ID
-from .database import get_recent_notices, get_challenge_info_by_name, get_game_title
+from nonebot.adapters.onebot.v11 import Message, MessageSegment
+
+from .blood_detector import get_blood_detector
+from .config import (
+    FORWARD_ENABLED,
+    FORWARD_MAX_NODES,
+    FORWARD_NOTICE_MIN,
+    BotConfig,
+    get_config,
+    on_config_change,
+)
+from .cache import game_window_cache, get_cached_game_title
+from .challenge_index import ChallengeInfo, get_challenge_index
+from .coordination import broadcast_state, leader_election
+from .forward import send_group_forward
+from .live import publish_event
+from .subscriptions import subscriptions
+from .database import (
+    get_latest_notice_id,
+    get_latest_submission_id,
+    get_notices_since,
+)
 from .utils import (
+    _parse_blood_notification_values,
     decode_unicode_values,
     extract_challenge_name_from_values,
     format_blood_notification,
+    normalize_name,
+    parse_notice_values,
 )
 
 # 依赖定时任务插件
@@ -35,31 +59,65 @@ class NotificationTypes(str, Enum):
     THIRD_BLOOD = "三血"
 
 
+# 与 GameNotices 查询中 notice_type 一致的血腥通知类型，按名次索引
+BLOOD_NOTICE_TYPES = {1: "🥇 一血通知", 2: "🥈 二血通知", 3: "🥉 三血通知"}
+
+
 @dataclass
 class NotificationConfig:
-    CHECK_INTERVAL_SECONDS: int = 10
-    MAX_BROADCASTED_NOTICES: int = 1000
-    CLEANUP_THRESHOLD: int = 500
+    # 调度器的基础节拍，实际轮询间隔在 NOTICE_POLL_MIN_SECONDS 与 NOTICE_POLL_MAX_SECONDS 之间自适应
+    TICK_SECONDS: int = 1
+    BACKOFF_FACTOR: float = 2.0
+    # 未开启播报、非主节点或未配置时的复查间隔
+    SKIPPED_RECHECK_SECONDS: float = 5.0
+    # 比赛开始前、结束后这段时间内也按最小间隔轮询；窗口之外暂停
+    WINDOW_MARGIN_SECONDS: int = 300
+    # 比赛窗口之外暂停时，最长多久重新读取一次比赛时间
+    PAUSED_RECHECK_SECONDS: float = 300.0
     TIME_FORMAT: str = "%Y/%m/%d %H:%M:%S"
     BEIJING_TZ: timezone = timezone(timedelta(hours=8))
 
 
-# 状态
-broadcasted_notices: Set[int] = set()
-last_checked_time: Optional[datetime] = None  # UTC
-AUTO_BROADCAST_ENABLED: bool = False
+# 状态：播报开关、通知水位线与去重记录由 coordination 模块保存，多副本部署时在副本之间共享
+
+
+async def is_auto_broadcast_enabled() -> bool:
+    return await broadcast_state.is_enabled()
+
+
+async def _start_from_latest(config: BotConfig) -> None:
+    """以当前最新的通知ID作为水位线，只播报之后产生的新通知"""
+    game_id = config.target_game_id
+    await broadcast_state.set_watermark(game_id, await get_latest_notice_id(game_id))
+    if config.fast_blood_detection:
+        await get_blood_detector(game_id).reset()
 
 
-def is_auto_broadcast_enabled() -> bool:
-    return AUTO_BROADCAST_ENABLED
+async def set_auto_broadcast_enabled(enabled: bool) -> None:
+    config = get_config()
+    if enabled and config.target_game_id:
+        await _start_from_latest(config)
+    await broadcast_state.set_enabled(enabled)
+    # 立即按新状态轮询
+    _poll.next_at = 0.0
 
 
-def set_auto_broadcast_enabled(enabled: bool) -> None:
-    global AUTO_BROADCAST_ENABLED, last_checked_time
-    AUTO_BROADCAST_ENABLED = enabled
-    if enabled:
-        # 以系统当前时间作为水位线（UTC）
-        last_checked_time = datetime.now(timezone.utc)
+@on_config_change("target_game_id", "fast_blood_detection", "notice_poll_min_seconds", "notice_poll_max_seconds")
+async def _on_broadcast_config_change(old: BotConfig, new: BotConfig) -> None:
+    """切换比赛或开启快速检测时从最新处开始播报，不补发切换前积压的通知与提交；轮询间隔重新从最小值开始"""
+    switched = old.target_game_id != new.target_game_id
+    if new.target_game_id and (switched or new.fast_blood_detection and not old.fast_blood_detection):
+        if await is_auto_broadcast_enabled() and await leader_election.is_leader():
+            await _start_from_latest(new)
+    if switched:
+        _poll.last_submission_id = None
+    _poll.interval = new.notice_poll_min_seconds
+    _poll.next_at = 0.0
+
+
+def _blood_claim_key(team_name: str, challenge: str) -> str:
+    """前三血的去重键：同一队伍同一题目至多一次血，与名次无关，避免两条路径判定的名次不一致时重复播报"""
+    return f"blood:{normalize_name(team_name)}:{normalize_name(challenge)}"
 
 
 # 时间/格式化
@@ -80,7 +138,7 @@ def _fallback(title: str, content: str, publish_time: datetime) -> str:
 
 
 async def _base(values: str, publish_time: datetime) -> Dict[str, str]:
-    game_title = await get_game_title(int(TARGET_GAME_ID))
+    game_title = await get_cached_game_title(get_config().target_game_id)
     return {
         "game_title": game_title,
         "time_str": _fmt_bj(publish_time),
@@ -88,33 +146,39 @@ async def _base(values: str, publish_time: datetime) -> Dict[str, str]:
     }
 
 
-async def _fmt_new(values: str, publish_time: datetime) -> Optional[str]:
+def _resolve_challenge(values: str) -> Tuple[str, Optional[ChallengeInfo]]:
+    """从通知内容中取出题目名并在本地题目索引中解析，返回 (展示用题目名, 题目信息)"""
+    name = extract_challenge_name_from_values(values)
+    info = get_challenge_index(get_config().target_game_id).lookup(name)
+    if info is None:
+        logger.warning("challenge %r not found in title index", name)
+    return (info.title if info else name), info
+
+
+async def _fmt_new(values: str, publish_time: datetime) -> str:
     try:
         base = await _base(values, publish_time)
-        info = await get_challenge_info_by_name(int(TARGET_GAME_ID), values)
-        name = extract_challenge_name_from_values(values)
-        if info:
-            category = info.get("categoryname", "未知")
-            return (
-                f"{_border('上题目啦')}\n"
-                f"比赛: {base['game_title']}\n"
-                f"时间: {base['time_str']}\n"
-                f"类型: {category}\n"
-                f"赛题: {name}\n"
-                f"======================="
-            )
-        return None
+        name, info = _resolve_challenge(values)
+        # 索引中找不到时类型显示为未知，通知照常播报
+        category = info.category_name if info else "未知"
+        return (
+            f"{_border('上题目啦')}\n"
+            f"比赛: {base['game_title']}\n"
+            f"时间: {base['time_str']}\n"
+            f"类型: {category}\n"
+            f"赛题: {name}\n"
+            f"======================="
+        )
     except Exception as e:
         logger.exception("format new challenge failed: %s", e)
         return _fallback("上题目啦", f"新题目开放: {extract_challenge_name_from_values(values)}", publish_time)
 
 
-async def _fmt_hint(values: str, publish_time: datetime) -> Optional[str]:
+async def _fmt_hint(values: str, publish_time: datetime) -> str:
     try:
         base = await _base(values, publish_time)
-        info = await get_challenge_info_by_name(int(TARGET_GAME_ID), values)
-        name = extract_challenge_name_from_values(values)
-        category = info.get("categoryname", "未知") if info else "未知"
+        name, info = _resolve_challenge(values)
+        category = info.category_name if info else "未知"
         return (
             f"{_border('题目提示更新')}\n"
             f"比赛: {base['game_title']}\n"
@@ -181,58 +245,186 @@ async def _formatter_for(notice_type: str) -> Optional[Callable[[str, datetime],
     return None
 
 
-async def _broadcast_to_groups(message: str, notice_id: int) -> None:
-    driver = get_driver()
-    bots = driver.bots
+def _is_challenge_notice(notice_type: str) -> bool:
+    return any(t.value in notice_type for t in (NotificationTypes.NEW_CHALLENGE, NotificationTypes.HINT_UPDATE))
+
+
+def _notice_subjects(notice_type: str, values: str) -> Tuple[Optional[str], Optional[str]]:
+    """通知涉及的 (队伍, 题目)，用于匹配订阅；公告等无关通知返回 (None, None)"""
+    if _is_challenge_notice(notice_type):
+        return None, _resolve_challenge(values)[0]
+    blood_types = (NotificationTypes.FIRST_BLOOD, NotificationTypes.SECOND_BLOOD, NotificationTypes.THIRD_BLOOD)
+    if any(t.value in notice_type for t in blood_types):
+        blood = _parse_blood_notification_values(decode_unicode_values(values))
+        if blood:
+            return str(blood[0]), str(blood[1])
+    return None, None
+
+
+@dataclass
+class _Outgoing:
+    """本轮待播报的一条消息"""
+
+    message: str
+    notice_id: Union[int, str]
+    team: Optional[str] = None
+    challenge: Optional[str] = None
+
+    def mentions(self, game_id: int) -> Dict[int, Set[int]]:
+        """订阅了相关队伍或题目的群成员：群号 -> QQ号"""
+        return subscriptions.route(game_id, self.team, self.challenge) if self.team or self.challenge else {}
+
+
+def _with_mentions(text: str, users: Optional[Set[int]], separator: str = "\n") -> Union[str, Message]:
+    if not users:
+        return text
+    payload = Message(MessageSegment.text(text + separator))
+    payload.extend(MessageSegment.at(user_id) for user_id in sorted(users))
+    return payload
+
+
+async def _send_group(bot, group_id: int, message: Union[str, Message]) -> bool:
+    try:
+        await bot.send_group_msg(group_id=group_id, message=message)
+        return True
+    except Exception as e:
+        logger.error("broadcast group %s failed: %s", group_id, e)
+        return False
+
+
+async def _broadcast_to_groups(
+    message: str, notice_id: Union[int, str], team: Optional[str] = None, challenge: Optional[str] = None
+) -> None:
+    """向所有允许的群播报；订阅了该队伍或题目的群成员在同一条消息中一并 @ 到"""
+    bots = get_driver().bots
+    config = get_config()
+    group_ids = config.allowed_group_ids
+    mentions = _Outgoing(message, notice_id, team, challenge).mentions(config.target_game_id)
     success = 0
-    targets = len(ALLOWED_GROUP_IDS) * max(1, len(bots))
+    targets = len(group_ids) * max(1, len(bots))
     for bot in bots.values():
-        for gid in ALLOWED_GROUP_IDS:
-            try:
-                await bot.send_group_msg(group_id=gid, message=message)
-                success += 1
-            except Exception as e:
-                logger.error("broadcast group %s failed: %s", gid, e)
-    logger.info("Broadcast notice %s to %s/%s targets", notice_id, success, targets)
+        for gid in group_ids:
+            success += await _send_group(bot, gid, _with_mentions(message, mentions.get(gid)))
+    mentioned = sum(len(users) for gid, users in mentions.items() if gid in group_ids)
+    logger.info("Broadcast notice %s to %s/%s targets, %s mentions", notice_id, success, targets, mentioned)
 
 
-def _cleanup() -> None:
-    if len(broadcasted_notices) > NotificationConfig.MAX_BROADCASTED_NOTICES:
-        kept = sorted(broadcasted_notices)[-NotificationConfig.CLEANUP_THRESHOLD :]
-        broadcasted_notices.clear()
-        broadcasted_notices.update(kept)
-        logger.info("cleanup broadcasted set, kept %d", len(kept))
+async def _broadcast_batch(items: List[_Outgoing]) -> None:
+    """播报本轮的全部消息
 
-
-async def check_and_broadcast_notices() -> None:
-    if not ALLOWED_GROUP_IDS or not TARGET_GAME_ID:
-        logger.warning("auto broadcast not configured")
-        return
-    if not is_auto_broadcast_enabled():
+    少于 FORWARD_NOTICE_MIN 条时逐条发送；否则每个群打包为一条合并转发消息，合并转发中的 @ 不会提醒，
+    因此相关订阅者另外合并为一条 @ 消息。合并转发被拒绝时剩余部分回退为逐条发送。
+    """
+    if len(items) < FORWARD_NOTICE_MIN or not FORWARD_ENABLED:
+        for item in items:
+            await _broadcast_to_groups(item.message, item.notice_id, item.team, item.challenge)
         return
 
-    global last_checked_time
-    now = datetime.now(timezone.utc)
-    if last_checked_time is None:
-        last_checked_time = now
-        return
+    bots = get_driver().bots
+    config = get_config()
+    routes = [item.mentions(config.target_game_id) for item in items]
+    contents = [item.message for item in items]
+    calls = 0
+    for bot in bots.values():
+        for gid in config.allowed_group_ids:
+            delivered = await send_group_forward(bot, gid, contents)
+            calls += (delivered + FORWARD_MAX_NODES - 1) // FORWARD_MAX_NODES
+            mentioned: Set[int] = set()
+            for route in routes[:delivered]:
+                mentioned |= route.get(gid, set())
+            if mentioned:
+                calls += await _send_group(bot, gid, _with_mentions("以上播报与你订阅的队伍或题目有关", mentioned, " "))
+            for item, route in zip(items[delivered:], routes[delivered:]):
+                calls += await _send_group(bot, gid, _with_mentions(item.message, route.get(gid)))
+    logger.info(
+        "Broadcast %d notices (%s) with %d group messages",
+        len(items),
+        ", ".join(str(item.notice_id) for item in items),
+        calls,
+    )
+
+
+async def _broadcast_fast_bloods(game_id: int, outgoing: List[_Outgoing]) -> int:
+    """把从 Submissions 直接检测到的前三血加入本轮播报，返回检测到的数量"""
+    events = await get_blood_detector(game_id).poll()
+    for event in events:
+        if not await broadcast_state.claim(game_id, _blood_claim_key(event.team_name, event.challenge)):
+            continue
+        values = json.dumps([event.team_name, event.challenge], ensure_ascii=False)
+        msg = await _fmt_blood_wrapper(BLOOD_NOTICE_TYPES[event.place], values, event.solved_at)
+        outgoing.append(_Outgoing(msg, f"submission:{event.submission_id}", event.team_name, event.challenge))
+        publish_event(
+            "blood",
+            {
+                "id": f"submission:{event.submission_id}",
+                "type": BLOOD_NOTICE_TYPES[event.place],
+                "place": event.place,
+                "team": event.team_name,
+                "challenge": event.challenge,
+                "time": event.solved_at.isoformat(),
+                "message": msg,
+            },
+        )
+    return len(events)
 
-    window_seconds = int((now - last_checked_time).total_seconds())
-    if window_seconds <= 0:
-        window_seconds = NotificationConfig.CHECK_INTERVAL_SECONDS
 
-    # 暂时禁用实际查询，避免回放
-    rows: List[Dict] = []
-    # rows = await get_recent_notices(int(TARGET_GAME_ID), seconds=window_seconds)
+async def check_and_broadcast_notices() -> Optional[int]:
+    """轮询并播报新通知
 
+    Returns:
+        本次处理的新通知与快速检测到的前三血数量；未配置、未开启或非主节点时返回 None
+    """
+    config = get_config()
+    if not config.allowed_group_ids or not config.target_game_id:
+        logger.warning("auto broadcast not configured")
+        return None
+    if not await is_auto_broadcast_enabled():
+        return None
+    # 多副本部署时只有主节点负责播报
+    if not await leader_election.is_leader():
+        return None
+
+    game_id = config.target_game_id
+    watermark = await broadcast_state.get_watermark(game_id)
+    if watermark is None:
+        await broadcast_state.set_watermark(game_id, await get_latest_notice_id(game_id))
+        return 0
+
+    # 本轮的播报先收集起来，最后一并发送（条数较多时打包为合并转发）；中途出错也会发出已登记的部分
+    outgoing: List[_Outgoing] = []
+    try:
+        return await _collect_notices(config, game_id, watermark, outgoing)
+    finally:
+        if outgoing:
+            await _broadcast_batch(outgoing)
+
+
+async def _collect_notices(config: BotConfig, game_id: int, watermark: int, outgoing: List[_Outgoing]) -> int:
+    handled = 0
+    if config.fast_blood_detection:
+        handled += await _broadcast_fast_bloods(game_id, outgoing)
+
+    rows = await get_notices_since(game_id, watermark)
+    handled += len(rows)
+    # 有新题目或提示更新时题目列表很可能刚变化，先增量刷新题目索引，之后的解析都在本地完成
+    if any(_is_challenge_notice(row["notice_type"]) for row in rows):
+        await get_challenge_index(game_id).ensure_fresh(force=True)
     for row in rows:
         notice_id = row["Id"]
-        if notice_id in broadcasted_notices:
+        watermark = max(watermark, notice_id)
+        # 先登记再发送，保证同一条通知在任何副本上都不会重复播报
+        if not await broadcast_state.claim(game_id, f"notice:{notice_id}"):
             continue
         notice_type = row["notice_type"]
         values = row.get("Values") or ""
         publish_time = row["PublishTimeUtc"]
 
+        if config.fast_blood_detection and row["Type"] in BLOOD_NOTICE_TYPES:
+            blood = _parse_blood_notification_values(decode_unicode_values(values))
+            if blood and not await broadcast_state.claim(game_id, _blood_claim_key(str(blood[0]), str(blood[1]))):
+                # 已由快速检测播报过
+                continue
+
         formatter = await _formatter_for(notice_type)
         if not formatter:
             logger.warning("no formatter for type: %s", notice_type)
@@ -242,15 +434,98 @@ async def check_and_broadcast_notices() -> None:
             logger.warning("format message failed for %s", notice_id)
             continue
 
-        await _broadcast_to_groups(msg, notice_id)
-        broadcasted_notices.add(notice_id)
-        _cleanup()
+        outgoing.append(_Outgoing(msg, notice_id, *_notice_subjects(notice_type, values)))
+        publish_event(
+            "notice",
+            {
+                "id": notice_id,
+                "type": notice_type,
+                "values": parse_notice_values(values),
+                "time": publish_time.isoformat(),
+                "message": msg,
+            },
+        )
+
+    if rows:
+        await broadcast_state.set_watermark(game_id, watermark)
+    return handled
+
+
+# 自适应轮询
 
-    last_checked_time = now
+
+@dataclass
+class _PollState:
+    next_at: float = 0.0  # time.monotonic()
+    interval: float = field(default_factory=lambda: get_config().notice_poll_min_seconds)
+    last_submission_id: Optional[int] = None
+
+
+_poll = _PollState()
+
+
+async def _window_delay(game_id: int) -> Optional[float]:
+    """比赛窗口之外返回暂停时长；临近开始或结束返回 0（按最小间隔轮询）；窗口之内返回 None"""
+    window = await game_window_cache.get(game_id)
+    if not window or not window[0] or not window[1]:
+        return None
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in window)
+    now = datetime.now(timezone.utc)
+    margin = timedelta(seconds=NotificationConfig.WINDOW_MARGIN_SECONDS)
+    if now < start - margin:
+        until_margin = (start - margin - now).total_seconds()
+        return min(until_margin, NotificationConfig.PAUSED_RECHECK_SECONDS)
+    if now > end + margin:
+        return NotificationConfig.PAUSED_RECHECK_SECONDS
+    if now < start + margin or now > end - margin:
+        return 0.0
+    return None
+
+
+async def _poll_once() -> float:
+    """执行一次轮询，返回距下一次轮询的秒数"""
+    config = get_config()
+    if config.target_game_id:
+        window_delay = await _window_delay(config.target_game_id)
+        if window_delay:
+            return window_delay
+    else:
+        window_delay = None
+
+    handled = await check_and_broadcast_notices()
+    if handled is None:
+        return NotificationConfig.SKIPPED_RECHECK_SECONDS
+
+    # 有提交在持续产生也视为活跃（即使暂时没有新通知）。两种模式统计的提交不同：
+    # 开启快速前三血检测时直接使用本轮已读取的 Accepted 提交水位线，不再额外查询，只有通过的提交算活跃；
+    # 未开启时查询最新的提交ID，任何提交（包括错误答案）都算活跃
+    if config.fast_blood_detection:
+        latest_submission = get_blood_detector(config.target_game_id).watermark
+    else:
+        latest_submission = await get_latest_submission_id(config.target_game_id)
+    submissions_flowing = _poll.last_submission_id is not None and latest_submission != _poll.last_submission_id
+    _poll.last_submission_id = latest_submission
+
+    if handled or submissions_flowing or window_delay == 0.0:
+        _poll.interval = config.notice_poll_min_seconds
+    else:
+        _poll.interval = min(_poll.interval * NotificationConfig.BACKOFF_FACTOR, config.notice_poll_max_seconds)
+    return _poll.interval
 
 
 @scheduler.scheduled_job(
-    "interval", seconds=NotificationConfig.CHECK_INTERVAL_SECONDS, id="auto_broadcast_notices"
+    "interval",
+    seconds=NotificationConfig.TICK_SECONDS,
+    id="auto_broadcast_notices",
+    max_instances=1,
+    coalesce=True,
 )
 async def auto_broadcast_job() -> None:
-    await check_and_broadcast_notices()
+    if time.monotonic() < _poll.next_at:
+        return
+    try:
+        delay = await _poll_once()
+    except Exception as e:
+        logger.exception("auto broadcast poll failed: %s", e)
+        delay = get_config().notice_poll_max_seconds
+    _poll.next_at = time.monotonic() + delay
@@ -0,0 +1,211 @@
+"""
+采样分析模块
+在运行中的机器人上做低开销的采样分析：后台线程定期读取事件循环线程的调用栈（sys._current_frames，
+反映占用 CPU 的位置），事件循环中定期读取全部 asyncio 任务挂起时的调用栈（反映在等待什么，例如数据库）。
+结果按入口（命令处理、自动播报、Web）与数据库层汇总，并写出可用于火焰图的 collapsed stack 文件
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+
+from .config import PROFILE_DIR
+
+# 事件循环线程的采样间隔与任务调用栈的采样间隔（秒）
+CPU_SAMPLE_INTERVAL = 0.005
+TASK_SAMPLE_INTERVAL = 0.02
+# 汇总中列出的最热函数个数
+TOP_FRAMES = 10
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT_DIR = os.path.dirname(_PACKAGE_DIR)
+
+# 入口类别：调用栈中出现对应文件即归入该类别，按顺序匹配
+ENTRY_CATEGORIES = (
+    ("命令处理", os.path.join(_PACKAGE_DIR, "commands.py")),
+    ("自动播报", os.path.join(_PACKAGE_DIR, "notifications.py")),
+    ("Web", os.path.join(_PACKAGE_DIR, "web.py")),
+)
+
+Stack = Tuple[CodeType, ...]  # 从外到内
+
+
+@dataclass
+class ProfileReport:
+    seconds: float
+    cpu_samples: int = 0
+    idle_samples: int = 0
+    wait_samples: int = 0
+    # 事件循环线程忙碌时各入口类别的采样数
+    entry_samples: Dict[str, int] = field(default_factory=dict)
+    db_cpu_samples: int = 0
+    db_wait_samples: int = 0
+    # (函数标签, 采样数)
+    hot_frames: List[Tuple[str, int]] = field(default_factory=list)
+    waiting_frames: List[Tuple[str, int]] = field(default_factory=list)
+    path: Optional[str] = None
+
+    @property
+    def busy_samples(self) -> int:
+        return self.cpu_samples - self.idle_samples
+
+
+def _label(code: CodeType) -> str:
+    """函数标签：本项目文件使用相对路径，第三方与标准库保留最后两级路径"""
+    filename = code.co_filename
+    if filename.startswith(_ROOT_DIR + os.sep):
+        filename = os.path.relpath(filename, _ROOT_DIR)
+    else:
+        filename = "/".join(filename.replace(os.sep, "/").split("/")[-2:])
+    # collapsed stack 以分号分隔帧，以空格分隔计数
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _frame_stack(frame: Optional[FrameType]) -> Stack:
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    return tuple(codes)
+
+
+def _task_stack(task: asyncio.Task) -> Stack:
+    """沿 cr_await 链展开任务挂起时的完整协程调用栈（Task.get_stack 只返回最外层协程）"""
+    codes = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            frame = getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            break
+        codes.append(frame.f_code)
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+            or getattr(awaitable, "ag_await", None)
+        )
+    return tuple(codes)
+
+
+def _is_db(stack: Stack) -> bool:
+    database_file = os.path.join(_PACKAGE_DIR, "database.py")
+    return any(code.co_filename == database_file or f"{os.sep}asyncpg{os.sep}" in code.co_filename for code in stack)
+
+
+def _entry(stack: Stack) -> str:
+    files = {code.co_filename for code in stack}
+    for name, filename in ENTRY_CATEGORIES:
+        if filename in files:
+            return name
+    return "其他"
+
+
+def _is_idle(stack: Stack) -> bool:
+    """事件循环在 selector 中等待 I/O"""
+    return bool(stack) and stack[-1].co_filename.endswith("selectors.py")
+
+
+class SamplingProfiler:
+    """同一时间只允许一次采样"""
+
+    def __init__(self, cpu_interval: float = CPU_SAMPLE_INTERVAL, task_interval: float = TASK_SAMPLE_INTERVAL):
+        self.cpu_interval = cpu_interval
+        self.task_interval = task_interval
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float, output_dir: Optional[str] = PROFILE_DIR) -> ProfileReport:
+        """采样 seconds 秒并汇总；output_dir 不为空时写出 collapsed stack 文件"""
+        async with self._lock:
+            cpu: Counter = Counter()
+            waits: Counter = Counter()
+            loop_thread = threading.get_ident()
+            stop = threading.Event()
+            own_file = os.path.abspath(__file__)
+
+            def sample_loop_thread() -> None:
+                while not stop.wait(self.cpu_interval):
+                    frame = sys._current_frames().get(loop_thread)
+                    stack = _frame_stack(frame)
+                    # 跳过采样器自身在事件循环中运行的时刻
+                    if stack and not any(code.co_filename == own_file for code in stack):
+                        cpu[stack] += 1
+
+            sampler = threading.Thread(target=sample_loop_thread, name="bot-profiler", daemon=True)
+            started = time.perf_counter()
+            sampler.start()
+            current = asyncio.current_task()
+            try:
+                deadline = started + seconds
+                while time.perf_counter() < deadline:
+                    for task in asyncio.all_tasks():
+                        if task is current or task.done():
+                            continue
+                        stack = _task_stack(task)
+                        if stack:
+                            waits[stack] += 1
+                    await asyncio.sleep(self.task_interval)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+
+            report = _summarize(cpu, waits, time.perf_counter() - started)
+            if output_dir:
+                report.path = _write_collapsed(cpu, waits, output_dir)
+            return report
+
+
+def _summarize(cpu: Counter, waits: Counter, seconds: float) -> ProfileReport:
+    report = ProfileReport(seconds=seconds)
+    entries: Counter = Counter()
+    self_time: Counter = Counter()
+    for stack, count in cpu.items():
+        report.cpu_samples += count
+        if _is_idle(stack):
+            report.idle_samples += count
+            continue
+        entries[_entry(stack)] += count
+        self_time[stack[-1]] += count
+        if _is_db(stack):
+            report.db_cpu_samples += count
+
+    # 等待位置取任务调用栈中最内层的本项目函数，便于定位是哪段业务代码在等
+    waiting: Counter = Counter()
+    for stack, count in waits.items():
+        report.wait_samples += count
+        if _is_db(stack):
+            report.db_wait_samples += count
+        own = [code for code in stack if code.co_filename.startswith(_PACKAGE_DIR + os.sep)]
+        waiting[(own or stack)[-1]] += count
+
+    report.entry_samples = dict(entries.most_common())
+    report.hot_frames = [(_label(code), count) for code, count in self_time.most_common(TOP_FRAMES)]
+    report.waiting_frames = [(_label(code), count) for code, count in waiting.most_common(TOP_FRAMES)]
+    return report
+
+
+def _write_collapsed(cpu: Counter, waits: Counter, output_dir: str) -> str:
+    """写出 collapsed stack 文件：CPU 采样以 "cpu" 为根，任务等待采样以 "await" 为根"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        for root, samples in (("cpu", cpu), ("await", waits)):
+            for stack, count in samples.most_common():
+                f.write(";".join([root, *(_label(code) for code in stack)]) + f" {count}\n")
+    return path
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,351 @@
+"""
+赛后报告模块
+复用快照导出的流式查询一次读取提交、通知、题目与队伍数据（另加一条队员学号查询），
+在 NumPy 上一次性向量化汇总最终排名、分年级前几名、前三血和各题统计，写出 Markdown / CSV / XLSX 文件
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import logging
+import os
+import re
+import time
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from xml.sax.saxutils import escape
+
+import asyncpg
+
+from .cohorts import partition_by_cohort
+from .config import CATEGORY_MAPPING, REPORT_DIR, get_config
+from .snapshot import CURSOR_PREFETCH, Progress, SnapshotReplay, collect_snapshot, stream_query
+
+logger = logging.getLogger(__name__)
+
+REPORT_FORMATS = ("md", "csv", "xlsx")
+# 分年级表中每个年级列出的队伍数
+COHORT_TOP = 3
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+BLOOD_NAMES = {1: "一血", 2: "二血", 3: "三血"}
+
+REPORT_MEMBERS_QUERY = """
+SELECT p."TeamId", u."StdNumber"
+FROM "Participations" p
+JOIN "UserParticipations" up ON up."ParticipationId" = p."Id"
+JOIN "AspNetUsers" u ON u."Id" = up."UserId"
+WHERE p."GameId" = $1
+ORDER BY p."TeamId";
+"""
+
+
+@dataclass
+class ReportTable:
+    name: str  # CSV 文件名后缀
+    title: str  # Markdown 小节标题与 XLSX 工作表名
+    columns: List[str]
+    rows: List[List[Any]]
+
+
+@dataclass
+class ContestReport:
+    game_id: int
+    game_title: str
+    generated_at: datetime
+    tables: List[ReportTable] = field(default_factory=list)
+    paths: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def table(self, name: str) -> ReportTable:
+        return next(t for t in self.tables if t.name == name)
+
+
+def _fmt_time(value: Optional[datetime]) -> str:
+    return value.astimezone(BEIJING_TZ).strftime(TIME_FORMAT) if value else ""
+
+
+async def _collect_members(game_id: int, dsn: Optional[str], progress: Optional[Progress]) -> Dict[int, List[str]]:
+    """队伍ID -> 按学号排序的队员学号"""
+    members: Dict[int, List[str]] = {}
+    count = 0
+    conn = await asyncpg.connect(dsn or get_config().postgres_dsn)
+    try:
+        async for row in stream_query(conn, REPORT_MEMBERS_QUERY, game_id):
+            if row["StdNumber"]:
+                members.setdefault(row["TeamId"], []).append(row["StdNumber"])
+            count += 1
+            if progress is not None and count % CURSOR_PREFETCH == 0:
+                await progress("members", count)
+    finally:
+        await conn.close()
+    if progress is not None:
+        await progress("members", count)
+    return {team_id: sorted(set(numbers)) for team_id, numbers in members.items()}
+
+
+def build_report(data: Dict[str, Any], members: Dict[int, List[str]]) -> ContestReport:
+    """由快照数据汇总报告，所有按队伍、题目的统计都是对整列数组的一次向量化运算"""
+    import numpy as np
+
+    replay = SnapshotReplay(data)
+    n_teams, n_challenges = len(replay.team_ids), len(replay.challenge_ids)
+    report = ContestReport(replay.meta["game_id"], replay.meta["game_title"], datetime.now(timezone.utc))
+
+    # 提交映射到（排序后的）队伍、题目下标，只统计已通过审核的队伍
+    team_order = np.argsort(data["team_id"], kind="stable")
+    team_accepted = data["team_status"][team_order] == 1
+    sub_team, sub_challenge = data["submission_team"], data["submission_challenge"]
+    t = np.minimum(np.searchsorted(replay.team_ids, sub_team), max(n_teams - 1, 0))
+    c = np.minimum(np.searchsorted(replay.challenge_ids, sub_challenge), max(n_challenges - 1, 0))
+    if n_teams and n_challenges:
+        valid = (replay.team_ids[t] == sub_team) & (replay.challenge_ids[c] == sub_challenge) & team_accepted[t]
+    else:
+        valid = np.zeros(len(sub_team), dtype=bool)
+    t, c = t[valid], c[valid]
+
+    submissions_per_challenge = np.bincount(c, minlength=n_challenges)
+    attempted_teams = np.bincount(np.unique(t * n_challenges + c) % max(n_challenges, 1), minlength=n_challenges)
+    solves_per_challenge = np.bincount(replay.solve_challenge, minlength=n_challenges)
+    submissions_per_team = np.bincount(t, minlength=n_teams)
+    solves_per_team = np.bincount(replay.solve_team, minlength=n_teams)
+
+    bloods = replay.expected_bloods()
+    first_bloods = {b["challenge"]: b for b in bloods if b["place"] == 1}
+    notice_check = replay.verify_blood_notices()
+    standings = replay.scoreboard_at()
+    first_time, last_time = replay.time_range
+
+    report.tables.append(ReportTable("overview", "概览", ["项目", "值"], [
+        ["比赛", report.game_title],
+        ["参赛队伍", int(team_accepted.sum())],
+        ["得分队伍", len(standings)],
+        ["题目", n_challenges],
+        ["提交", int(valid.sum())],
+        ["解题（队伍×题目）", len(replay.solve_team)],
+        ["赛事通知", len(data["notice_id"])],
+        ["首个得分时间", _fmt_time(first_time)],
+        ["最后得分时间", _fmt_time(last_time)],
+        ["缺失的血腥通知", len(notice_check["missing"])],
+        ["多余的血腥通知", len(notice_check["unexpected"])],
+    ]))
+
+    team_index = {int(team_id): i for i, team_id in enumerate(replay.team_ids)}
+    standing_rows: List[List[Any]] = []
+    cohort_input: List[Dict[str, Any]] = []
+    for row in standings:
+        i = team_index[row["teamid"]]
+        numbers = members.get(row["teamid"], [])
+        standing_rows.append([
+            row["rank"], row["teamname"], row["totalscore"], int(solves_per_team[i]), int(submissions_per_team[i]),
+            _fmt_time(row["lastacceptedsubmission"]), ", ".join(numbers),
+        ])
+        cohort_input.append({**row, "studentnumbers": ", ".join(numbers)})
+    report.tables.append(ReportTable(
+        "standings", "最终排名", ["名次", "队伍", "总分", "解题数", "提交数", "最后得分时间", "学号"], standing_rows
+    ))
+
+    cohort_rows = [
+        [prefix, row["rank"], row["teamname"], row["totalscore"]]
+        for prefix, rows in partition_by_cohort(cohort_input).items()
+        for row in rows[:COHORT_TOP]
+    ]
+    report.tables.append(ReportTable("cohorts", f"分年级前{COHORT_TOP}名", ["年级", "年级名次", "队伍", "总分"], cohort_rows))
+
+    category_of = {str(title): int(cat) for title, cat in zip(replay.challenge_titles, replay.challenge_categories)}
+    report.tables.append(ReportTable("bloods", "前三血", ["题目", "类别", "名次", "队伍", "时间"], [
+        [b["challenge"], CATEGORY_MAPPING.get(category_of.get(b["challenge"], -1), "未知"), BLOOD_NAMES[b["place"]],
+         b["teamname"], _fmt_time(b["time"])]
+        for b in bloods
+    ]))
+
+    scores = data["challenge_score"][np.argsort(data["challenge_id"], kind="stable")]
+    challenge_rows = []
+    for i in range(n_challenges):
+        title = str(replay.challenge_titles[i])
+        attempted = int(attempted_teams[i])
+        blood = first_bloods.get(title)
+        challenge_rows.append([
+            title, CATEGORY_MAPPING.get(int(replay.challenge_categories[i]), "未知"), int(scores[i]),
+            int(solves_per_challenge[i]), attempted, int(submissions_per_challenge[i]),
+            f"{solves_per_challenge[i] * 100 / attempted:.1f}%" if attempted else "",
+            blood["teamname"] if blood else "", _fmt_time(blood["time"]) if blood else "",
+        ])
+    challenge_rows.sort(key=lambda row: (-row[3], row[0]))
+    report.tables.append(ReportTable(
+        "challenges", "题目统计",
+        ["题目", "类别", "分值", "解出队伍", "尝试队伍", "提交数", "解出率", "一血队伍", "一血时间"],
+        challenge_rows,
+    ))
+    return report
+
+
+# 输出格式
+
+
+def _markdown_cell(value: Any) -> str:
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _write_markdown(report: ContestReport, path: str) -> None:
+    lines = [f"# {report.game_title} 赛后报告", "", f"生成时间：{_fmt_time(report.generated_at)}"]
+    for table in report.tables:
+        lines += ["", f"## {table.title}", ""]
+        lines.append("| " + " | ".join(table.columns) + " |")
+        lines.append("|" + "---|" * len(table.columns))
+        lines += ["| " + " | ".join(_markdown_cell(v) for v in row) + " |" for row in table.rows]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _write_csv(report: ContestReport, base: str) -> List[str]:
+    """每张表写一个 CSV 文件（带 BOM，Excel 可直接打开中文）"""
+    paths = []
+    for table in report.tables:
+        path = f"{base}-{table.name}.csv"
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(table.columns)
+            writer.writerows(table.rows)
+        paths.append(path)
+    return paths
+
+
+# XML 1.0 不允许的控制字符
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _xlsx_cell(ref: str, value: Any) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_sheet(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    body = []
+    for r, row in enumerate([columns, *rows], start=1):
+        cells = "".join(_xlsx_cell(f"{_column_letter(c)}{r}", v) for c, v in enumerate(row))
+        body.append(f'<row r="{r}">{cells}</row>')
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f'<sheetData>{"".join(body)}</sheetData></worksheet>'
+    )
+
+
+def _write_xlsx(report: ContestReport, path: str) -> None:
+    """以标准库直接写出 XLSX（每张表一个工作表，字符串使用内联字符串），不依赖第三方库"""
+    sheets = range(1, len(report.tables) + 1)
+    content_types = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in sheets
+    )
+    workbook_sheets = "".join(
+        f'<sheet name="{escape(table.title[:31])}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, table in zip(sheets, report.tables)
+    )
+    workbook_rels = "".join(
+        f'<Relationship Id="rId{i}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>'
+        for i in sheets
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as xlsx:
+        xlsx.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f"{content_types}</Types>",
+        )
+        xlsx.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>',
+        )
+        xlsx.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f"<sheets>{workbook_sheets}</sheets></workbook>",
+        )
+        xlsx.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f"{workbook_rels}</Relationships>",
+        )
+        for i, table in zip(sheets, report.tables):
+            xlsx.writestr(f"xl/worksheets/sheet{i}.xml", _xlsx_sheet(table.columns, table.rows))
+
+
+def write_report(report: ContestReport, formats: Sequence[str], output_dir: str) -> List[str]:
+    """按指定格式写出报告，返回生成的文件路径"""
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"report-{report.game_id}-{report.generated_at.astimezone(BEIJING_TZ):%Y%m%d-%H%M%S}")
+    paths: List[str] = []
+    if "md" in formats:
+        _write_markdown(report, base + ".md")
+        paths.append(base + ".md")
+    if "csv" in formats:
+        paths += _write_csv(report, base)
+    if "xlsx" in formats:
+        _write_xlsx(report, base + ".xlsx")
+        paths.append(base + ".xlsx")
+    return paths
+
+
+async def generate_report(
+    game_id: int,
+    formats: Sequence[str] = REPORT_FORMATS,
+    output_dir: str = REPORT_DIR,
+    dsn: Optional[str] = None,
+    progress: Optional[Progress] = None,
+) -> ContestReport:
+    """生成赛后报告
+
+    读取阶段是异步的流式查询，不阻塞事件循环；汇总与写文件在线程中执行。
+
+    Args:
+        game_id: 赛事ID
+        formats: 输出格式，md / csv / xlsx 的子集
+        output_dir: 输出目录
+        dsn: 数据库连接串，默认使用配置中的 POSTGRES_DSN
+        progress: 进度回调 (阶段, 行数)，阶段依次为 teams、challenges、submissions、notices、members、aggregate、write
+    """
+    started = time.perf_counter()
+    data = await collect_snapshot(game_id, dsn, progress)
+    members = await _collect_members(game_id, dsn, progress)
+    if progress is not None:
+        await progress("aggregate", len(data["submission_id"]))
+    report = await asyncio.to_thread(build_report, data, members)
+    if progress is not None:
+        await progress("write", len(report.tables))
+    report.paths = await asyncio.to_thread(write_report, report, formats, output_dir)
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        "generated report of game %s in %.2fs (%d submissions): %s",
+        game_id, report.seconds, len(data["submission_id"]), ", ".join(report.paths),
+    )
+    return report
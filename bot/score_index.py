@@ -0,0 +1,136 @@
+"""
+分数时间索引模块
+基于各队每题的最早 Accepted 时间，增量维护按时间分桶的队伍得分索引，
+供分数曲线等需要历史得分的功能使用，避免反复执行完整的排行榜查询；
+同时按顺序保留每个 (队伍, 题目) 的首次通过记录，解题矩阵等其他增量结构从这里读取，不再各自拉取提交
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import TREND_BUCKET_SECONDS
+from .database import get_accepted_submissions_since, on_database_reset
+
+logger = logging.getLogger(__name__)
+
+# 每次增量拉取的最大行数
+FETCH_BATCH_SIZE = 5000
+
+
+class ScoreIndex:
+    """按时间分桶的队伍得分索引
+
+    只处理提交ID大于水位线的 Accepted 提交，同一队伍同一题目只在首次通过时计分。
+    """
+
+    def __init__(self, game_id: int, bucket_seconds: int = TREND_BUCKET_SECONDS):
+        self.game_id = game_id
+        self.bucket_seconds = bucket_seconds
+        self.watermark = 0
+        # 每次有新的得分时递增，用于判断缓存是否失效
+        self.version = 0
+        self.team_names: Dict[int, str] = {}
+        self.totals: Dict[int, int] = {}
+        self.last_scored: Dict[int, datetime] = {}
+        # 队伍 -> {分桶序号: 该桶内新增得分}
+        self.buckets: Dict[int, Dict[int, int]] = {}
+        self._solved: Set[Tuple[int, int]] = set()
+        # 按提交ID顺序排列的首次通过记录（get_accepted_submissions_since 的行）
+        self.first_solves: List = []
+        self._lock = asyncio.Lock()
+
+    def bucket_of(self, when: datetime) -> int:
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return int(when.timestamp()) // self.bucket_seconds
+
+    def bucket_start(self, bucket: int) -> datetime:
+        return datetime.fromtimestamp(bucket * self.bucket_seconds, tz=timezone.utc)
+
+    def apply(self, rows: Iterable) -> int:
+        """将一批按ID升序排列的 Accepted 提交合入索引，返回新增的得分次数"""
+        added = 0
+        for row in rows:
+            self.watermark = max(self.watermark, row["Id"])
+            team_id = row["TeamId"]
+            key = (team_id, row["ChallengeId"])
+            self.team_names[team_id] = row["teamname"]
+            if key in self._solved:
+                continue
+            self._solved.add(key)
+            self.first_solves.append(row)
+            score = int(row["score"] or 0)
+            when = row["SubmitTimeUtc"]
+            team_buckets = self.buckets.setdefault(team_id, {})
+            bucket = self.bucket_of(when)
+            team_buckets[bucket] = team_buckets.get(bucket, 0) + score
+            self.totals[team_id] = self.totals.get(team_id, 0) + score
+            previous = self.last_scored.get(team_id)
+            if previous is None or when > previous:
+                self.last_scored[team_id] = when
+            added += 1
+        if added:
+            self.version += 1
+        return added
+
+    async def refresh(self) -> int:
+        """从水位线开始增量拉取新提交，返回新增的得分次数"""
+        async with self._lock:
+            added = 0
+            while True:
+                rows = await get_accepted_submissions_since(self.game_id, self.watermark, FETCH_BATCH_SIZE)
+                added += self.apply(rows)
+                if len(rows) < FETCH_BATCH_SIZE:
+                    break
+            if added:
+                logger.debug("score index of game %s: +%d solves, watermark %d", self.game_id, added, self.watermark)
+            return added
+
+    def top_teams(self, limit: int) -> List[int]:
+        """按总分降序、最后得分时间升序、队名升序返回前若干支队伍"""
+        scored = [team_id for team_id, total in self.totals.items() if total > 0]
+        scored.sort(key=lambda t: (-self.totals[t], self.last_scored[t], self.team_names.get(t, "")))
+        return scored[:limit]
+
+    def series(self, team_ids: List[int], until: Optional[datetime] = None) -> Tuple[List[datetime], Dict[int, List[int]]]:
+        """生成若干队伍的累计得分曲线
+
+        Args:
+            team_ids: 队伍ID列表
+            until: 曲线截止时间，默认为当前时间
+
+        Returns:
+            (各分桶结束时间, 队伍ID -> 每个分桶结束时的累计得分)
+        """
+        first_buckets = [min(self.buckets[t]) for t in team_ids if self.buckets.get(t)]
+        if not first_buckets:
+            return [], {}
+        first = min(first_buckets) - 1
+        last = self.bucket_of(until or datetime.now(timezone.utc))
+        last = max(last, max(max(self.buckets[t]) for t in team_ids if self.buckets.get(t)))
+        points = [self.bucket_start(b + 1) for b in range(first, last + 1)]
+        result: Dict[int, List[int]] = {}
+        for team_id in team_ids:
+            team_buckets = self.buckets.get(team_id, {})
+            total = 0
+            values = []
+            for bucket in range(first, last + 1):
+                total += team_buckets.get(bucket, 0)
+                values.append(total)
+            result[team_id] = values
+        return points, result
+
+
+_indexes: Dict[int, ScoreIndex] = {}
+on_database_reset(_indexes.clear)
+
+
+def get_score_index(game_id: int) -> ScoreIndex:
+    """获取（必要时创建）指定比赛的分数索引"""
+    index = _indexes.get(game_id)
+    if index is None:
+        index = _indexes[game_id] = ScoreIndex(game_id)
+    return index
\ No newline at end of file
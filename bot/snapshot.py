@@ -0,0 +1,417 @@
+"""
+快照导出与离线回放模块
+将一场比赛的提交记录、赛事通知和题目信息导出为 NumPy .npz 列式文件，
+并在离线状态下按任意时间点重建排行榜，避免赛后分析时反复查询生产数据库
+"""
+from __future__ import annotations
+
+import json
+import logging
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+
+import asyncpg
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+# 服务端游标每次预取的行数
+CURSOR_PREFETCH = 5000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+SNAPSHOT_GAME_QUERY = 'SELECT "Title" FROM "Games" WHERE "Id" = $1'
+
+SNAPSHOT_TEAMS_QUERY = """
+SELECT p."TeamId", t."Name", p."Status"
+FROM "Participations" p
+JOIN "Teams" t ON t."Id" = p."TeamId"
+WHERE p."GameId" = $1
+ORDER BY p."TeamId";
+"""
+
+SNAPSHOT_CHALLENGES_QUERY = """
+SELECT "Id", "Title", "Category", "OriginalScore", "IsEnabled"
+FROM "GameChallenges"
+WHERE "GameId" = $1
+ORDER BY "Id";
+"""
+
+SNAPSHOT_SUBMISSIONS_QUERY = """
+SELECT s."Id", p."TeamId", s."ChallengeId", s."Status", s."SubmitTimeUtc"
+FROM "Submissions" s
+JOIN "Participations" p ON p."Id" = s."ParticipationId"
+WHERE s."GameId" = $1
+ORDER BY s."Id";
+"""
+
+SNAPSHOT_NOTICES_QUERY = """
+SELECT "Id", "Type", "Values", "PublishTimeUtc"
+FROM "GameNotices"
+WHERE "GameId" = $1
+ORDER BY "Id";
+"""
+
+
+def datetime_to_us(value: datetime) -> int:
+    """将时间转换为 UTC 纪元微秒数（无时区信息时按 UTC 处理）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def us_to_datetime(value: int) -> datetime:
+    """将 UTC 纪元微秒数转换回带时区的时间"""
+    return _EPOCH + int(value) * _MICROSECOND
+
+
+def _to_numpy(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """将导出过程中累积的列转换为 NumPy 数组"""
+    import numpy as np
+
+    result: Dict[str, Any] = {}
+    for name, column in columns.items():
+        if isinstance(column, array):
+            result[name] = np.frombuffer(column, dtype=np.dtype(column.typecode)).copy()
+        else:
+            # 字符串列使用定长 Unicode 数组，加载时无需 pickle
+            result[name] = np.array(column, dtype=str) if column else np.array([], dtype="<U1")
+    return result
+
+
+async def stream_query(conn: asyncpg.Connection, query: str, *args: Any) -> Any:
+    """在事务中使用服务端游标逐批读取结果"""
+    async with conn.transaction(readonly=True):
+        async for record in conn.cursor(query, *args, prefetch=CURSOR_PREFETCH):
+            yield record
+
+
+# 读取进度回调：(表名, 该表已读取的行数)，每读完一批和每张表读完时调用
+Progress = Callable[[str, int], Awaitable[None]]
+
+
+async def collect_snapshot(game_id: int, dsn: Optional[str] = None, progress: Optional[Progress] = None) -> Dict[str, Any]:
+    """以流式方式读取一场比赛的全部数据，返回列式 NumPy 数组字典
+
+    Args:
+        game_id: 赛事ID
+        dsn: 数据库连接串，默认使用配置中的 POSTGRES_DSN
+        progress: 读取进度回调
+
+    Returns:
+        列名到 NumPy 数组的映射，可直接传给 SnapshotReplay
+    """
+    async def report(table: str, rows: int) -> None:
+        if progress is not None:
+            await progress(table, rows)
+
+    conn = await asyncpg.connect(dsn or get_config().postgres_dsn)
+    try:
+        game_record = await conn.fetchrow(SNAPSHOT_GAME_QUERY, game_id)
+        if not game_record:
+            raise ValueError(f"未找到ID为 {game_id} 的比赛")
+
+        teams: Dict[str, Any] = {"team_id": array("q"), "team_name": [], "team_status": array("b")}
+        async for row in stream_query(conn, SNAPSHOT_TEAMS_QUERY, game_id):
+            teams["team_id"].append(row["TeamId"])
+            teams["team_name"].append(row["Name"] or "")
+            teams["team_status"].append(row["Status"] or 0)
+        await report("teams", len(teams["team_id"]))
+
+        challenges: Dict[str, Any] = {
+            "challenge_id": array("q"),
+            "challenge_title": [],
+            "challenge_category": array("h"),
+            "challenge_score": array("q"),
+            "challenge_enabled": array("b"),
+        }
+        async for row in stream_query(conn, SNAPSHOT_CHALLENGES_QUERY, game_id):
+            challenges["challenge_id"].append(row["Id"])
+            challenges["challenge_title"].append(row["Title"] or "")
+            challenges["challenge_category"].append(row["Category"] or 0)
+            challenges["challenge_score"].append(int(row["OriginalScore"] or 0))
+            challenges["challenge_enabled"].append(1 if row["IsEnabled"] else 0)
+        await report("challenges", len(challenges["challenge_id"]))
+
+        # 提交状态以小整数编码，名称表单独存放
+        status_names: List[str] = []
+        status_codes: Dict[str, int] = {}
+        submissions: Dict[str, Any] = {
+            "submission_id": array("q"),
+            "submission_team": array("q"),
+            "submission_challenge": array("q"),
+            "submission_status": array("b"),
+            "submission_time": array("q"),
+        }
+        async for row in stream_query(conn, SNAPSHOT_SUBMISSIONS_QUERY, game_id):
+            status = str(row["Status"])
+            code = status_codes.get(status)
+            if code is None:
+                code = status_codes[status] = len(status_names)
+                status_names.append(status)
+            submissions["submission_id"].append(row["Id"])
+            submissions["submission_team"].append(row["TeamId"])
+            submissions["submission_challenge"].append(row["ChallengeId"])
+            submissions["submission_status"].append(code)
+            submissions["submission_time"].append(datetime_to_us(row["SubmitTimeUtc"]))
+            if len(submissions["submission_id"]) % CURSOR_PREFETCH == 0:
+                await report("submissions", len(submissions["submission_id"]))
+        await report("submissions", len(submissions["submission_id"]))
+
+        notices: Dict[str, Any] = {
+            "notice_id": array("q"),
+            "notice_type": array("h"),
+            "notice_values": [],
+            "notice_time": array("q"),
+        }
+        async for row in stream_query(conn, SNAPSHOT_NOTICES_QUERY, game_id):
+            notices["notice_id"].append(row["Id"])
+            notices["notice_type"].append(row["Type"])
+            notices["notice_values"].append(row["Values"] or "")
+            notices["notice_time"].append(datetime_to_us(row["PublishTimeUtc"]))
+        await report("notices", len(notices["notice_id"]))
+    finally:
+        await conn.close()
+
+    meta = {
+        "version": SNAPSHOT_FORMAT_VERSION,
+        "game_id": game_id,
+        "game_title": game_record["Title"],
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "status_names": status_names,
+    }
+    data = _to_numpy({**teams, **challenges, **submissions, **notices})
+    data["meta"] = _to_numpy({"meta": [json.dumps(meta, ensure_ascii=False)]})["meta"]
+    return data
+
+
+async def export_snapshot(game_id: int, path: str, dsn: Optional[str] = None) -> Dict[str, int]:
+    """导出比赛快照到 .npz 文件
+
+    Args:
+        game_id: 赛事ID
+        path: 输出文件路径
+        dsn: 数据库连接串，默认使用配置中的 POSTGRES_DSN
+
+    Returns:
+        各类数据的行数统计
+    """
+    import numpy as np
+
+    data = await collect_snapshot(game_id, dsn)
+    np.savez_compressed(path, **data)
+    counts = {
+        "teams": len(data["team_id"]),
+        "challenges": len(data["challenge_id"]),
+        "submissions": len(data["submission_id"]),
+        "notices": len(data["notice_id"]),
+    }
+    logger.info("exported snapshot of game %s to %s: %s", game_id, path, counts)
+    return counts
+
+
+class SnapshotReplay:
+    """基于快照的离线回放引擎
+
+    按队伍、题目取最早 Accepted 作为得分时间，计分规则与 get_game_rankings 一致：
+    只统计已通过审核的参赛队伍，同分时按最后得分时间升序、队名升序排列。
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        import numpy as np
+
+        self.meta: Dict[str, Any] = json.loads(str(data["meta"][0]))
+        self.data = data
+
+        team_order = np.argsort(data["team_id"], kind="stable")
+        self.team_ids = data["team_id"][team_order]
+        self.team_names = data["team_name"][team_order]
+        team_accepted = data["team_status"][team_order] == 1
+
+        challenge_order = np.argsort(data["challenge_id"], kind="stable")
+        self.challenge_ids = data["challenge_id"][challenge_order]
+        self.challenge_titles = data["challenge_title"][challenge_order]
+        self.challenge_categories = data["challenge_category"][challenge_order]
+        challenge_scores = data["challenge_score"][challenge_order]
+
+        status_names: Sequence[str] = self.meta.get("status_names", [])
+        accepted_code = status_names.index("Accepted") if "Accepted" in status_names else -1
+
+        sub_team = data["submission_team"]
+        sub_chal = data["submission_challenge"]
+        team_idx = np.searchsorted(self.team_ids, sub_team)
+        chal_idx = np.searchsorted(self.challenge_ids, sub_chal)
+        team_idx_c = np.minimum(team_idx, max(len(self.team_ids) - 1, 0))
+        chal_idx_c = np.minimum(chal_idx, max(len(self.challenge_ids) - 1, 0))
+        mask = data["submission_status"] == accepted_code
+        if len(self.team_ids) and len(self.challenge_ids):
+            mask &= self.team_ids[team_idx_c] == sub_team
+            mask &= self.challenge_ids[chal_idx_c] == sub_chal
+            mask &= team_accepted[team_idx_c]
+        else:
+            mask &= False
+
+        # 每队每题只保留最早一次 Accepted
+        t = team_idx_c[mask]
+        c = chal_idx_c[mask]
+        ts = data["submission_time"][mask]
+        order = np.lexsort((ts, c, t))
+        t, c, ts = t[order], c[order], ts[order]
+        first = np.ones(len(t), dtype=bool)
+        first[1:] = (t[1:] != t[:-1]) | (c[1:] != c[:-1])
+        self.solve_team = t[first]
+        self.solve_challenge = c[first]
+        self.solve_time = ts[first]
+        self.solve_score = challenge_scores[self.solve_challenge]
+
+        # 以 (队伍, 时间) 组合键排序，便于对任意时间点做向量化的累计得分查询
+        order = np.lexsort((self.solve_time, self.solve_team))
+        self._t = self.solve_team[order]
+        self._time = self.solve_time[order]
+        self._cum = np.concatenate(([0], np.cumsum(self.solve_score[order])))
+        self._tmin = int(self._time.min()) if len(self._time) else 0
+        self._span = (int(self._time.max()) - self._tmin + 1) if len(self._time) else 1
+        self._keys = self._t * self._span + (self._time - self._tmin)
+        n_teams = len(self.team_ids)
+        self._starts = np.searchsorted(self._keys, np.arange(n_teams, dtype=np.int64) * self._span, side="left")
+
+    @classmethod
+    def load(cls, path: str) -> "SnapshotReplay":
+        """从 .npz 文件加载快照"""
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as npz:
+            return cls({name: npz[name] for name in npz.files})
+
+    @property
+    def time_range(self) -> tuple[Optional[datetime], Optional[datetime]]:
+        """首个与最后一个有效得分的时间"""
+        if not len(self._time):
+            return None, None
+        return us_to_datetime(self._tmin), us_to_datetime(self._tmin + self._span - 1)
+
+    def score_timeline(self, times_us: Iterable[int]) -> tuple[Any, Any]:
+        """计算所有队伍在多个时间点的累计得分与最后得分时间
+
+        Args:
+            times_us: 时间点（UTC 纪元微秒）
+
+        Returns:
+            (scores, last_times) 两个形状为 (队伍数, 时间点数) 的矩阵，
+            未得分时 last_times 为 -1
+        """
+        import numpy as np
+
+        times = np.asarray(list(times_us) if not hasattr(times_us, "dtype") else times_us, dtype=np.int64)
+        n_teams = len(self.team_ids)
+        if n_teams == 0 or not len(self._keys):
+            shape = (n_teams, len(times))
+            return np.zeros(shape, dtype=np.int64), np.full(shape, -1, dtype=np.int64)
+
+        offsets = np.clip(times - self._tmin, -1, self._span - 1)
+        teams = np.arange(n_teams, dtype=np.int64)[:, None]
+        pos = np.searchsorted(self._keys, teams * self._span + offsets[None, :], side="right")
+        starts = self._starts[:, None]
+        pos = np.where(offsets[None, :] < 0, starts, pos)
+        scores = self._cum[pos] - self._cum[starts]
+        has_solve = pos > starts
+        last_keys = self._keys[np.maximum(pos - 1, 0)]
+        last_times = np.where(has_solve, last_keys - teams * self._span + self._tmin, -1)
+        return scores, last_times
+
+    def scoreboard_at(self, at: Optional[datetime] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """重建指定时间点的排行榜
+
+        Args:
+            at: 时间点，默认为快照中的全部数据
+            limit: 只返回前若干名
+
+        Returns:
+            与 get_game_rankings 字段一致的排行数据列表
+        """
+        import numpy as np
+
+        at_us = datetime_to_us(at) if at is not None else self._tmin + self._span - 1
+        scores, last_times = self.score_timeline([at_us])
+        scores, last_times = scores[:, 0], last_times[:, 0]
+        scored = np.nonzero(scores > 0)[0]
+        order = scored[np.lexsort((self.team_names[scored], last_times[scored], -scores[scored]))]
+        if limit is not None:
+            order = order[:limit]
+        return [
+            {
+                "rank": rank,
+                "teamid": int(self.team_ids[i]),
+                "teamname": str(self.team_names[i]),
+                "totalscore": int(scores[i]),
+                "lastacceptedsubmission": us_to_datetime(last_times[i]),
+            }
+            for rank, i in enumerate(order, start=1)
+        ]
+
+    def expected_bloods(self) -> List[Dict[str, Any]]:
+        """按最早 Accepted 顺序推算每道题的一血、二血、三血"""
+        import numpy as np
+
+        order = np.lexsort((self.solve_time, self.solve_challenge))
+        chal = self.solve_challenge[order]
+        starts = np.ones(len(chal), dtype=bool)
+        starts[1:] = chal[1:] != chal[:-1]
+        group_start = np.maximum.accumulate(np.where(starts, np.arange(len(chal)), 0))
+        place = np.arange(len(chal)) - group_start + 1
+        picked = np.nonzero(place <= 3)[0]
+        return [
+            {
+                "place": int(place[i]),
+                "teamname": str(self.team_names[self.solve_team[order[i]]]),
+                "challenge": str(self.challenge_titles[chal[i]]),
+                "time": us_to_datetime(self.solve_time[order[i]]),
+            }
+            for i in picked
+        ]
+
+    def notices_until(self, at: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """返回截至指定时间点发布的赛事通知"""
+        times = self.data["notice_time"]
+        limit = datetime_to_us(at) if at is not None else None
+        return [
+            {
+                "Id": int(self.data["notice_id"][i]),
+                "Type": int(self.data["notice_type"][i]),
+                "Values": str(self.data["notice_values"][i]),
+                "PublishTimeUtc": us_to_datetime(times[i]),
+            }
+            for i in range(len(times))
+            if limit is None or times[i] <= limit
+        ]
+
+    def verify_blood_notices(self) -> Dict[str, List[Dict[str, Any]]]:
+        """将推算出的前三血与 GameNotices 中的血腥通知对账
+
+        Returns:
+            missing: 推算存在但没有对应通知的前三血
+            unexpected: 有通知但推算结果中不存在的前三血
+        """
+        from .utils import _parse_blood_notification_values, decode_unicode_values
+
+        announced = set()
+        for notice in self.notices_until():
+            if notice["Type"] not in (1, 2, 3):
+                continue
+            parsed = _parse_blood_notification_values(decode_unicode_values(notice["Values"]))
+            if parsed:
+                announced.add((notice["Type"], str(parsed[0]), str(parsed[1])))
+
+        expected = {(b["place"], b["teamname"], b["challenge"]): b for b in self.expected_bloods()}
+        return {
+            "missing": [b for key, b in expected.items() if key not in announced],
+            "unexpected": [
+                {"place": place, "teamname": team, "challenge": chal}
+                for place, team, chal in sorted(announced)
+                if (place, team, chal) not in expected
+            ],
+        }
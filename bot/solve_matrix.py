@@ -0,0 +1,200 @@
+"""
+解题矩阵模块
+以 NumPy 布尔矩阵（队伍 × 题目）记录每支队伍解出的题目，从分数索引的首次通过记录增量更新，
+列求和即各题解出队伍数，按分值加权的行求和即队伍得分，按题目类别切片即可得到分类矩阵
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import CATEGORY_MAPPING
+from .database import on_database_reset
+from .score_index import get_score_index
+
+logger = logging.getLogger(__name__)
+
+# 矩阵容量不足时的初始大小，之后按倍数扩容
+INITIAL_TEAMS = 64
+INITIAL_CHALLENGES = 32
+
+
+@dataclass
+class MatrixView:
+    """矩阵切片：前若干支队伍 × 指定类别的题目"""
+
+    team_names: List[str]
+    team_scores: List[int]
+    challenge_titles: List[str]
+    challenge_categories: List[int]
+    solve_counts: List[int]
+    solved: Any  # numpy.ndarray[bool]，形状为 (队伍数, 题目数)
+
+
+class SolveMatrix:
+    """单场比赛的队伍 × 题目解题矩阵
+
+    与分数索引共用同一份增量拉取的 Accepted 提交：刷新时先刷新分数索引，
+    再合入其中尚未处理的首次通过记录，同一队伍同一题目只记录一次。
+    """
+
+    def __init__(self, game_id: int):
+        import numpy as np
+
+        self.game_id = game_id
+        self.index = get_score_index(game_id)
+        # 已合入的分数索引首次通过记录条数
+        self.position = 0
+        self.version = 0
+        self.team_rows: Dict[int, int] = {}
+        self.team_names: List[str] = []
+        self.challenge_cols: Dict[int, int] = {}
+        self.challenge_titles: List[str] = []
+        self.solved = np.zeros((INITIAL_TEAMS, INITIAL_CHALLENGES), dtype=bool)
+        self.scores = np.zeros(INITIAL_CHALLENGES, dtype=np.int64)
+        self.categories = np.full(INITIAL_CHALLENGES, -1, dtype=np.int16)
+        # 每支队伍最后一次解题的时间戳（秒），用于同分排序
+        self.last_solved = np.zeros(INITIAL_TEAMS, dtype=np.float64)
+        self._lock = asyncio.Lock()
+
+    @property
+    def team_count(self) -> int:
+        return len(self.team_names)
+
+    @property
+    def challenge_count(self) -> int:
+        return len(self.challenge_titles)
+
+    def _ensure_capacity(self, teams: int, challenges: int) -> None:
+        import numpy as np
+
+        rows, cols = self.solved.shape
+        if teams <= rows and challenges <= cols:
+            return
+        while rows < teams:
+            rows *= 2
+        while cols < challenges:
+            cols *= 2
+        solved = np.zeros((rows, cols), dtype=bool)
+        solved[: self.solved.shape[0], : self.solved.shape[1]] = self.solved
+        self.solved = solved
+        self.scores = np.concatenate([self.scores, np.zeros(cols - len(self.scores), dtype=np.int64)])
+        self.categories = np.concatenate([self.categories, np.full(cols - len(self.categories), -1, dtype=np.int16)])
+        self.last_solved = np.concatenate([self.last_solved, np.zeros(rows - len(self.last_solved))])
+
+    def _team_row(self, team_id: int, name: str) -> int:
+        row = self.team_rows.get(team_id)
+        if row is None:
+            row = self.team_rows[team_id] = len(self.team_names)
+            self.team_names.append(name)
+        return row
+
+    def _challenge_col(self, row: Any) -> int:
+        col = self.challenge_cols.get(row["ChallengeId"])
+        if col is None:
+            col = self.challenge_cols[row["ChallengeId"]] = len(self.challenge_titles)
+            self.challenge_titles.append(row["challenge"])
+        return col
+
+    def apply(self, rows: Iterable) -> int:
+        """将一批按ID升序排列的 Accepted 提交合入矩阵，返回新增的解题数"""
+        import numpy as np
+
+        team_idx: List[int] = []
+        challenge_idx: List[int] = []
+        solved_at: List[float] = []
+        for row in rows:
+            team_row = self._team_row(row["TeamId"], row["teamname"])
+            col = self._challenge_col(row)
+            self._ensure_capacity(self.team_count, self.challenge_count)
+            self.scores[col] = int(row["score"] or 0)
+            self.categories[col] = int(row["Category"] if row["Category"] is not None else -1)
+            team_idx.append(team_row)
+            challenge_idx.append(col)
+            solved_at.append(row["SubmitTimeUtc"].timestamp())
+        if not team_idx:
+            return 0
+
+        rows_arr = np.asarray(team_idx)
+        cols_arr = np.asarray(challenge_idx)
+        # 只有此前未解出的 (队伍, 题目) 才算新增；同一批内的重复提交只计第一次
+        fresh = ~self.solved[rows_arr, cols_arr]
+        pairs = rows_arr * self.solved.shape[1] + cols_arr
+        _, first = np.unique(pairs, return_index=True)
+        first_mask = np.zeros(len(pairs), dtype=bool)
+        first_mask[first] = True
+        fresh &= first_mask
+        if not fresh.any():
+            return 0
+        self.solved[rows_arr[fresh], cols_arr[fresh]] = True
+        np.maximum.at(self.last_solved, rows_arr[fresh], np.asarray(solved_at)[fresh])
+        self.version += 1
+        return int(fresh.sum())
+
+    async def refresh(self) -> int:
+        """刷新分数索引并合入新的首次通过记录，返回新增的解题数"""
+        async with self._lock:
+            await self.index.refresh()
+            rows = self.index.first_solves[self.position:]
+            self.position += len(rows)
+            added = self.apply(rows)
+            if added:
+                logger.debug("solve matrix of game %s: +%d solves, %d in total", self.game_id, added, self.position)
+            return added
+
+    def view(self, top_n: int, category: Optional[int] = None) -> MatrixView:
+        """取按（类别）得分排名的前 top_n 支队伍，以及对应类别的全部已有解出的题目
+
+        题目按类别、解出队伍数降序排列；指定类别时队伍按该类别得分排名。
+        """
+        import numpy as np
+
+        solved = self.solved[: self.team_count, : self.challenge_count]
+        scores = self.scores[: self.challenge_count]
+        categories = self.categories[: self.challenge_count]
+        columns = np.arange(self.challenge_count)
+        if category is not None:
+            columns = columns[categories == category]
+
+        sliced = solved[:, columns]
+        solve_counts = sliced.sum(axis=0)
+        team_scores = sliced.astype(np.int64) @ scores[columns]
+        last_solved = self.last_solved[: self.team_count]
+        order = np.lexsort((last_solved, -team_scores))
+        top = order[team_scores[order] > 0][:top_n]
+
+        column_order = np.lexsort((-solve_counts, categories[columns]))
+        columns = columns[column_order]
+        return MatrixView(
+            team_names=[self.team_names[i] for i in top],
+            team_scores=[int(s) for s in team_scores[top]],
+            challenge_titles=[self.challenge_titles[c] for c in columns],
+            challenge_categories=[int(c) for c in categories[columns]],
+            solve_counts=[int(c) for c in solve_counts[column_order]],
+            solved=solved[np.ix_(top, columns)],
+        )
+
+
+def parse_category(text: str) -> Optional[int]:
+    """将类别名称（不区分大小写）或编号解析为类别编号，无法识别时返回 None"""
+    text = text.strip()
+    if text.isdigit() and int(text) in CATEGORY_MAPPING:
+        return int(text)
+    for code, name in CATEGORY_MAPPING.items():
+        if name.casefold() == text.casefold():
+            return code
+    return None
+
+
+_matrices: Dict[int, SolveMatrix] = {}
+on_database_reset(_matrices.clear)
+
+
+def get_solve_matrix(game_id: int) -> SolveMatrix:
+    """获取（必要时创建）指定比赛的解题矩阵"""
+    matrix = _matrices.get(game_id)
+    if matrix is None:
+        matrix = _matrices[game_id] = SolveMatrix(game_id)
+    return matrix
\ No newline at end of file
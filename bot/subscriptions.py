@@ -0,0 +1,185 @@
+"""
+订阅模块
+群成员可以订阅队伍或题目，相关的前三血、题目提示更新、新题目播报会在所在群中 @ 订阅者。
+订阅保存在本地 SQLite 中，内存里按 队伍 -> 订阅者、题目 -> 订阅者 建立索引，
+路由一条通知只访问匹配的订阅者，与订阅总数无关
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import SUBSCRIPTIONS_DB, SUBSCRIPTIONS_PER_USER
+from .utils import normalize_name
+
+logger = logging.getLogger(__name__)
+
+KIND_TEAM = "team"
+KIND_CHALLENGE = "chal"
+KIND_NAMES = {KIND_TEAM: "队伍", KIND_CHALLENGE: "题目"}
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    game_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    target_key TEXT NOT NULL,
+    target TEXT NOT NULL,
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, kind, target_key, group_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS subscriptions_by_user ON subscriptions (game_id, group_id, user_id);
+"""
+
+
+@dataclass(frozen=True)
+class Subscription:
+    kind: str  # team / chal
+    target: str  # 订阅时的原始名称，用于展示
+    group_id: int
+    user_id: int
+
+
+class SubscriptionStore:
+    """订阅存储与内存索引
+
+    写操作直接提交到 SQLite（WAL 模式，单条写入很快，因此在事件循环中同步执行）；
+    其他进程（如多副本共享同一文件）修改数据库后，下次读取时按 PRAGMA data_version 发现并重建索引。
+    """
+
+    def __init__(self, path: str = SUBSCRIPTIONS_DB):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        # (比赛ID, 类型, 匹配键) -> 群号 -> 订阅者QQ号
+        self._index: Dict[Tuple[int, str, str], Dict[int, Set[int]]] = {}
+        # (比赛ID, 群号, QQ号) -> (类型, 匹配键) -> 原始名称
+        self._by_user: Dict[Tuple[int, int, int], Dict[Tuple[str, str], str]] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA_SQL)
+            self._conn = conn
+        return self._conn
+
+    def _sync(self) -> None:
+        """首次使用或其他连接修改过数据库时从 SQLite 重建索引"""
+        conn = self._connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._index.clear()
+        self._by_user.clear()
+        rows = conn.execute("SELECT game_id, kind, target, group_id, user_id FROM subscriptions")
+        count = 0
+        for game_id, kind, target, group_id, user_id in rows:
+            self._add(game_id, kind, normalize_name(target), target, group_id, user_id)
+            count += 1
+        self._data_version = version
+        logger.info("loaded %d subscriptions from %s", count, self.path)
+
+    def _add(self, game_id: int, kind: str, target_key: str, target: str, group_id: int, user_id: int) -> None:
+        self._index.setdefault((game_id, kind, target_key), {}).setdefault(group_id, set()).add(user_id)
+        self._by_user.setdefault((game_id, group_id, user_id), {})[(kind, target_key)] = target
+
+    def _remove(self, game_id: int, kind: str, target_key: str, group_id: int, user_id: int) -> None:
+        groups = self._index.get((game_id, kind, target_key), {})
+        users = groups.get(group_id, set())
+        users.discard(user_id)
+        if not users:
+            groups.pop(group_id, None)
+        if not groups:
+            self._index.pop((game_id, kind, target_key), None)
+        owned = self._by_user.get((game_id, group_id, user_id), {})
+        owned.pop((kind, target_key), None)
+        if not owned:
+            self._by_user.pop((game_id, group_id, user_id), None)
+
+    def subscribe(self, game_id: int, kind: str, target: str, group_id: int, user_id: int) -> bool:
+        """添加订阅，已订阅时返回 False；超过每人订阅上限时抛出 ValueError"""
+        self._sync()
+        target_key = normalize_name(target)
+        owned = self._by_user.get((game_id, group_id, user_id), {})
+        if (kind, target_key) in owned:
+            return False
+        if len(owned) >= SUBSCRIPTIONS_PER_USER:
+            raise ValueError(f"每人最多订阅 {SUBSCRIPTIONS_PER_USER} 项")
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO subscriptions (game_id, kind, target_key, target, group_id, user_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (game_id, kind, target_key, target.strip(), group_id, user_id),
+            )
+        self._add(game_id, kind, target_key, target.strip(), group_id, user_id)
+        return True
+
+    def unsubscribe(self, game_id: int, kind: str, target: str, group_id: int, user_id: int) -> bool:
+        """取消订阅，未订阅时返回 False"""
+        self._sync()
+        target_key = normalize_name(target)
+        if (kind, target_key) not in self._by_user.get((game_id, group_id, user_id), {}):
+            return False
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM subscriptions WHERE game_id = ? AND kind = ? AND target_key = ? AND group_id = ? AND user_id = ?",
+                (game_id, kind, target_key, group_id, user_id),
+            )
+        self._remove(game_id, kind, target_key, group_id, user_id)
+        return True
+
+    def unsubscribe_all(self, game_id: int, group_id: int, user_id: int) -> int:
+        """取消某人在某群的全部订阅，返回取消的数量"""
+        self._sync()
+        owned = list(self._by_user.get((game_id, group_id, user_id), {}))
+        if not owned:
+            return 0
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM subscriptions WHERE game_id = ? AND group_id = ? AND user_id = ?",
+                (game_id, group_id, user_id),
+            )
+        for kind, target_key in owned:
+            self._remove(game_id, kind, target_key, group_id, user_id)
+        return len(owned)
+
+    def list_for(self, game_id: int, group_id: int, user_id: int) -> List[Subscription]:
+        """某人在某群的订阅，按类型、名称排序"""
+        self._sync()
+        owned = self._by_user.get((game_id, group_id, user_id), {})
+        return sorted(
+            (Subscription(kind, target, group_id, user_id) for (kind, _), target in owned.items()),
+            key=lambda s: (s.kind, s.target),
+        )
+
+    def route(self, game_id: int, team: Optional[str] = None, challenge: Optional[str] = None) -> Dict[int, Set[int]]:
+        """返回与队伍或题目相关的订阅者：群号 -> QQ号集合"""
+        self._sync()
+        result: Dict[int, Set[int]] = {}
+        for kind, target in ((KIND_TEAM, team), (KIND_CHALLENGE, challenge)):
+            if not target:
+                continue
+            for group_id, users in self._index.get((game_id, kind, normalize_name(target)), {}).items():
+                result.setdefault(group_id, set()).update(users)
+        return result
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._data_version = None
+
+
+subscriptions = SubscriptionStore()
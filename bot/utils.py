@@ -5,8 +5,9 @@
 import json
 import codecs
 import logging
-from typing import Any, Dict, List, Optional, Union
-from nonebot.adapters.onebot.v11 import Bot, Event, GroupMessageEvent
+import unicodedata
+from typing import Any, AsyncIterable, Dict, List, Optional, Tuple, Union
+from nonebot.adapters.onebot.v11 import Bot, Event, GroupMessageEvent, Message, MessageSegment
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +72,21 @@ def extract_challenge_name_from_values(values_str: str) -> str:
         return values_str or "未知题目"
 
 
+def normalize_name(name: str) -> str:
+    """题目名、队伍名的匹配键：NFKC 规范化（全角转半角等）、忽略大小写，首尾空白去除、连续空白合并为一个空格"""
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def parse_notice_values(values: Optional[str]) -> List[str]:
+    """将通知的 Values 字段解析为字符串列表（JSON 数组或单个值）"""
+    decoded = decode_unicode_values(values)
+    try:
+        parsed = json.loads(decoded)
+    except (TypeError, ValueError):
+        return [decoded] if decoded else []
+    return [str(v) for v in parsed] if isinstance(parsed, list) else [str(parsed)]
+
+
 def _parse_blood_notification_values(decoded_values: Any) -> Optional[tuple[str, str]]:
     """解析血腥通知的值
     
@@ -212,6 +228,62 @@ def format_challenges_message(game_title: str, challenges_data: List[Dict[str, A
     return "\n".join(text_lines)
 
 
+def format_solve_matrix(game_title: str, view: Any, category_name: Optional[str] = None, max_columns: int = 40) -> str:
+    """格式化解题矩阵消息
+
+    每行为一支队伍，■ 表示已解出、· 表示未解出，每 5 列以空格分隔；列的题目名称在下方按序列出。
+
+    Args:
+        game_title: 比赛标题
+        view: solve_matrix.MatrixView
+        category_name: 类别名称，为空表示全部类别
+        max_columns: 最多显示的题目列数
+
+    Returns:
+        格式化的矩阵消息
+    """
+    from .config import CATEGORY_MAPPING
+
+    scope = f"【{category_name}】" if category_name else ""
+    if not view.team_names or not view.challenge_titles:
+        return f"--- {game_title} -- 解题矩阵{scope} ---\n暂无解题数据"
+
+    columns = min(len(view.challenge_titles), max_columns)
+    text_lines = [f"--- {game_title} -- 解题矩阵{scope} ---", f"前 {len(view.team_names)} 名 × {columns} 题（■ 已解出）"]
+    for i, (name, score) in enumerate(zip(view.team_names, view.team_scores)):
+        cells = "".join("■" if solved else "·" for solved in view.solved[i, :columns])
+        grouped = " ".join(cells[j:j + 5] for j in range(0, len(cells), 5))
+        text_lines.append(f"{i + 1:>2}. {grouped}  {score}分 {name}")
+
+    text_lines.append("\n列（解出队伍数）")
+    for j in range(columns):
+        category = "" if category_name else f"[{CATEGORY_MAPPING.get(view.challenge_categories[j], '?')}] "
+        text_lines.append(f"{j + 1:>2}. {category}{view.challenge_titles[j]}（{view.solve_counts[j]}）")
+    if len(view.challenge_titles) > columns:
+        text_lines.append(f"…… 另有 {len(view.challenge_titles) - columns} 题未显示，可按类别查看")
+    return "\n".join(text_lines)
+
+
+# 排名表情映射
+RANK_EMOJIS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+
+def _format_ranking_header(game_title: str) -> List[str]:
+    return [f"{game_title} - 排行榜", "=" * 30]
+
+
+def _format_ranking_line(row: Dict[str, Any]) -> str:
+    rank_num = row.get('rank', 0)
+    team_name = row.get('teamname', '未知队伍')
+    score = row.get('totalscore', 0)
+
+    # 添加排名表情
+    emoji = RANK_EMOJIS.get(rank_num, f" {rank_num} ")
+
+    # 只显示队伍名和分数，不显示学号
+    return f"{emoji} {team_name} -- {score}分"
+
+
 def format_ranking_message(game_title: str, ranking_data: List[Dict[str, Any]]) -> str:
     """格式化排行榜消息
     
@@ -225,26 +297,236 @@ def format_ranking_message(game_title: str, ranking_data: List[Dict[str, Any]])
     if not ranking_data:
         return f"{game_title} - 排行榜\n" + "=" * 30 + "\n暂无排名数据"
     
-    text_lines = [f"{game_title} - 排行榜"]
-    text_lines.append("=" * 30)
-    
-    # 排名表情映射
-    rank_emojis = {1: "🥇", 2: "🥈", 3: "🥉"}
-    
+    text_lines = _format_ranking_header(game_title)
     for row in ranking_data:
-        rank_num = row.get('rank', 0)
-        team_name = row.get('teamname', '未知队伍')
-        score = row.get('totalscore', 0)
-        
-        # 添加排名表情
-        emoji = rank_emojis.get(rank_num, f" {rank_num} ")
-        
-        # 只显示队伍名和分数，不显示学号
-        text_lines.append(f"{emoji} {team_name} -- {score}分")
+        text_lines.append(_format_ranking_line(row))
     
     return "\n".join(text_lines)
 
 
+async def format_ranking_message_stream(
+    game_title: str,
+    rows: AsyncIterable[Dict[str, Any]],
+    max_lines: Optional[int] = None,
+    max_chars: Optional[int] = None,
+) -> Tuple[str, int]:
+    """增量格式化排行榜消息，达到行数或字符数上限后立即停止读取
+
+    Args:
+        game_title: 比赛标题
+        rows: 按名次升序产出的排行数据（如服务端游标）
+        max_lines: 最多显示的队伍数，默认读取 RANK_MAX_LINES
+        max_chars: 消息最大字符数，默认读取 MESSAGE_MAX_CHARS
+
+    Returns:
+        元组(格式化的排行榜消息, 已显示的队伍数)
+    """
+    from .config import get_config
+
+    config = get_config()
+    max_lines = max_lines or config.rank_max_lines
+    max_chars = max_chars or config.message_max_chars
+
+    text_lines = _format_ranking_header(game_title)
+    length = sum(len(line) + 1 for line in text_lines)
+    count = 0
+    truncated = False
+    async for row in rows:
+        if count >= max_lines:
+            truncated = True
+            break
+        line = _format_ranking_line(row)
+        # 预留截断提示的长度
+        if length + len(line) + 1 > max_chars - 20:
+            truncated = True
+            break
+        text_lines.append(line)
+        length += len(line) + 1
+        count += 1
+
+    if count == 0:
+        text_lines.append("暂无排名数据")
+    elif truncated:
+        text_lines.append(f"…… 仅显示前 {count} 名")
+    return "\n".join(text_lines), count
+
+
+def format_cohort_rankings(game_title: str, cohorts: Dict[str, List[Dict[str, Any]]], top_n: int) -> Tuple[str, int]:
+    """格式化分年级排行榜，每个年级显示前 top_n 名
+
+    Args:
+        game_title: 比赛标题
+        cohorts: 年级前缀 -> 按年级内名次排列的排行数据
+        top_n: 每个年级显示的队伍数
+
+    Returns:
+        元组(格式化的消息, 已显示的队伍数)
+    """
+    text_lines = [f"{game_title} - 分年级排行榜", "=" * 30]
+    count = 0
+    for prefix, rows in cohorts.items():
+        text_lines.append(f"【{prefix} 级】共 {len(rows)} 队")
+        for row in rows[:top_n]:
+            text_lines.append(_format_ranking_line(row))
+            count += 1
+    if not count:
+        text_lines.append("暂无排名数据")
+    return "\n".join(text_lines), count
+
+
+def format_stale_notice(age: float) -> str:
+    """旧数据提示行，附在使用缓存旧值的回复开头
+
+    Args:
+        age: 数据的年龄（秒）
+
+    Returns:
+        提示文本
+    """
+    minutes, seconds = divmod(int(age), 60)
+    when = f"{minutes} 分 {seconds} 秒" if minutes else f"{seconds} 秒"
+    return f"⚠️ 数据库繁忙，以下为 {when}前的数据"
+
+
+def format_statement_stats(
+    stats: Dict[str, Any],
+    replicas: Optional[List[Dict[str, Any]]] = None,
+    breaker: Optional[Dict[str, Any]] = None,
+) -> str:
+    """格式化数据库语句耗时统计
+
+    Args:
+        stats: 语句名到 StatementStats 的映射
+        replicas: 只读副本状态列表
+        breaker: 主库熔断器状态
+
+    Returns:
+        格式化的统计消息
+    """
+    text_lines = ["数据库语句统计（准备 / 执行）", "=" * 30]
+    for name, item in sorted(stats.items()):
+        text_lines.append(
+            f"{name}\n"
+            f"  准备 {item.prepare_count} 次，平均 {item.avg_prepare_ms:.1f}ms\n"
+            f"  执行 {item.execute_count} 次，平均 {item.avg_execute_ms:.1f}ms"
+        )
+    if replicas:
+        text_lines.append("\n只读副本")
+        for replica in replicas:
+            state = "正常" if replica["healthy"] else f"不可用（{replica['error']}）"
+            lag = f"，延迟 {replica['lag']:.1f}s" if replica["lag"] is not None else ""
+            text_lines.append(f"  {replica['dsn']}: {state}{lag}")
+    if breaker:
+        states = {"closed": "正常", "open": "熔断中", "half_open": "试探中"}
+        text_lines.append(
+            f"\n主库熔断器：{states.get(breaker['state'], breaker['state'])}，"
+            f"连续失败 {breaker['failures']} 次，累计拒绝 {breaker['rejected']} 次"
+        )
+        if breaker["error"]:
+            text_lines.append(f"  最近错误：{breaker['error']}")
+    return "\n".join(text_lines)
+
+
+def format_diagnostics_report(report: Any) -> str:
+    """格式化查询计划诊断结果
+
+    Args:
+        report: diagnostics.DiagnosticsReport
+
+    Returns:
+        格式化的诊断消息
+    """
+    issue_names = {"seq_scan": "顺序扫描", "slow_node": "慢节点"}
+    text_lines = [f"查询计划诊断（赛事 {report.game_id}）", "=" * 30]
+    for plan in report.plans:
+        if plan.error:
+            text_lines.append(f"{plan.name}: 执行失败（{plan.error}）")
+            continue
+        text_lines.append(
+            f"{plan.name}: 执行 {plan.execution_ms:.1f}ms，规划 {plan.planning_ms:.1f}ms，"
+            f"缓冲命中 {plan.shared_hit} / 读取 {plan.shared_read}"
+        )
+        for issue in plan.issues:
+            relation = f" {issue.relation}" if issue.relation else ""
+            removed = f"，过滤 {issue.rows_removed} 行" if issue.rows_removed else ""
+            text_lines.append(
+                f"  ⚠ {issue_names.get(issue.kind, issue.kind)}: {issue.node_type}{relation}"
+                f"（{issue.exclusive_ms:.1f}ms，{issue.rows} 行{removed}）"
+            )
+    if report.suggestions:
+        text_lines.append("\n建议创建的索引")
+        text_lines.extend(report.suggestions)
+    else:
+        text_lines.append("\n建议的索引均已存在")
+    return "\n".join(text_lines)
+
+
+def format_profile_report(report: Any) -> str:
+    """格式化采样分析结果
+
+    Args:
+        report: profiler.ProfileReport
+
+    Returns:
+        格式化的汇总消息
+    """
+    def share(count: int, total: int) -> str:
+        return f"{count * 100 / total:.1f}%" if total else "0%"
+
+    busy = report.busy_samples
+    text_lines = [
+        f"采样分析（{report.seconds:.0f} 秒）",
+        "=" * 30,
+        f"事件循环采样 {report.cpu_samples} 次，忙碌 {share(busy, report.cpu_samples)}",
+        f"任务等待采样 {report.wait_samples} 次",
+    ]
+    if busy:
+        entries = "、".join(f"{name} {share(count, busy)}" for name, count in report.entry_samples.items())
+        text_lines.append(f"忙碌时间按入口：{entries}")
+    text_lines.append(
+        f"数据库层（含 asyncpg）：占忙碌 {share(report.db_cpu_samples, busy)}，"
+        f"占等待 {share(report.db_wait_samples, report.wait_samples)}"
+    )
+    if report.hot_frames:
+        text_lines.append("\n最热函数（自身，占忙碌）")
+        for i, (label, count) in enumerate(report.hot_frames, 1):
+            text_lines.append(f"{i}. {label} {share(count, busy)}")
+    if report.waiting_frames:
+        text_lines.append("\n最常等待位置（占等待）")
+        for i, (label, count) in enumerate(report.waiting_frames, 1):
+            text_lines.append(f"{i}. {label} {share(count, report.wait_samples)}")
+    if report.path:
+        text_lines.append(f"\n火焰图数据：{report.path}")
+    return "\n".join(text_lines)
+
+
+def format_report_summary(report: Any, top_n: int = 10) -> str:
+    """格式化赛后报告的群聊摘要（不含学号），完整内容见生成的文件
+
+    Args:
+        report: report.ContestReport
+        top_n: 显示的最终排名数
+
+    Returns:
+        格式化的摘要消息
+    """
+    text_lines = [f"{report.game_title} - 赛后报告", "=" * 30]
+    text_lines += [f"{name}: {value}" for name, value in report.table("overview").rows[1:]]
+
+    text_lines.append("\n最终排名")
+    for rank, team, score, *_ in report.table("standings").rows[:top_n]:
+        text_lines.append(_format_ranking_line({"rank": rank, "teamname": team, "totalscore": score}))
+
+    cohort_winners = [row for row in report.table("cohorts").rows if row[1] == 1]
+    if cohort_winners:
+        text_lines.append("\n各年级第一")
+        text_lines += [f"{prefix} 级: {team} -- {score}分" for prefix, _, team, score in cohort_winners]
+
+    text_lines.append(f"\n耗时 {report.seconds:.1f} 秒，文件：")
+    text_lines += report.paths
+    return "\n".join(text_lines)
+
+
 # ==================== 命令处理工具函数 ====================
 
 def check_group_permission(event: Event) -> bool:
@@ -256,10 +538,11 @@ def check_group_permission(event: Event) -> bool:
     Returns:
         是否有权限
     """
-    from .config import ALLOWED_GROUP_IDS
+    from .config import get_config
     
-    if ALLOWED_GROUP_IDS:
-        if not isinstance(event, GroupMessageEvent) or getattr(event, "group_id", None) not in ALLOWED_GROUP_IDS:
+    allowed_group_ids = get_config().allowed_group_ids
+    if allowed_group_ids:
+        if not isinstance(event, GroupMessageEvent) or getattr(event, "group_id", None) not in allowed_group_ids:
             return False
     return True
 
@@ -273,11 +556,12 @@ def check_admin_permission(event: Event) -> bool:
     Returns:
         是否有管理员权限
     """
-    from .config import ADMIN_QQ_IDS
+    from .config import get_config
     
-    if ADMIN_QQ_IDS:
+    admin_qq_ids = get_config().admin_qq_ids
+    if admin_qq_ids:
         user_id = getattr(event, "user_id", None)
-        if user_id is None or user_id not in ADMIN_QQ_IDS:
+        if user_id is None or user_id not in admin_qq_ids:
             return False
     return True
 
@@ -292,7 +576,7 @@ async def validate_command_prerequisites(command_name: str, event: Event) -> Opt
     Returns:
         如果有错误返回错误消息，否则返回None
     """
-    from .config import POSTGRES_DSN, TARGET_GAME_ID
+    from .config import get_config
     
     # debug logs removed
     
@@ -301,17 +585,18 @@ async def validate_command_prerequisites(command_name: str, event: Event) -> Opt
         return "PERMISSION_DENIED"  # 特殊标记，表示权限被拒绝
     
     # 配置检查
-    if not POSTGRES_DSN:
+    config = get_config()
+    if not config.postgres_dsn:
         return "未配置 POSTGRES_DSN。"
     
-    if not TARGET_GAME_ID:
+    if not config.target_game_id:
         return "未在 .env 文件中设置 TARGET_GAME_ID。"
     
     # debug logs removed
     return None
 
 
-async def send_response(bot: Bot, event: Event, message: str, command_name: str) -> None:
+async def send_response(bot: Bot, event: Event, message: Union[str, Message, MessageSegment], command_name: str) -> None:
     """发送响应消息
     
     Args:
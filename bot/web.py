@@ -0,0 +1,343 @@
+"""
+Web 看板模块
+在 NoneBot 自带的 FastAPI 应用上提供只读 JSON 接口与自动刷新的 HTML 看板。
+响应体从机器人自身的缓存生成并预先压缩，请求处理只读取内存中的结果，观看人数再多也不会产生额外的数据库查询；
+只在有人观看时定时刷新，无人观看时不访问数据库，下一次请求到来时按需重建；支持 ETag / If-None-Match 与 gzip
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from nonebot import get_app, require
+
+from .cache import challenges_cache, get_cached_game_title, scoreboard_cache
+from .config import (
+    CATEGORY_MAPPING,
+    LIVE_HEARTBEAT_SECONDS,
+    LIVE_RANK_TOP,
+    WEB_ACTIVE_SECONDS,
+    WEB_DASHBOARD_ENABLED,
+    WEB_NOTICES_LIMIT,
+    WEB_REFRESH_SECONDS,
+    BotConfig,
+    get_config,
+    on_config_change,
+)
+from .database import get_latest_notices, get_notices_since
+from .live import hub, publish_event
+from .utils import parse_notice_values
+
+# 依赖定时任务插件
+require("nonebot_plugin_apscheduler")
+from nonebot_plugin_apscheduler import scheduler  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Payload:
+    """预先序列化并压缩的响应体"""
+
+    body: bytes
+    gzipped: bytes
+    etag: str
+    media_type: str
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str) -> "Payload":
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        return cls(body, gzip.compress(body, compresslevel=6), etag, media_type)
+
+    @classmethod
+    def from_json(cls, data: Any) -> "Payload":
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        return cls.build(body, "application/json; charset=utf-8")
+
+
+# 路径 -> 当前响应体
+_payloads: Dict[str, Payload] = {}
+# 生成各响应体时所用缓存项的版本，版本未变时不重新序列化
+_versions: Dict[str, int] = {}
+_recent_notices: Deque[Dict[str, Any]] = deque(maxlen=WEB_NOTICES_LIMIT)
+_notice_watermark = 0
+# 上一版排行榜中各队伍的名次，用于生成名次变化事件
+_previous_ranks: Dict[str, int] = {}
+# 最近一次收到看板请求、最近一次刷新的时间（time.monotonic()）
+_last_request_at: Optional[float] = None
+_refreshed_at: Optional[float] = None
+_refresh_lock = asyncio.Lock()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+async def _refresh_rank(game_id: int, game_title: str) -> None:
+    await scoreboard_cache.get(game_id)
+    entry = scoreboard_cache.peek(game_id)
+    if entry is None or _versions.get("rank") == entry.version:
+        return
+    # 与 /rank 一致，不公开队员学号
+    rows = [{"rank": r["rank"], "team": r["teamname"], "score": r["totalscore"]} for r in entry.value]
+    _payloads["/api/rank"] = Payload.from_json({"game": game_title, "updated_at": _now(), "rows": rows})
+    _versions["rank"] = entry.version
+    _publish_rank_changes(rows)
+
+
+def _publish_rank_changes(rows: List[Dict[str, Any]]) -> None:
+    """与上一版排行榜比较，发布前 LIVE_RANK_TOP 名中名次发生变化的队伍"""
+    changes = [
+        {"team": r["team"], "rank": r["rank"], "previous_rank": _previous_ranks.get(r["team"]), "score": r["score"]}
+        for r in rows[:LIVE_RANK_TOP]
+        if _previous_ranks.get(r["team"]) != r["rank"]
+    ]
+    first_build = not _previous_ranks
+    _previous_ranks.clear()
+    _previous_ranks.update((r["team"], r["rank"]) for r in rows)
+    if changes and not first_build:
+        publish_event("rank", {"updated_at": _now(), "changes": changes})
+
+
+async def _refresh_challenges(game_id: int, game_title: str) -> None:
+    await challenges_cache.get(game_id)
+    entry = challenges_cache.peek(game_id)
+    if entry is None or _versions.get("challenges") == entry.version:
+        return
+    rows = [
+        {
+            "title": c["Title"],
+            "category": CATEGORY_MAPPING.get(c["Category"], str(c["Category"])),
+            "score": c["OriginalScore"],
+        }
+        for c in entry.value
+    ]
+    _payloads["/api/challenges"] = Payload.from_json({"game": game_title, "updated_at": _now(), "rows": rows})
+    _versions["challenges"] = entry.version
+
+
+async def _refresh_notices(game_id: int, game_title: str) -> None:
+    global _notice_watermark
+    if _notice_watermark:
+        rows = await get_notices_since(game_id, _notice_watermark)
+    else:
+        # 首次填充（含切换比赛、换库后）只读取最新的 WEB_NOTICES_LIMIT 条
+        rows = await get_latest_notices(game_id, WEB_NOTICES_LIMIT)
+    if not rows and "/api/notices" in _payloads:
+        return
+    for row in rows:
+        _notice_watermark = max(_notice_watermark, row["Id"])
+        _recent_notices.appendleft(
+            {
+                "id": row["Id"],
+                "type": row["notice_type"],
+                "values": parse_notice_values(row["Values"]),
+                "time": row["PublishTimeUtc"].isoformat(),
+            }
+        )
+    _payloads["/api/notices"] = Payload.from_json({"game": game_title, "updated_at": _now(), "rows": list(_recent_notices)})
+
+
+async def refresh_payloads() -> None:
+    """从缓存重新生成看板数据，任一部分失败时保留该部分上一次的结果"""
+    global _refreshed_at
+    game_id = get_config().target_game_id
+    _refreshed_at = time.monotonic()
+    if not game_id:
+        return
+    try:
+        game_title = await get_cached_game_title(game_id)
+    except Exception as e:
+        logger.warning("refresh web payloads failed: %s", e)
+        return
+    for name, refresh in (("rank", _refresh_rank), ("challenges", _refresh_challenges), ("notices", _refresh_notices)):
+        try:
+            await refresh(game_id, game_title)
+        except Exception as e:
+            logger.warning("refresh web %s failed: %s", name, e)
+
+
+def viewers_active() -> bool:
+    """最近 WEB_ACTIVE_SECONDS 秒内有看板请求，或有实时事件流连接"""
+    recent = _last_request_at is not None and time.monotonic() - _last_request_at < WEB_ACTIVE_SECONDS
+    return recent or hub.subscriber_count > 0
+
+
+async def refresh_if_stale() -> None:
+    """距上次刷新超过 WEB_REFRESH_SECONDS 时刷新；并发的请求共用同一次刷新"""
+    if _refreshed_at is not None and time.monotonic() - _refreshed_at < WEB_REFRESH_SECONDS:
+        return
+    async with _refresh_lock:
+        if _refreshed_at is not None and time.monotonic() - _refreshed_at < WEB_REFRESH_SECONDS:
+            return
+        await refresh_payloads()
+
+
+BOARD_HTML = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>排行榜</title>
+<style>
+body { margin: 0; padding: 2vh 3vw; background: #111; color: #eee; font-family: "Noto Sans CJK SC", "Microsoft YaHei", sans-serif; }
+h1 { margin: 0 0 1vh; font-size: 4vh; }
+#meta { color: #888; font-size: 1.6vh; margin-bottom: 2vh; }
+main { display: flex; gap: 3vw; }
+table { border-collapse: collapse; width: 100%; font-size: 2.4vh; }
+td { padding: 0.6vh 1vw; border-bottom: 1px solid #333; }
+td.rank { width: 4em; text-align: right; color: #aaa; }
+td.score { text-align: right; font-variant-numeric: tabular-nums; }
+tr:nth-child(1) td { color: #ffd700; } tr:nth-child(2) td { color: #c0c0c0; } tr:nth-child(3) td { color: #cd7f32; }
+#rank { flex: 2; } #notices { flex: 1; font-size: 2vh; }
+#notices li { margin-bottom: 1vh; list-style: none; } #notices time { color: #888; margin-right: 0.5em; }
+</style>
+</head>
+<body>
+<h1 id="title">排行榜</h1>
+<div id="meta"></div>
+<main>
+<section id="rank"><table><tbody id="rows"></tbody></table></section>
+<section id="notices"><ul id="notice-list"></ul></section>
+</main>
+<script>
+const REFRESH_MS = __REFRESH_MS__;
+const TOP = 30;
+function esc(s) { const d = document.createElement("div"); d.textContent = String(s); return d.innerHTML; }
+async function load(path) {
+  // 浏览器会自动携带 If-None-Match，未变化时服务端返回 304
+  const r = await fetch(path, { cache: "no-cache" });
+  if (!r.ok) throw new Error(path + " " + r.status);
+  return r.json();
+}
+async function tick() {
+  try {
+    const [rank, notices] = await Promise.all([load("/api/rank"), load("/api/notices")]);
+    document.getElementById("title").textContent = rank.game + " - 排行榜";
+    document.title = rank.game;
+    document.getElementById("rows").innerHTML = rank.rows.slice(0, TOP).map(r =>
+      `<tr><td class="rank">${r.rank}</td><td>${esc(r.team)}</td><td class="score">${r.score}</td></tr>`).join("");
+    document.getElementById("notice-list").innerHTML = notices.rows.slice(0, 15).map(n =>
+      `<li><time>${new Date(n.time).toLocaleTimeString("zh-CN", { hour12: false })}</time>${esc(n.type)} ${esc(n.values.join(" "))}</li>`).join("");
+    document.getElementById("meta").textContent = "更新于 " + new Date(rank.updated_at).toLocaleTimeString("zh-CN", { hour12: false });
+  } catch (e) {
+    document.getElementById("meta").textContent = "加载失败：" + e.message;
+  }
+}
+tick();
+setInterval(tick, REFRESH_MS);
+</script>
+</body>
+</html>
+"""
+
+
+def _register_routes() -> None:
+    app = get_app()
+    _payloads["/board"] = Payload.build(
+        BOARD_HTML.replace("__REFRESH_MS__", str(WEB_REFRESH_SECONDS * 1000)).encode("utf-8"), "text/html; charset=utf-8"
+    )
+
+    def serve(path: str):
+        async def endpoint(request: Request) -> Response:
+            global _last_request_at
+            _last_request_at = time.monotonic()
+            if path != "/board":
+                # 空闲后的第一个请求按需重建，之后由定时任务刷新
+                await refresh_if_stale()
+            payload = _payloads.get(path)
+            if payload is None:
+                return Response(status_code=503, content="数据尚未就绪", headers={"Retry-After": str(WEB_REFRESH_SECONDS)})
+            headers = {
+                "ETag": payload.etag,
+                "Cache-Control": f"public, max-age={WEB_REFRESH_SECONDS}",
+                "Vary": "Accept-Encoding",
+            }
+            if_none_match = request.headers.get("if-none-match", "")
+            if payload.etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+                return Response(status_code=304, headers=headers)
+            if "gzip" in request.headers.get("accept-encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                return Response(content=payload.gzipped, media_type=payload.media_type, headers=headers)
+            return Response(content=payload.body, media_type=payload.media_type, headers=headers)
+
+        return endpoint
+
+    for path in ("/board", "/api/rank", "/api/challenges", "/api/notices"):
+        app.add_api_route(path, serve(path), methods=["GET"], include_in_schema=False)
+    app.add_api_route("/api/events", live_events, methods=["GET"], include_in_schema=False)
+
+
+async def _event_stream(last_event_id: Optional[int]) -> AsyncIterator[bytes]:
+    subscriber = hub.subscribe(last_event_id)
+    try:
+        # 告知 EventSource 断线后的重连间隔
+        yield b"retry: 3000\n\n"
+        while not subscriber.dropped:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # 心跳注释，防止代理断开空闲连接
+                yield b": ping\n\n"
+                continue
+            if subscriber.dropped:
+                # 被移除时队列是满的，get 会立即返回；直接结束，避免继续发送过时的积压事件
+                break
+            yield event.frame
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+async def live_events(request: Request) -> StreamingResponse:
+    """实时事件流（SSE）：notice / blood / rank 三类事件"""
+    # 连接期间看板视为有人观看，定时刷新以产生名次变化事件
+    await refresh_if_stale()
+    last_event_id = request.headers.get("last-event-id", "")
+    return StreamingResponse(
+        _event_stream(int(last_event_id) if last_event_id.isdigit() else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@on_config_change("target_game_id", "postgres_dsn")
+async def _reset_payloads(old: BotConfig, new: BotConfig) -> None:
+    """切换比赛或换库后丢弃上一场的数据，有人观看时立即重建，首次重建不产生名次变化事件"""
+    global _notice_watermark, _refreshed_at
+    for path in ("/api/rank", "/api/challenges", "/api/notices"):
+        _payloads.pop(path, None)
+    _versions.clear()
+    _recent_notices.clear()
+    _notice_watermark = 0
+    _previous_ranks.clear()
+    _refreshed_at = None
+    if viewers_active():
+        await refresh_payloads()
+
+
+# 未配置比赛时也注册路由，之后通过重新加载配置设置比赛即可直接使用
+if WEB_DASHBOARD_ENABLED:
+    try:
+        _register_routes()
+    except AssertionError as e:
+        # 非 FastAPI 驱动时 get_app 不可用
+        logger.warning("web dashboard disabled: %s", e)
+    else:
+
+        @scheduler.scheduled_job(
+            "interval", seconds=WEB_REFRESH_SECONDS, id="refresh_web_payloads", max_instances=1, coalesce=True
+        )
+        async def refresh_web_job() -> None:
+            if viewers_active():
+                async with _refresh_lock:
+                    await refresh_payloads()
@@ -0,0 +1,163 @@
+"""
+命令行工具入口
+用法示例：
+    python cli.py export -o game.npz
+    python cli.py replay game.npz --at "2025-10-01 12:00:00" --top 10
+    python cli.py explain
+    python cli.py report -o reports --format md xlsx
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def _parse_time(value: str) -> datetime:
+    """解析命令行中的时间参数，无时区信息时按北京时间处理"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=BEIJING_TZ)
+    return parsed
+
+
+def _fmt_time(value: datetime) -> str:
+    return value.astimezone(BEIJING_TZ).strftime("%Y/%m/%d %H:%M:%S")
+
+
+def _init_bot() -> None:
+    """加载 .env 并初始化 NoneBot，使 bot 包内模块可以直接导入"""
+    from dotenv import load_dotenv
+    import nonebot
+
+    load_dotenv()
+    nonebot.init()
+
+
+def _default_game_id(args: argparse.Namespace) -> int:
+    game_id = args.game_id or os.getenv("TARGET_GAME_ID")
+    if not game_id:
+        sys.exit("未指定赛事ID，请使用 --game-id 或在 .env 中设置 TARGET_GAME_ID。")
+    return int(game_id)
+
+
+def cmd_export(args: argparse.Namespace) -> None:
+    from bot.snapshot import export_snapshot
+
+    game_id = _default_game_id(args)
+    started = time.perf_counter()
+    counts = asyncio.run(export_snapshot(game_id, args.output))
+    elapsed = time.perf_counter() - started
+    print(f"已导出比赛 {game_id} 到 {args.output}（耗时 {elapsed:.2f}s）")
+    for name, count in counts.items():
+        print(f"  {name}: {count}")
+
+
+def cmd_replay(args: argparse.Namespace) -> None:
+    import numpy as np
+    from bot.snapshot import SnapshotReplay, datetime_to_us, us_to_datetime
+
+    replay = SnapshotReplay.load(args.snapshot)
+    print(f"比赛: {replay.meta.get('game_title')}（ID {replay.meta.get('game_id')}）")
+    first, last = replay.time_range
+    if first is None:
+        print("快照中没有有效得分记录。")
+        return
+    print(f"得分时间范围: {_fmt_time(first)} ~ {_fmt_time(last)}")
+
+    at = _parse_time(args.at) if args.at else None
+    board = replay.scoreboard_at(at, limit=args.top)
+    print(f"\n--- 排行榜（{_fmt_time(at) if at else '最终'}）---")
+    for row in board:
+        print(f"{row['rank']:>3}. {row['teamname']} -- {row['totalscore']}分")
+
+    if args.timeline:
+        started = time.perf_counter()
+        points = np.linspace(datetime_to_us(first), datetime_to_us(last), args.timeline).astype(np.int64)
+        scores, last_times = replay.score_timeline(points)
+        # 每个时间点的榜首：分数最高，同分时最后得分时间最早
+        leaders = np.lexsort((np.where(last_times < 0, np.iinfo(np.int64).max, last_times), -scores), axis=0)[0]
+        elapsed = time.perf_counter() - started
+        print(f"\n--- 榜首变化（{args.timeline} 个时间点，计算耗时 {elapsed:.3f}s）---")
+        previous = None
+        for idx, point in enumerate(points):
+            leader = int(leaders[idx])
+            if scores[leader, idx] <= 0 or leader == previous:
+                continue
+            previous = leader
+            print(f"{_fmt_time(us_to_datetime(point))}  {replay.team_names[leader]} -- {scores[leader, idx]}分")
+
+    if args.verify_notices:
+        result = replay.verify_blood_notices()
+        print("\n--- 血腥通知对账 ---")
+        print(f"缺失通知: {len(result['missing'])}，多余通知: {len(result['unexpected'])}")
+        for blood in result["missing"]:
+            print(f"  缺失: [{blood['challenge']}] 第{blood['place']}血 {blood['teamname']}")
+        for blood in result["unexpected"]:
+            print(f"  多余: [{blood['challenge']}] 第{blood['place']}血 {blood['teamname']}")
+
+
+def cmd_explain(args: argparse.Namespace) -> None:
+    from bot.diagnostics import run_diagnostics
+    from bot.utils import format_diagnostics_report
+
+    game_id = _default_game_id(args)
+    report = asyncio.run(run_diagnostics(game_id, args.dsn, args.slow_ms))
+    print(format_diagnostics_report(report))
+
+
+def cmd_report(args: argparse.Namespace) -> None:
+    from bot.config import REPORT_DIR
+    from bot.report import REPORT_FORMATS, generate_report
+
+    async def progress(stage: str, rows: int) -> None:
+        print(f"  {stage}: {rows}", file=sys.stderr)
+
+    game_id = _default_game_id(args)
+    formats = args.format or list(REPORT_FORMATS)
+    report = asyncio.run(generate_report(game_id, formats, args.output or REPORT_DIR, args.dsn, progress))
+    print(f"已生成比赛 {game_id} 的赛后报告（耗时 {report.seconds:.2f}s）")
+    for path in report.paths:
+        print(f"  {path}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="gzctf-bot 命令行工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="导出比赛快照（.npz）")
+    export.add_argument("--game-id", type=int, help="赛事ID，默认读取 TARGET_GAME_ID")
+    export.add_argument("-o", "--output", required=True, help="输出文件路径")
+    export.set_defaults(func=cmd_export)
+
+    replay = sub.add_parser("replay", help="离线回放比赛快照")
+    replay.add_argument("snapshot", help="快照文件路径")
+    replay.add_argument("--at", help="回放时间点（ISO 格式，默认北京时间）")
+    replay.add_argument("--top", type=int, default=10, help="显示前 N 名（默认 10）")
+    replay.add_argument("--timeline", type=int, default=0, help="按 N 个时间点计算榜首变化")
+    replay.add_argument("--verify-notices", action="store_true", help="对账前三血与赛事通知")
+    replay.set_defaults(func=cmd_replay)
+
+    explain = sub.add_parser("explain", help="诊断各查询的执行计划并给出索引建议")
+    explain.add_argument("--game-id", type=int, help="赛事ID，默认读取 TARGET_GAME_ID")
+    explain.add_argument("--dsn", help="数据库连接串，默认读取 POSTGRES_DSN")
+    explain.add_argument("--slow-ms", type=float, default=20.0, help="慢节点阈值，单位毫秒（默认 20）")
+    explain.set_defaults(func=cmd_explain)
+
+    report = sub.add_parser("report", help="生成赛后报告（Markdown / CSV / XLSX）")
+    report.add_argument("--game-id", type=int, help="赛事ID，默认读取 TARGET_GAME_ID")
+    report.add_argument("--dsn", help="数据库连接串，默认读取 POSTGRES_DSN")
+    report.add_argument("-o", "--output", help="输出目录，默认读取 REPORT_DIR")
+    report.add_argument("--format", nargs="+", choices=["md", "csv", "xlsx"], help="输出格式，默认全部生成")
+    report.set_defaults(func=cmd_report)
+
+    return parser
+
+
+if __name__ == "__main__":
+    parsed_args = build_parser().parse_args()
+    _init_bot()
+    parsed_args.func(parsed_args)
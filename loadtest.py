@@ -0,0 +1,457 @@
+"""
+压力测试工具
+模拟 OneBot v11 实现端（反向 WebSocket）连接到机器人，按配置的比例向多个群注入
+/rank、/rank-XX、/gc、/help 消息，统计回复延迟、吞吐量与丢失的回复。
+配合 seed 子命令生成的合成比赛数据，可以完全离线地在本地 PostgreSQL 上运行。
+run 子命令需要 websockets（pip install websockets，已列入 requirements.txt）。
+
+用法示例：
+    python loadtest.py seed --dsn postgresql://postgres@localhost:5432/loadtest
+    python app.py    # 另一个终端，ALLOWED_GROUP_IDS 留空或包含压测群号
+    python loadtest.py run --sessions 50 --duration 60 --mix rank=5,rank-XX=3,gc=2,help=1
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+# ==================== 合成数据 ====================
+
+SEED_SCHEMA_SQL = """
+CREATE TABLE "Games" ("Id" serial PRIMARY KEY, "Title" text NOT NULL, "StartTimeUtc" timestamptz, "EndTimeUtc" timestamptz);
+CREATE TABLE "GameChallenges" (
+    "Id" serial PRIMARY KEY, "Title" text NOT NULL, "Category" integer NOT NULL,
+    "OriginalScore" integer NOT NULL, "IsEnabled" boolean NOT NULL, "GameId" integer NOT NULL
+);
+CREATE TABLE "Teams" ("Id" serial PRIMARY KEY, "Name" text NOT NULL);
+CREATE TABLE "Participations" ("Id" serial PRIMARY KEY, "TeamId" integer NOT NULL, "GameId" integer NOT NULL, "Status" integer NOT NULL);
+CREATE TABLE "AspNetUsers" ("Id" uuid PRIMARY KEY, "UserName" text, "StdNumber" text);
+CREATE TABLE "UserParticipations" ("UserId" uuid NOT NULL, "ParticipationId" integer NOT NULL, "GameId" integer NOT NULL, "TeamId" integer NOT NULL);
+CREATE TABLE "Submissions" (
+    "Id" serial PRIMARY KEY, "ParticipationId" integer NOT NULL, "TeamId" integer NOT NULL, "UserId" uuid,
+    "GameId" integer NOT NULL, "ChallengeId" integer NOT NULL, "Status" text NOT NULL,
+    "SubmitTimeUtc" timestamptz NOT NULL, "Answer" text
+);
+CREATE TABLE "GameNotices" ("Id" serial PRIMARY KEY, "Type" integer NOT NULL, "Values" text, "PublishTimeUtc" timestamptz NOT NULL, "GameId" integer NOT NULL);
+"""
+
+SEED_DROP_SQL = """
+DROP TABLE IF EXISTS "Games", "GameChallenges", "Teams", "Participations", "UserParticipations",
+    "AspNetUsers", "Submissions", "GameNotices", "LoadTestSeed" CASCADE;
+"""
+
+# seed 生成的表及其行数记录在 LoadTestSeed 中；--reset 只在这些表的行数与记录一致时才删除，
+# 以免误删真实的 GZCTF 数据（GZCTF 自身不会创建 LoadTestSeed）
+SEED_TABLES = ("Games", "GameChallenges", "Teams", "Participations", "UserParticipations",
+               "AspNetUsers", "Submissions", "GameNotices")
+
+SEED_MARKER_SQL = """
+CREATE TABLE "LoadTestSeed" ("Table" text PRIMARY KEY, "Rows" bigint NOT NULL);
+"""
+
+# GZCTF 部署中通常存在的索引（可用 --no-indexes 观察缺少索引时的表现）
+SEED_INDEX_SQL = """
+CREATE INDEX ON "Submissions" ("GameId", "Status");
+CREATE INDEX ON "Participations" ("TeamId", "GameId");
+CREATE INDEX ON "UserParticipations" ("ParticipationId");
+CREATE INDEX ON "GameNotices" ("GameId");
+"""
+
+# 所有数量均为整数参数，直接格式化进 SQL；比赛从 {hours} 小时前开始，持续 2 * {hours} 小时
+SEED_DATA_SQL = """
+INSERT INTO "Games" ("Title", "StartTimeUtc", "EndTimeUtc")
+VALUES ('LoadTest CTF', now() - interval '{hours} hours', now() + interval '{hours} hours');
+
+INSERT INTO "GameChallenges" ("Title", "Category", "OriginalScore", "IsEnabled", "GameId")
+SELECT 'chal-' || g, g % 13, 100 * (g % 5 + 1), true, 1 FROM generate_series(1, {challenges}) g;
+
+INSERT INTO "Teams" ("Name") SELECT 'team-' || g FROM generate_series(1, {teams}) g;
+
+INSERT INTO "Participations" ("TeamId", "GameId", "Status") SELECT g, 1, 1 FROM generate_series(1, {teams}) g;
+
+-- 学号前两位在 22~25 之间，对应 /rank-22 ~ /rank-25
+INSERT INTO "AspNetUsers" ("Id", "UserName", "StdNumber")
+SELECT md5('user-' || g)::uuid, 'user-' || g, (22 + g % 4)::text || lpad(g::text, 8, '0')
+FROM generate_series(1, {teams} * {members}) g;
+
+INSERT INTO "UserParticipations" ("UserId", "ParticipationId", "GameId", "TeamId")
+SELECT md5('user-' || g)::uuid, (g - 1) / {members} + 1, 1, (g - 1) / {members} + 1
+FROM generate_series(1, {teams} * {members}) g;
+
+INSERT INTO "Submissions" ("ParticipationId", "TeamId", "UserId", "GameId", "ChallengeId", "Status", "SubmitTimeUtc", "Answer")
+SELECT t, t, md5('user-' || ((t - 1) * {members} + 1))::uuid, 1, 1 + floor(random() * {challenges})::int,
+       CASE WHEN random() < {accept_rate} THEN 'Accepted' ELSE 'WrongAnswer' END,
+       now() - interval '{hours} hours' + interval '{hours} hours' * (g::float8 / {submissions}),
+       'flag{{loadtest}}'
+FROM (SELECT g, 1 + floor(random() * {teams})::int AS t FROM generate_series(1, {submissions}) g) x
+ORDER BY g;
+
+-- 每题按首次通过顺序的前三支队伍生成一血/二血/三血通知
+INSERT INTO "GameNotices" ("Type", "Values", "PublishTimeUtc", "GameId")
+SELECT place, json_build_array(team, challenge)::text, first_time, 1
+FROM (
+    SELECT t."Name" AS team, gc."Title" AS challenge, f.first_time,
+           ROW_NUMBER() OVER (PARTITION BY f."ChallengeId" ORDER BY f.first_time) AS place
+    FROM (
+        SELECT "TeamId", "ChallengeId", MIN("SubmitTimeUtc") AS first_time
+        FROM "Submissions" WHERE "Status" = 'Accepted' GROUP BY "TeamId", "ChallengeId"
+    ) f
+    JOIN "Teams" t ON t."Id" = f."TeamId"
+    JOIN "GameChallenges" gc ON gc."Id" = f."ChallengeId"
+) bloods
+WHERE place <= 3
+ORDER BY first_time;
+
+INSERT INTO "GameNotices" ("Type", "Values", "PublishTimeUtc", "GameId")
+VALUES (0, '["压力测试比赛开始"]', now() - interval '{hours} hours', 1);
+"""
+
+
+async def _count_rows(conn) -> Dict[str, int]:
+    counts = {}
+    for table in SEED_TABLES:
+        counts[table] = await conn.fetchval(f'SELECT count(*) FROM "{table}"')
+    return counts
+
+
+async def _check_scratch(conn) -> Optional[str]:
+    """确认已存在的表只包含 seed 生成的数据；不能确认时返回原因"""
+    if not await conn.fetchval("SELECT to_regclass('\"LoadTestSeed\"') IS NOT NULL"):
+        return "数据库中没有 LoadTestSeed 记录表，这些表不是由 loadtest.py seed 生成的"
+    recorded = {row["Table"]: row["Rows"] for row in await conn.fetch('SELECT "Table", "Rows" FROM "LoadTestSeed"')}
+    for table in SEED_TABLES:
+        if table not in recorded:
+            return f"LoadTestSeed 中没有 {table} 的记录"
+        if not await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", f'"{table}"'):
+            continue
+        rows = await conn.fetchval(f'SELECT count(*) FROM "{table}"')
+        if rows != recorded[table]:
+            return f"{table} 当前有 {rows} 行，与 seed 时记录的 {recorded[table]} 行不一致"
+    return None
+
+
+async def _seed(args: argparse.Namespace) -> Dict[str, int]:
+    import asyncpg
+
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        exists = await conn.fetchval("SELECT to_regclass('\"Games\"') IS NOT NULL")
+        if exists:
+            if not args.reset:
+                sys.exit("数据库中已存在 Games 等表，如需覆盖由 seed 生成的数据请加 --reset --i-know（会删除这些表）。")
+            if not args.i_know:
+                sys.exit("--reset 会删除 Games 等表，请确认目标是压测用的临时数据库后同时加上 --i-know。")
+            reason = await _check_scratch(conn)
+            if reason:
+                sys.exit(f"拒绝删除：{reason}。请换用新的空数据库。")
+        async with conn.transaction():
+            await conn.execute(SEED_DROP_SQL)
+            await conn.execute(SEED_SCHEMA_SQL)
+            await conn.execute(
+                SEED_DATA_SQL.format(
+                    teams=args.teams,
+                    members=args.members,
+                    challenges=args.challenges,
+                    submissions=args.submissions,
+                    accept_rate=args.accept_rate,
+                    hours=args.hours,
+                )
+            )
+            if not args.no_indexes:
+                await conn.execute(SEED_INDEX_SQL)
+            counts = await _count_rows(conn)
+            await conn.execute(SEED_MARKER_SQL)
+            await conn.executemany('INSERT INTO "LoadTestSeed" ("Table", "Rows") VALUES ($1, $2)', counts.items())
+        await conn.execute("ANALYZE")
+        return {table: counts[table] for table in ("Teams", "AspNetUsers", "GameChallenges", "Submissions", "GameNotices")}
+    finally:
+        await conn.close()
+
+
+def cmd_seed(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    counts = asyncio.run(_seed(args))
+    print(f"已生成合成比赛数据（赛事ID 1，耗时 {time.perf_counter() - started:.2f}s）")
+    for table, count in counts.items():
+        print(f"  {table}: {count}")
+    print("运行机器人时请设置 TARGET_GAME_ID=1。")
+
+
+# ==================== 模拟 OneBot 客户端 ====================
+
+
+@dataclass
+class _Pending:
+    command: str
+    sent_at: float
+    future: asyncio.Future  # 第一条回复到达的时间
+    last_reply_at: float = 0.0
+
+
+@dataclass
+class LoadStats:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    sent: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    dropped: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # 同一条命令的第二条及之后的回复（分段发送的长回复、多个处理器各自回复）
+    extra_replies: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    late_replies: int = 0
+    unexpected_replies: int = 0
+    api_calls: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+
+class FakeOneBot:
+    """反向 WebSocket 模式的 OneBot v11 实现端
+
+    每个会话独占一个群号并且同一时刻只有一条未完成的命令。发送命令时为该群打开回复窗口，
+    窗口内的第一条回复决定延迟，之后的回复记为该命令的多余回复；回复停止 --settle 秒后
+    或命令超时（记为丢失）时关闭窗口，窗口关闭后才到达的回复记为迟到回复，不会算到下一条命令上。
+    """
+
+    def __init__(self, url: str, self_id: int, access_token: Optional[str], stats: LoadStats):
+        self.url = url
+        self.self_id = self_id
+        self.access_token = access_token
+        self.stats = stats
+        self._ws = None
+        # 群号 -> 当前打开回复窗口的命令
+        self._pending: Dict[int, _Pending] = {}
+        self._groups: Set[int] = set()
+        self._message_ids = itertools.count(1)
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        import websockets
+
+        headers = {"X-Self-ID": str(self.self_id), "X-Client-Role": "Universal"}
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        try:
+            self._ws = await websockets.connect(self.url, additional_headers=headers, max_size=None)
+        except TypeError:
+            # websockets < 14
+            self._ws = await websockets.connect(self.url, extra_headers=headers, max_size=None)
+        await self._ws.send(json.dumps(self._meta_event("lifecycle", sub_type="connect")))
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def close(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+        if self._ws:
+            await self._ws.close()
+
+    def _meta_event(self, meta_event_type: str, **extra) -> dict:
+        return {
+            "time": int(time.time()),
+            "self_id": self.self_id,
+            "post_type": "meta_event",
+            "meta_event_type": meta_event_type,
+            **extra,
+        }
+
+    async def _read_loop(self) -> None:
+        async for raw in self._ws:
+            request = json.loads(raw)
+            action = request.get("action", "")
+            params = request.get("params") or {}
+            self.stats.api_calls[action] += 1
+            data = {"message_id": next(self._message_ids)} if action.startswith("send_") else {}
+            await self._ws.send(json.dumps({"status": "ok", "retcode": 0, "data": data, "echo": request.get("echo")}))
+
+            group_id = params.get("group_id")
+            if group_id is None:
+                continue
+            pending = self._pending.get(int(group_id))
+            if pending is None:
+                if int(group_id) in self._groups:
+                    self.stats.late_replies += 1
+                else:
+                    self.stats.unexpected_replies += 1
+                continue
+            pending.last_reply_at = time.perf_counter()
+            if pending.future.done():
+                self.stats.extra_replies[pending.command] += 1
+            else:
+                pending.future.set_result(pending.last_reply_at)
+
+    async def send_group_message(self, group_id: int, user_id: int, text: str, command: str) -> _Pending:
+        pending = _Pending(command, time.perf_counter(), asyncio.get_running_loop().create_future())
+        # 打开新窗口即关闭该群上一条命令的窗口
+        self._pending[group_id] = pending
+        self._groups.add(group_id)
+        event = {
+            "time": int(time.time()),
+            "self_id": self.self_id,
+            "post_type": "message",
+            "message_type": "group",
+            "sub_type": "normal",
+            "message_id": next(self._message_ids),
+            "group_id": group_id,
+            "user_id": user_id,
+            "anonymous": None,
+            "message": [{"type": "text", "data": {"text": text}}],
+            "raw_message": text,
+            "font": 0,
+            "sender": {"user_id": user_id, "nickname": f"user{user_id}", "card": "", "role": "member"},
+        }
+        await self._ws.send(json.dumps(event, ensure_ascii=False))
+        return pending
+
+    def close_window(self, group_id: int, pending: _Pending) -> None:
+        if self._pending.get(group_id) is pending:
+            del self._pending[group_id]
+
+
+def _parse_mix(value: str) -> List[Tuple[str, float]]:
+    """解析命令比例，例如 rank=5,rank-XX=3,gc=2,help=1"""
+    mix = []
+    for part in value.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in ("rank", "rank-XX", "gc", "help"):
+            raise argparse.ArgumentTypeError(f"未知命令: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def _command_text(command: str, prefixes: List[str]) -> str:
+    if command == "rank-XX":
+        return f"/rank-{random.choice(prefixes)}"
+    return f"/{command}"
+
+
+async def _session(client: FakeOneBot, group_id: int, args: argparse.Namespace, deadline: float) -> None:
+    names = [name for name, _ in args.mix]
+    weights = [weight for _, weight in args.mix]
+    while time.perf_counter() < deadline:
+        command = random.choices(names, weights)[0]
+        user_id = random.randint(10000, 10000 + args.users - 1)
+        pending = await client.send_group_message(group_id, user_id, _command_text(command, args.prefixes), command)
+        client.stats.sent[command] += 1
+        try:
+            replied_at = await asyncio.wait_for(asyncio.shield(pending.future), args.timeout)
+            client.stats.latencies[command].append(replied_at - pending.sent_at)
+            # 等待分段发送的后续回复，直到安静 settle 秒
+            while True:
+                quiet = pending.last_reply_at + args.settle - time.perf_counter()
+                if quiet <= 0:
+                    break
+                await asyncio.sleep(quiet)
+        except asyncio.TimeoutError:
+            client.stats.dropped[command] += 1
+        finally:
+            client.close_window(group_id, pending)
+        if args.think:
+            await asyncio.sleep(random.uniform(0, 2 * args.think))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _print_report(stats: LoadStats, elapsed: float) -> None:
+    total_sent = sum(stats.sent.values())
+    total_replied = sum(len(v) for v in stats.latencies.values())
+    total_dropped = sum(stats.dropped.values())
+    print(f"\n--- 压测结果（{elapsed:.1f}s）---")
+    print(f"发送 {total_sent}，回复 {total_replied}，丢失 {total_dropped}，多余回复 {sum(stats.extra_replies.values())}，"
+          f"迟到回复 {stats.late_replies}，无法对应的回复 {stats.unexpected_replies}")
+    print(f"吞吐量 {total_replied / elapsed:.1f} 条/秒")
+    print(f"\n{'命令':<10}{'发送':>8}{'回复':>8}{'丢失':>8}{'多余':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'最大':>10}{'平均':>10}")
+    for command in sorted(stats.sent):
+        latencies = stats.latencies.get(command) or []
+        if latencies:
+            ms = [_percentile(latencies, q) * 1000 for q in (0.5, 0.9, 0.99)] + [max(latencies) * 1000, statistics.mean(latencies) * 1000]
+            cells = "".join(f"{value:>8.1f}ms" for value in ms)
+        else:
+            cells = "".join(f"{'-':>10}" for _ in range(5))
+        print(f"{command:<10}{stats.sent[command]:>8}{len(latencies):>8}{stats.dropped.get(command, 0):>8}{stats.extra_replies.get(command, 0):>8}{cells}")
+    if stats.api_calls:
+        print("\n调用的 API: " + ", ".join(f"{name}={count}" for name, count in sorted(stats.api_calls.items())))
+
+
+async def _run(args: argparse.Namespace) -> None:
+    allowed = os.getenv("ALLOWED_GROUP_IDS", "").strip()
+    groups = [args.group_base + i for i in range(args.sessions)]
+    if allowed:
+        allowed_ids = {int(x) for x in allowed.split(",") if x.strip()}
+        if not set(groups) <= allowed_ids:
+            print(f"警告：ALLOWED_GROUP_IDS 不包含压测群号 {groups[0]}~{groups[-1]}，机器人会静默忽略这些消息。")
+
+    stats = LoadStats()
+    client = FakeOneBot(args.url, args.self_id, args.access_token, stats)
+    await client.connect()
+    # 等待机器人完成连接注册
+    await asyncio.sleep(args.warmup)
+
+    print(f"开始压测：{args.sessions} 个会话，持续 {args.duration}s，比例 "
+          + ", ".join(f"{name}={weight:g}" for name, weight in args.mix))
+    started = time.perf_counter()
+    deadline = started + args.duration
+    try:
+        await asyncio.gather(*(_session(client, group, args, deadline) for group in groups))
+    finally:
+        elapsed = time.perf_counter() - started
+        await client.close()
+    _print_report(stats, elapsed)
+
+
+def cmd_run(args: argparse.Namespace) -> None:
+    args.prefixes = [p.strip() for p in args.prefixes.split(",") if p.strip()]
+    asyncio.run(_run(args))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="gzctf-bot 压力测试工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed = sub.add_parser("seed", help="生成合成比赛数据（赛事ID 1）")
+    seed.add_argument("--dsn", required=True, help="压测用数据库的连接串（必填，不读取 POSTGRES_DSN，以免写入生产库）")
+    seed.add_argument("--reset", action="store_true", help="删除之前由 seed 生成的表后重建（需同时加 --i-know）")
+    seed.add_argument("--i-know", action="store_true", help="确认 --dsn 指向压测用的临时数据库")
+    seed.add_argument("--teams", type=int, default=500, help="队伍数（默认 500）")
+    seed.add_argument("--members", type=int, default=3, help="每队人数（默认 3）")
+    seed.add_argument("--challenges", type=int, default=40, help="题目数（默认 40）")
+    seed.add_argument("--submissions", type=int, default=200000, help="提交数（默认 200000）")
+    seed.add_argument("--accept-rate", type=float, default=0.2, help="提交通过比例（默认 0.2）")
+    seed.add_argument("--hours", type=int, default=4, help="比赛已进行的小时数（默认 4）")
+    seed.add_argument("--no-indexes", action="store_true", help="不创建常见索引")
+    seed.set_defaults(func=cmd_seed)
+
+    run = sub.add_parser("run", help="模拟 OneBot 客户端发送群消息")
+    port = os.getenv("NB_PORT", "8080")
+    run.add_argument("--url", default=f"ws://127.0.0.1:{port}/onebot/v11/ws/", help="机器人的反向 WebSocket 地址")
+    run.add_argument("--self-id", type=int, default=10001, help="模拟的机器人QQ号")
+    run.add_argument("--access-token", default=os.getenv("ONEBOT_ACCESS_TOKEN"), help="OneBot access token")
+    run.add_argument("--sessions", type=int, default=20, help="并发会话数，每个会话使用一个群（默认 20）")
+    run.add_argument("--group-base", type=int, default=900000, help="压测群号起始值（默认 900000）")
+    run.add_argument("--users", type=int, default=1000, help="模拟的发言用户数（默认 1000）")
+    run.add_argument("--duration", type=float, default=30, help="压测时长，单位秒（默认 30）")
+    run.add_argument("--think", type=float, default=0.0, help="每个会话两次命令之间的平均间隔，单位秒（默认 0）")
+    run.add_argument("--timeout", type=float, default=10.0, help="回复超时，超时记为丢失（默认 10）")
+    run.add_argument("--settle", type=float, default=0.3,
+                     help="收到第一条回复后，回复停止多少秒才认为该命令结束（默认 0.3）")
+    run.add_argument("--warmup", type=float, default=1.0, help="连接后等待机器人就绪的秒数（默认 1）")
+    run.add_argument("--mix", type=_parse_mix, default=_parse_mix("rank=5,rank-XX=3,gc=2,help=1"),
+                     help="命令比例（默认 rank=5,rank-XX=3,gc=2,help=1）")
+    run.add_argument("--prefixes", default="22,23,24,25", help="/rank-XX 使用的学号前缀（默认 22,23,24,25）")
+    run.set_defaults(func=cmd_run)
+
+    return parser
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # 在解析参数前加载 .env，使默认值可以读取其中的配置
+    parsed_args = build_parser().parse_args()
+    parsed_args.func(parsed_args)